@@ -0,0 +1,108 @@
+"""
+Measure the per-call overhead of the hot service queries with and
+without the engine's compiled statement cache.
+
+Device lookups are run as the CoAP server does for every reading, and
+a device's recent readings are fetched as the API does. The database
+is small, so the time per call is dominated by building, compiling and
+executing the statement rather than by the work the database does.
+
+    python benchmarks/query_cache.py --calls 5000
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict
+
+from sense_web.db.session import QUERY_CACHE_SIZE, sessionmanager
+from sense_web.services.datapoint import (
+    create_datapoints_bulk,
+    get_datapoints_by_device_uuid,
+)
+from sense_web.services.device import (
+    get_device_by_imei,
+    get_device_by_uuid,
+    register_device,
+)
+
+START = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+
+log = logging.getLogger("benchmark")
+log.setLevel(logging.INFO)
+
+
+async def _time(fn: Callable[[], Awaitable[object]], calls: int) -> float:
+    await fn()
+    began = time.perf_counter()
+    for _ in range(calls):
+        await fn()
+    return (time.perf_counter() - began) / calls * 1e6
+
+
+async def bench(
+    db_uri: str, query_cache_size: int, calls: int
+) -> Dict[str, float]:
+    await sessionmanager.init(db_uri, query_cache_size=query_cache_size)
+
+    imei = "123456789012345"
+    device = await get_device_by_imei(imei) or await register_device(
+        imei, "bench"
+    )
+    if not await get_datapoints_by_device_uuid(device.uuid):
+        await create_datapoints_bulk(
+            device.uuid,
+            [
+                (
+                    START + datetime.timedelta(seconds=i),
+                    "temp",
+                    None,
+                    float(i),
+                    None,
+                    "C",
+                )
+                for i in range(100)
+            ],
+        )
+    end = START + datetime.timedelta(seconds=100)
+
+    timings = {
+        "get_device_by_uuid": await _time(
+            lambda: get_device_by_uuid(device.uuid), calls
+        ),
+        "get_device_by_imei": await _time(
+            lambda: get_device_by_imei(imei), calls
+        ),
+        "get_datapoints_by_device_uuid": await _time(
+            lambda: get_datapoints_by_device_uuid(
+                device.uuid,
+                sensor="temp",
+                start=end - datetime.timedelta(seconds=10),
+            ),
+            calls,
+        ),
+    }
+
+    await sessionmanager.close()
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_uri = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+        for label, size in (("no cache", 0), ("cached", QUERY_CACHE_SIZE)):
+            timings = asyncio.run(bench(db_uri, size, args.calls))
+            for name, micros in timings.items():
+                log.info(f"{label:>8}: {name:<30} {micros:8.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Compare ingest and query throughput on a SQLite database with and
+without the session manager's SQLite profile.
+
+A writer process inserts readings one at a time, as the CoAP server
+does, while reader processes fetch a device's recent readings, as the
+API does. Each run uses a fresh database file.
+
+    python benchmarks/sqlite_profile.py --seconds 10 --readers 2
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, Tuple
+
+from sqlalchemy.exc import OperationalError
+
+from sense_web.db.session import sessionmanager
+from sense_web.services.datapoint import (
+    create_datapoint,
+    get_datapoints_by_device_uuid,
+)
+from sense_web.services.device import register_device
+
+log = logging.getLogger("benchmark")
+log.setLevel(logging.INFO)
+
+
+async def _write(
+    db_uri: str, profile: bool, device: uuid.UUID, seconds: float
+) -> Dict[str, int]:
+    await sessionmanager.init(db_uri, sqlite_profile=profile)
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            await create_datapoint(
+                device_uuid=device,
+                timestamp=datetime.datetime.now(datetime.UTC),
+                sensor="temp",
+                val_float=float(done),
+                val_units="C",
+            )
+            done += 1
+        except OperationalError:
+            errors += 1
+    await sessionmanager.close()
+    return {"writes": done, "write_errors": errors}
+
+
+async def _read(
+    db_uri: str, profile: bool, device: uuid.UUID, seconds: float
+) -> Dict[str, int]:
+    await sessionmanager.init(db_uri, sqlite_profile=profile)
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = datetime.datetime.now(datetime.UTC) - datetime.timedelta(
+            seconds=5
+        )
+        try:
+            await get_datapoints_by_device_uuid(device, start=start)
+            done += 1
+        except OperationalError:
+            errors += 1
+    await sessionmanager.close()
+    return {"reads": done, "read_errors": errors}
+
+
+def _run(target: Any, args: Tuple[Any, ...], results: Any) -> None:
+    results.put(asyncio.run(target(*args)))
+
+
+async def _setup(db_uri: str, profile: bool) -> uuid.UUID:
+    await sessionmanager.init(db_uri, sqlite_profile=profile)
+    async with sessionmanager.connect() as connection:
+        await sessionmanager.create_all(connection)
+    device = await register_device("123456789012345", "bench")
+    await sessionmanager.close()
+    return device.uuid
+
+
+def bench(profile: bool, seconds: float, readers: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        db_uri = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+        device = asyncio.run(_setup(db_uri, profile))
+
+        results: Any = multiprocessing.Queue()
+        args = (db_uri, profile, device, seconds)
+        processes = [
+            multiprocessing.Process(target=_run, args=(_write, args, results))
+        ] + [
+            multiprocessing.Process(target=_run, args=(_read, args, results))
+            for _ in range(readers)
+        ]
+        for process in processes:
+            process.start()
+
+        totals: Dict[str, float] = {}
+        for _ in processes:
+            for key, value in results.get().items():
+                totals[key] = totals.get(key, 0) + value
+        for process in processes:
+            process.join()
+
+    return {key: value / seconds for key, value in totals.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--readers", type=int, default=2)
+    args = parser.parse_args()
+
+    for profile in (False, True):
+        rates = bench(profile, args.seconds, args.readers)
+        label = "profile" if profile else "default"
+        log.info(
+            f"{label:>8}: "
+            + ", ".join(f"{k} {v:,.0f}/s" for k, v in sorted(rates.items()))
+        )
+
+
+if __name__ == "__main__":
+    main()
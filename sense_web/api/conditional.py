@@ -0,0 +1,48 @@
+import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict
+
+
+def validators(version: int, modified: datetime.datetime) -> Dict[str, str]:
+    """
+    Return the `ETag` and `Last-Modified` headers for a resource at
+    `version`, last changed at `modified`.
+    """
+    return {
+        "ETag": f'W/"{version}"',
+        "Last-Modified": format_datetime(
+            modified.astimezone(datetime.timezone.utc), usegmt=True
+        ),
+    }
+
+
+def not_modified(
+    if_none_match: str | None,
+    if_modified_since: str | None,
+    etag: str,
+    modified: datetime.datetime,
+) -> bool:
+    """
+    Return whether a `GET` with the given conditional headers should be
+    answered with `304 Not Modified`.
+
+    `If-None-Match` is compared weakly and takes precedence over
+    `If-Modified-Since`, which is ignored when it cannot be parsed.
+    """
+    if if_none_match is not None:
+        tags = [
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        ]
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        # HTTP dates have a resolution of one second
+        return modified.replace(microsecond=0) <= since
+
+    return False
@@ -0,0 +1,29 @@
+from typing import Annotated, AsyncIterator
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sense_web.db.session import sessionmanager
+
+
+async def read_session() -> AsyncIterator[AsyncSession]:
+    """
+    Yield one read-only session for the whole request. Pass it to every
+    service the route calls, so the request checks out a single pooled
+    connection.
+    """
+    async with sessionmanager.session(readonly=True) as session:
+        yield session
+
+
+async def write_session() -> AsyncIterator[AsyncSession]:
+    """
+    Yield one session for a request that writes. Services commit their
+    own changes to it.
+    """
+    async with sessionmanager.session() as session:
+        yield session
+
+
+ReadSession = Annotated[AsyncSession, Depends(read_session)]
+WriteSession = Annotated[AsyncSession, Depends(write_session)]
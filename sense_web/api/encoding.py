@@ -0,0 +1,119 @@
+from typing import Any, AsyncIterator, Dict, List, Sequence
+import math
+
+import cbor2
+
+from sense_web.dto.datapoint import DATAPOINT_LIST, DataPointDTO
+from sense_web.dto.series import SeriesDTO
+
+JSON_MEDIA_TYPE = "application/json"
+SERIES_JSON_MEDIA_TYPE = "application/vnd.sense.series+json"
+CBOR_MEDIA_TYPE = "application/cbor"
+
+# RFC 8746 typed array tags (little-endian)
+CBOR_TAG_SINT64_LE = 79
+CBOR_TAG_FLOAT64_LE = 86
+
+
+def negotiate(accept: str | None, offers: Sequence[str]) -> str:
+    """
+    Pick the best media type from `offers` for an `Accept` header.
+
+    Supports quality values and the `*/*` and `type/*` wildcards. The
+    first offer is returned when the header is missing or nothing
+    matches, so plain clients keep getting the default representation.
+    """
+    if not accept:
+        return offers[0]
+
+    best = offers[0]
+    best_q = 0.0
+
+    for item in accept.split(","):
+        media_type, *params = [p.strip() for p in item.split(";")]
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        for offer in offers:
+            if media_type == "*/*":
+                matches = True
+            elif media_type.endswith("/*"):
+                matches = offer.startswith(media_type[:-1])
+            else:
+                matches = media_type == offer
+
+            if matches and q > best_q:
+                best, best_q = offer, q
+                break
+
+    return best
+
+
+def encode_series_cbor(series: List[SeriesDTO]) -> bytes:
+    """
+    Encode series as CBOR, using RFC 8746 typed arrays for the
+    timestamp (int64, epoch microseconds) and value (float64) columns.
+    """
+    payload = []
+    for s in series:
+        item: Dict[str, Any] = {
+            "sensor": s.sensor,
+            "units": s.val_units,
+            "t": cbor2.CBORTag(
+                CBOR_TAG_SINT64_LE, SeriesDTO.le_bytes(s.timestamps)
+            ),
+            "v": cbor2.CBORTag(
+                CBOR_TAG_FLOAT64_LE, SeriesDTO.le_bytes(s.values)
+            ),
+        }
+        if s.strings is not None:
+            item["s"] = s.strings
+        payload.append(item)
+
+    return cbor2.dumps({"series": payload})
+
+
+def encode_series_json(series: List[SeriesDTO]) -> Dict[str, Any]:
+    """
+    Encode series as JSON-compatible parallel arrays. NaN is not valid
+    JSON, so missing numeric values are emitted as `null`.
+    """
+    payload = []
+    for s in series:
+        item: Dict[str, Any] = {
+            "sensor": s.sensor,
+            "units": s.val_units,
+            "t": s.timestamps.tolist(),
+            "v": [None if math.isnan(v) else v for v in s.values],
+        }
+        if s.strings is not None:
+            item["s"] = s.strings
+        payload.append(item)
+
+    return {"series": payload}
+
+
+async def encode_datapoints_json(
+    batches: AsyncIterator[List[DataPointDTO]],
+) -> AsyncIterator[bytes]:
+    """
+    Encode batches of datapoints as the chunks of one JSON array, so a
+    long listing can be streamed without holding all of it.
+    """
+    yield b"["
+    first = True
+    async for batch in batches:
+        if not batch:
+            continue
+        # Each batch is dumped as an array and spliced in without its
+        # brackets
+        items = DATAPOINT_LIST.dump_json(batch)[1:-1]
+        yield items if first else b"," + items
+        first = False
+    yield b"]"
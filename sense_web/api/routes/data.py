@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from typing import List, Literal
+from uuid import UUID
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+
+from sense_web.api.dependencies import ReadSession
+from sense_web.dto.aggregate import FleetAggregateDTO
+from sense_web.dto.datapoint import DataPointDTO
+from sense_web.services.datapoint import DataCursor, get_datapoints_by_sensor
+from sense_web.services.rollup import ROLLUP_RESOLUTIONS, get_fleet_aggregates
+
+router = APIRouter()
+
+# Largest number of devices that can be named in one query
+MAX_DEVICES = 1000
+
+# Longest time range readings can be read over in one request
+MAX_DATA_SPAN = timedelta(days=31)
+
+DATA_PAGE_SIZE = 1000
+MAX_DATA_PAGE_SIZE = 10000
+
+
+def parse_cursor(after: str) -> DataCursor:
+    """
+    Parse a `device_uuid,timestamp,uuid` paging cursor.
+    """
+    try:
+        device_uuid, timestamp, datapoint_uuid = after.split(",")
+        return (
+            UUID(device_uuid),
+            datetime.fromisoformat(timestamp),
+            UUID(datapoint_uuid),
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor: {after}",
+        ) from e
+
+
+def format_cursor(dp: DataPointDTO) -> str:
+    return f"{dp.device_uuid},{dp.timestamp.isoformat()},{dp.uuid}"
+
+
+@router.get(
+    "/data",
+    response_model=list[DataPointDTO] | list[FleetAggregateDTO],
+    status_code=status.HTTP_200_OK,
+)
+async def data_get(
+    request: Request,
+    response: Response,
+    sensor: str,
+    session: ReadSession,
+    start: datetime,
+    end: datetime,
+    devices: List[UUID] | None = Query(
+        None, description="Only include these devices; repeat for each"
+    ),
+    resolution: int | None = Query(
+        None,
+        ge=ROLLUP_RESOLUTIONS[0],
+        multiple_of=ROLLUP_RESOLUTIONS[0],
+        description="Aggregate into buckets of this many seconds",
+    ),
+    group_by: Literal["device"] | None = Query(
+        None, description="Aggregate each device separately"
+    ),
+    limit: int = Query(DATA_PAGE_SIZE, ge=1, le=MAX_DATA_PAGE_SIZE),
+    after: str | None = Query(
+        None, description="Return readings after this cursor"
+    ),
+) -> list[DataPointDTO] | list[FleetAggregateDTO]:
+    """
+    Read one sensor across many devices, or every device, in a single
+    query instead of one per device.
+
+    Without `resolution` the readings are returned ordered by device
+    and time, a page at a time over at most `MAX_DATA_SPAN`. When a
+    page is full the `Link` header gives the URL of the next one. With
+    `resolution` they are aggregated into buckets, combined across
+    devices unless grouped by device.
+    """
+    if devices is not None and len(devices) > MAX_DEVICES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_DEVICES} devices can be queried at once",
+        )
+
+    if resolution is None:
+        if group_by is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="group_by needs a resolution to aggregate at",
+            )
+        if end - start > MAX_DATA_SPAN:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {MAX_DATA_SPAN.days} days of readings "
+                "can be read at once",
+            )
+        datapoints = await get_datapoints_by_sensor(
+            sensor,
+            start,
+            end,
+            devices,
+            session,
+            after=parse_cursor(after) if after is not None else None,
+            limit=limit,
+        )
+        if len(datapoints) == limit:
+            next_page = request.url.include_query_params(
+                after=format_cursor(datapoints[-1])
+            )
+            response.headers["Link"] = f'<{next_page}>; rel="next"'
+        return datapoints
+
+    return await get_fleet_aggregates(
+        sensor,
+        resolution,
+        start,
+        end,
+        devices,
+        by_device=group_by == "device",
+        session=session,
+    )
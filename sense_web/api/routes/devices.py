@@ -1,22 +1,55 @@
-from enum import IntEnum
+import csv
+import io
+from datetime import UTC, datetime
 from uuid import UUID
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, ConfigDict, Field
-from typing import List
-
-from sense_web.exceptions import DeviceAlreadyExists
+from fastapi import (
+    APIRouter,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+from typing import List, Literal
+
+from sense_web.api.conditional import not_modified, validators
+from sense_web.api.encoding import (
+    JSON_MEDIA_TYPE,
+    SERIES_JSON_MEDIA_TYPE,
+    CBOR_MEDIA_TYPE,
+    negotiate,
+    encode_series_cbor,
+    encode_series_json,
+    encode_datapoints_json,
+)
+from sense_web.api.dependencies import ReadSession, WriteSession
+from sense_web.exceptions import DataPointCompacted, DeviceAlreadyExists
 from sense_web.services.datapoint import (
-    get_datapoints_by_device_uuid,
+    get_series_by_device_uuid,
+    stream_datapoints_by_device_uuid,
     delete_datapoint,
 )
-from sense_web.dto.datapoint import DataPointDTO
+from sense_web.dto.aggregate import AggregateDTO
+from sense_web.dto.datapoint import DataPointDTO, LatestValueDTO
+from sense_web.dto.device import DeviceDTO, DeviceStatusDTO
+from sense_web.services.activity import get_device_status
 from sense_web.services.device import (
+    get_devices_version,
+    is_valid_imei,
     register_device,
+    register_devices,
     list_devices,
     get_device_by_imei,
-    get_device_by_uuid,
+    rename_device,
+    delete_device,
 )
+from sense_web.services.directory import directory
+from sense_web.services.recent import recent
+from sense_web.services.latest import get_latest_by_device_uuid, list_latest
+from sense_web.services.rollup import ROLLUP_RESOLUTIONS, get_aggregates
 from sense_web.services.ipc import (
     ipc,
     PubSubChannels,
@@ -33,11 +66,52 @@ class DeviceRegistrationRequest(BaseModel):
     name: str
 
 
+DEVICE_BATCH = TypeAdapter(List[DeviceRegistrationRequest])
+
+# Largest number of devices accepted by one batch registration
+MAX_BATCH = 10_000
+
+# Default and largest number of devices listed per page
+DEVICE_PAGE_SIZE = 100
+MAX_DEVICE_PAGE_SIZE = 1000
+
+
+class DeviceRenameRequest(BaseModel):
+    name: str
+
+
 class DeviceResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     imei: str
     uuid: UUID
     name: str
+    last_seen: datetime | None = None
+    readings_today: int = 0
+    last_signal: float | None = None
+
+
+def device_response(
+    device: DeviceDTO, status: DeviceStatusDTO | None
+) -> DeviceResponse:
+    response = DeviceResponse.model_validate(device)
+    if status is not None:
+        response.last_seen = status.last_seen
+        response.readings_today = status.readings_on(datetime.now(UTC).date())
+        response.last_signal = status.last_signal
+    return response
+
+
+class DeviceBatchItem(BaseModel):
+    imei: str
+    name: str
+    status: Literal["created", "conflict", "invalid"]
+    uuid: UUID | None = None
+    detail: str | None = None
+
+
+class DeviceBatchResponse(BaseModel):
+    created: int
+    results: List[DeviceBatchItem]
 
 
 class CommandRequest(BaseModel):
@@ -66,15 +140,15 @@ class CommandResponse(BaseModel):
     status_code=status.HTTP_201_CREATED,
 )
 async def register(
-    request: DeviceRegistrationRequest,
+    request: DeviceRegistrationRequest, session: WriteSession
 ) -> DeviceResponse:
     try:
-        device = await register_device(request.imei, request.name)
+        device = await register_device(request.imei, request.name, session)
     except DeviceAlreadyExists as e:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=str(e),
-        )
+        ) from e
 
     await ipc.publish(
         PubSubChannels.DEVICE_REGISTRATION.value, str(device.uuid)
@@ -83,14 +157,179 @@ async def register(
     return DeviceResponse.model_validate(device)
 
 
+def _parse_batch(
+    content_type: str, body: bytes
+) -> List[DeviceRegistrationRequest]:
+    try:
+        if content_type.split(";")[0].strip() == "text/csv":
+            reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+            if reader.fieldnames is None or not {"imei", "name"} <= set(
+                reader.fieldnames
+            ):
+                raise ValueError("CSV must have an imei,name header")
+            return DEVICE_BATCH.validate_python(list(reader))
+        return DEVICE_BATCH.validate_json(body)
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=str(e),
+        ) from e
+
+
+@router.post(
+    "/devices/batch",
+    response_model=DeviceBatchResponse,
+    status_code=status.HTTP_200_OK,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                JSON_MEDIA_TYPE: {
+                    "schema": {
+                        "type": "array",
+                        "items": {
+                            "$ref": "#/components/schemas/"
+                            "DeviceRegistrationRequest"
+                        },
+                    }
+                },
+                "text/csv": {"schema": {"type": "string"}},
+            },
+            "required": True,
+        }
+    },
+)
+async def register_batch(
+    request: Request, session: WriteSession
+) -> DeviceBatchResponse:
+    """
+    Register many devices at once from a JSON list of `{imei, name}`
+    objects or a CSV file with an `imei,name` header.
+
+    Valid devices are registered in one transaction. Each device gets a
+    result: `created` with its UUID, `conflict` if the IMEI is already
+    registered or repeated, or `invalid` if the IMEI is not a 15 digit
+    IMEI with a correct check digit.
+    """
+    items = _parse_batch(
+        request.headers.get("content-type", JSON_MEDIA_TYPE),
+        await request.body(),
+    )
+    if len(items) > MAX_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH} devices can be registered at once",
+        )
+
+    valid = [item for item in items if is_valid_imei(item.imei)]
+    registered = iter(
+        await register_devices(
+            [(item.imei, item.name) for item in valid], session
+        )
+    )
+
+    results: List[DeviceBatchItem] = []
+    created: List[str] = []
+    for item in items:
+        if not is_valid_imei(item.imei):
+            result = DeviceBatchItem(
+                imei=item.imei,
+                name=item.name,
+                status="invalid",
+                detail="Invalid IMEI",
+            )
+        elif (device := next(registered)) is None:
+            result = DeviceBatchItem(
+                imei=item.imei,
+                name=item.name,
+                status="conflict",
+                detail="Device already exists",
+            )
+        else:
+            result = DeviceBatchItem(
+                imei=item.imei,
+                name=item.name,
+                status="created",
+                uuid=device.uuid,
+            )
+            created.append(str(device.uuid))
+        results.append(result)
+
+    # One event for the whole batch keeps subscribers from being flooded
+    if created:
+        await ipc.publish(
+            PubSubChannels.DEVICE_REGISTRATION.value, ",".join(created)
+        )
+
+    return DeviceBatchResponse(created=len(created), results=results)
+
+
 @router.get(
     "/devices",
     response_model=List[DeviceResponse],
     status_code=status.HTTP_200_OK,
+    responses={
+        304: {"description": "The device list has not changed"},
+    },
 )
-async def devices_list() -> List[DeviceResponse]:
-    devices = await list_devices()
-    return [DeviceResponse.model_validate(d) for d in devices]
+async def devices_list(
+    request: Request,
+    response: Response,
+    session: ReadSession,
+    limit: int = Query(DEVICE_PAGE_SIZE, ge=1, le=MAX_DEVICE_PAGE_SIZE),
+    after: UUID | None = Query(
+        None, description="UUID of the last device on the previous page"
+    ),
+    name: str | None = Query(
+        None, description="Only list devices whose name starts with this"
+    ),
+    imei: str | None = Query(
+        None, description="Only list devices whose IMEI starts with this"
+    ),
+    if_none_match: str | None = Header(None),
+    if_modified_since: str | None = Header(None),
+) -> List[DeviceResponse] | Response:
+    """
+    List devices a page at a time, ordered by UUID. When a page is full
+    the `Link` header gives the URL of the next one.
+
+    Responses carry an `ETag` and `Last-Modified` that change whenever a
+    device is registered, renamed or deleted and whenever the CoAP
+    server flushes device activity, so clients polling the list can
+    send them back and get `304 Not Modified` until it changes.
+    """
+    # The version is read first, so a change made while the page is
+    # read only ever makes the validators older than the content
+    version, modified = await get_devices_version(session)
+    headers = validators(version, modified)
+    if not_modified(
+        if_none_match, if_modified_since, headers["ETag"], modified
+    ):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+
+    devices = await list_devices(
+        session, after=after, limit=limit, name_prefix=name, imei_prefix=imei
+    )
+
+    response.headers.update(headers)
+    if len(devices) == limit:
+        next_page = request.url.include_query_params(
+            after=str(devices[-1].uuid)
+        )
+        response.headers["Link"] = f'<{next_page}>; rel="next"'
+
+    statuses = await get_device_status([d.uuid for d in devices], session)
+    return [device_response(d, statuses.get(d.uuid)) for d in devices]
+
+
+@router.get(
+    "/devices/latest",
+    response_model=list[LatestValueDTO],
+    status_code=status.HTTP_200_OK,
+)
+async def devices_latest(session: ReadSession) -> list[LatestValueDTO]:
+    return await list_latest(session)
 
 
 @router.get(
@@ -98,31 +337,70 @@ async def devices_list() -> List[DeviceResponse]:
     response_model=DeviceResponse,
     status_code=status.HTTP_200_OK,
 )
-async def devices_by_uuid(uuid: UUID) -> DeviceResponse:
-    device = await get_device_by_uuid(uuid)
+async def devices_by_uuid(uuid: UUID, session: ReadSession) -> DeviceResponse:
+    device = await directory.get(uuid, session)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
+    statuses = await get_device_status([uuid], session)
+    return device_response(device, statuses.get(uuid))
+
+
+@router.patch(
+    "/devices/{uuid}",
+    response_model=DeviceResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def device_rename(
+    uuid: UUID, request: DeviceRenameRequest, session: WriteSession
+) -> DeviceResponse:
+    device = await rename_device(uuid, request.name, session)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    directory.put(device)
+    await ipc.publish(PubSubChannels.DEVICE_UPDATE.value, str(uuid))
+
     return DeviceResponse.model_validate(device)
 
 
+@router.delete(
+    "/devices/{uuid}",
+    response_model=None,
+    status_code=status.HTTP_200_OK,
+)
+async def device_delete(uuid: UUID, session: WriteSession) -> JSONResponse:
+    deleted = await delete_device(uuid, session)
+    directory.discard(uuid)
+
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    await ipc.publish(PubSubChannels.DEVICE_UPDATE.value, str(uuid))
+
+    return JSONResponse(content={"detail": "Device deleted"}, status_code=200)
+
+
 @router.get(
     "/devices/imei/{imei}",
     response_model=DeviceResponse,
     status_code=status.HTTP_200_OK,
 )
-async def devices_by_imei(imei: str) -> DeviceResponse:
-    device = await get_device_by_imei(imei)
+async def devices_by_imei(imei: str, session: ReadSession) -> DeviceResponse:
+    device = await get_device_by_imei(imei, session)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-    return DeviceResponse.model_validate(device)
+    statuses = await get_device_status([device.uuid], session)
+    return device_response(device, statuses.get(device.uuid))
 
 
 @router.post(
     "/devices/{uuid}/commands",
     status_code=status.HTTP_202_ACCEPTED,
 )
-async def commands_post(uuid: UUID, request: CommandRequest) -> None:
-    device = await get_device_by_uuid(uuid)
+async def commands_post(
+    uuid: UUID, request: CommandRequest, session: ReadSession
+) -> None:
+    device = await directory.get(uuid, session)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
 
@@ -134,8 +412,10 @@ async def commands_post(uuid: UUID, request: CommandRequest) -> None:
     response_model=list[CommandResponse] | None,
     status_code=status.HTTP_200_OK,
 )
-async def commands_get(uuid: UUID) -> list[CommandResponse] | None:
-    device = await get_device_by_uuid(uuid)
+async def commands_get(
+    uuid: UUID, session: ReadSession
+) -> list[CommandResponse] | None:
+    device = await directory.get(uuid, session)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
 
@@ -146,17 +426,118 @@ async def commands_get(uuid: UUID) -> list[CommandResponse] | None:
     return [CommandResponse.model_validate(c) for c in commands]
 
 
+@router.get(
+    "/devices/{device_uuid}/latest",
+    response_model=list[LatestValueDTO],
+    status_code=status.HTTP_200_OK,
+)
+async def device_latest(
+    device_uuid: UUID, session: ReadSession
+) -> list[LatestValueDTO]:
+    device = await directory.get(device_uuid, session)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    return await get_latest_by_device_uuid(device_uuid, session)
+
+
 @router.get(
     "/devices/{device_uuid}/data",
     response_model=list[DataPointDTO] | None,
     status_code=status.HTTP_200_OK,
+    responses={
+        200: {
+            "content": {
+                SERIES_JSON_MEDIA_TYPE: {},
+                CBOR_MEDIA_TYPE: {},
+            },
+            "description": (
+                "A list of datapoints, or one columnar series per sensor "
+                "when a series media type is requested via `Accept`."
+            ),
+        }
+    },
+)
+async def datapoints_get(
+    device_uuid: UUID,
+    session: ReadSession,
+    sensor: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    accept: str | None = Header(None),
+) -> list[DataPointDTO] | Response | None:
+    device = await directory.get(device_uuid, session)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    media_type = negotiate(
+        accept, [JSON_MEDIA_TYPE, SERIES_JSON_MEDIA_TYPE, CBOR_MEDIA_TYPE]
+    )
+
+    # Live-chart queries for the last few minutes of a single sensor are
+    # answered from the in-memory ring buffers when they are complete.
+    if (
+        sensor is not None
+        and start is not None
+        and recent.covers(device_uuid, sensor, start)
+    ):
+        if media_type == JSON_MEDIA_TYPE:
+            return recent.datapoints(device_uuid, sensor, start, end)
+        series = recent.series(device_uuid, sensor, start, end)
+    elif media_type == JSON_MEDIA_TYPE:
+        # Streamed a batch at a time rather than built as one list
+        return StreamingResponse(
+            encode_datapoints_json(
+                stream_datapoints_by_device_uuid(
+                    device_uuid,
+                    sensor=sensor,
+                    start=start,
+                    end=end,
+                    session=session,
+                )
+            ),
+            media_type=JSON_MEDIA_TYPE,
+        )
+    else:
+        series = await get_series_by_device_uuid(
+            device_uuid, sensor=sensor, start=start, end=end, session=session
+        )
+
+    if media_type == CBOR_MEDIA_TYPE:
+        return Response(
+            content=encode_series_cbor(series), media_type=CBOR_MEDIA_TYPE
+        )
+
+    return JSONResponse(
+        content=encode_series_json(series), media_type=SERIES_JSON_MEDIA_TYPE
+    )
+
+
+@router.get(
+    "/devices/{device_uuid}/data/aggregate",
+    response_model=list[AggregateDTO],
+    status_code=status.HTTP_200_OK,
 )
-async def datapoints_get(device_uuid: UUID) -> list[DataPointDTO] | None:
-    device = await get_device_by_uuid(device_uuid)
+async def datapoints_aggregate(
+    device_uuid: UUID,
+    sensor: str,
+    session: ReadSession,
+    resolution: int = Query(
+        3600,
+        ge=ROLLUP_RESOLUTIONS[0],
+        multiple_of=ROLLUP_RESOLUTIONS[0],
+        description="Bucket width in seconds",
+    ),
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> list[AggregateDTO]:
+    device = await directory.get(device_uuid, session)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
 
-    return await get_datapoints_by_device_uuid(device_uuid)
+    return await get_aggregates(
+        device_uuid, sensor, resolution, start, end, session
+    )
 
 
 @router.delete(
@@ -165,17 +546,31 @@ async def datapoints_get(device_uuid: UUID) -> list[DataPointDTO] | None:
     status_code=status.HTTP_200_OK,
 )
 async def datapoint_delete(
-    device_uuid: UUID, datapoint_uuid: UUID
+    device_uuid: UUID, datapoint_uuid: UUID, session: WriteSession
 ) -> JSONResponse | None:
-    device = await get_device_by_uuid(device_uuid)
+    device = await directory.get(device_uuid, session)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
 
-    deleted = await delete_datapoint(datapoint_uuid)
+    try:
+        deleted = await delete_datapoint(device_uuid, datapoint_uuid, session)
+    except DataPointCompacted as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+        ) from e
 
     if not deleted:
         raise HTTPException(status_code=404, detail="Datapoint not found")
 
+    # Evicted here straight away, and in every other API process once
+    # the event reaches them
+    recent.remove(device_uuid, datapoint_uuid)
+    await ipc.publish(
+        PubSubChannels.DATAPOINT_DELETE.value,
+        f"{device_uuid},{datapoint_uuid}",
+    )
+
     return JSONResponse(
         content={"detail": "Datapoint deleted"}, status_code=200
     )
@@ -1,10 +1,16 @@
+import datetime
 import uuid
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import HTMLResponse
 from fastapi.encoders import jsonable_encoder
 from fastapi.templating import Jinja2Templates
+from sense_web.api.dependencies import ReadSession
+from sense_web.dto.datapoint import LatestValueDTO
+from sense_web.services.activity import get_device_status
 from sense_web.services.datapoint import get_datapoints_by_device_uuid
-from sense_web.services.device import list_devices, get_device_by_uuid
+from sense_web.services.device import list_devices
+from sense_web.services.directory import directory
+from sense_web.services.latest import list_latest
 from sense_web.services.ipc import peek_commands
 from sense_web.services.command import (
     CMD_TYPE_MAP,
@@ -16,24 +22,63 @@ router = APIRouter()
 templates = Jinja2Templates(directory="sense_web/api/webui/templates")
 
 
+# Number of devices shown per page of the device list
+PAGE_SIZE = 100
+
+# Devices heard from this recently are shown as online
+ONLINE_WINDOW = datetime.timedelta(minutes=10)
+
+
 @router.get("/", response_class=HTMLResponse)
-async def home(request: Request) -> HTMLResponse:
-    devices = await list_devices()
+async def home(
+    request: Request,
+    session: ReadSession,
+    after: uuid.UUID | None = None,
+    name: str | None = None,
+) -> HTMLResponse:
+    devices = await list_devices(
+        session, after=after, limit=PAGE_SIZE, name_prefix=name
+    )
+
+    uuids = [d.uuid for d in devices]
+    latest: dict[uuid.UUID, list[LatestValueDTO]] = {}
+    for value in await list_latest(session, uuids):
+        latest.setdefault(value.device_uuid, []).append(value)
+    statuses = await get_device_status(uuids, session)
+    now = datetime.datetime.now(datetime.UTC)
+
+    next_page = None
+    if len(devices) == PAGE_SIZE:
+        next_page = request.url.include_query_params(
+            after=str(devices[-1].uuid)
+        )
+
     return templates.TemplateResponse(
         "index.html",
-        {"request": request, "devices": devices},
+        {
+            "request": request,
+            "devices": devices,
+            "latest": latest,
+            "statuses": statuses,
+            "online_since": now - ONLINE_WINDOW,
+            "today": now.date(),
+            "name": name or "",
+            "next_page": next_page,
+        },
     )
 
 
 @router.get("/devices/{uuid}", response_class=HTMLResponse)
-async def device(uuid: uuid.UUID, request: Request) -> HTMLResponse:
-    device = await get_device_by_uuid(uuid)
+async def device(
+    uuid: uuid.UUID, request: Request, session: ReadSession
+) -> HTMLResponse:
+    device = await directory.get(uuid, session)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
 
     commands = await peek_commands(str(uuid))
 
-    datapoints = await get_datapoints_by_device_uuid(uuid)
+    datapoints = await get_datapoints_by_device_uuid(uuid, session=session)
     datapoints_dict = [jsonable_encoder(d) for d in datapoints]
     sensors = sorted(set(dp.sensor for dp in datapoints))
 
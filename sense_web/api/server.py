@@ -1,32 +1,130 @@
+import asyncio
+import json
 import os
+import uuid
 import sys
 import subprocess
 from typing import IO, Dict, AsyncIterator, Any
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, APIRouter
 from fastapi.staticfiles import StaticFiles
-from .routes import root, devices, webui
+from .routes import root, data, devices, webui
 
-from sense_web.db.session import sessionmanager
-from sense_web.services.ipc import ipc
+from sense_web.db.partitions import partitions
+from sense_web.db.session import env_uris, sessionmanager
+from sense_web.dto.datapoint import DataPointDTO
+from sense_web.services.archive import archive, run_archive
+from sense_web.services.chunks import run_compaction
+from sense_web.services.directory import directory
+from sense_web.services.ipc import ipc, PubSubChannels
+from sense_web.services.recent import recent
+from sense_web.services.retention import RetentionPolicy, run_retention
 
 DB_URI = os.getenv("DATABASE_URI", "sqlite+aiosqlite:///./dev.db")
+DB_REPLICA_URIS = env_uris("DATABASE_REPLICA_URIS")
+DB_SHARD_URIS = env_uris("DATABASE_SHARD_URIS")
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "2"))
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+DATAPOINT_PARTITIONING = os.getenv("DATAPOINT_PARTITIONING", "none")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR")
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "86400"))
+CHUNKED_SENSORS = [
+    s.strip() for s in os.getenv("CHUNKED_SENSORS", "").split(",") if s.strip()
+]
+CHUNK_INTERVAL = float(os.getenv("CHUNK_INTERVAL", "3600"))
+RETENTION_POLICY = RetentionPolicy.from_env(os.environ)
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+RECENT_WINDOW_SECONDS = float(os.getenv("RECENT_WINDOW_SECONDS", "300"))
+RECENT_BUFFER_SIZE = int(os.getenv("RECENT_BUFFER_SIZE", "1024"))
+RECENT_MAX_SKEW_SECONDS = float(os.getenv("RECENT_MAX_SKEW_SECONDS", "60"))
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", "1024"))
+DEVICE_CACHE_TTL = float(os.getenv("DEVICE_CACHE_TTL", "60"))
+
+DEVICE_CHANNELS = (
+    PubSubChannels.DEVICE_REGISTRATION,
+    PubSubChannels.DEVICE_UPDATE,
+)
 
 api_router = APIRouter()
 api_router.include_router(root.router)
 api_router.include_router(devices.router)
+api_router.include_router(data.router)
+
+
+async def datapoint_callback(message: str) -> None:
+    data = json.loads(message)
+    recent.add(
+        DataPointDTO.model_validate(data),
+        publisher=data.get("publisher"),
+        seq=data.get("seq"),
+    )
+
+
+async def datapoint_delete_callback(message: str) -> None:
+    device_uuid, datapoint_uuid = message.split(",")
+    recent.remove(uuid.UUID(device_uuid), uuid.UUID(datapoint_uuid))
 
 
 def init_api(use_webui: bool = True) -> FastAPI:
     @asynccontextmanager
     async def lifespan(app: FastAPI) -> AsyncIterator[None]:
-        await sessionmanager.init(DB_URI)
+        await sessionmanager.init(
+            DB_URI,
+            replica_uris=DB_REPLICA_URIS,
+            read_your_writes=READ_YOUR_WRITES_SECONDS,
+            shard_uris=DB_SHARD_URIS,
+        )
+        partitions.init(enabled=DATAPOINT_PARTITIONING == "monthly")
+        archive.init(ARCHIVE_DIR)
         await ipc.init(host=REDIS_HOST, port=REDIS_PORT)
+
+        recent.init(
+            RECENT_WINDOW_SECONDS, RECENT_BUFFER_SIZE, RECENT_MAX_SKEW_SECONDS
+        )
+        await ipc.subscribe(PubSubChannels.DATAPOINT.value, datapoint_callback)
+        await ipc.subscribe(
+            PubSubChannels.DATAPOINT_DELETE.value, datapoint_delete_callback
+        )
+        recent.start()
+
+        directory.init(DEVICE_CACHE_SIZE, DEVICE_CACHE_TTL)
+        for channel in DEVICE_CHANNELS:
+            await ipc.subscribe(channel.value, directory.invalidate)
+
+        retention_task = None
+        if RETENTION_POLICY.enabled:
+            retention_task = asyncio.create_task(
+                run_retention(RETENTION_POLICY, RETENTION_INTERVAL)
+            )
+
+        archive_task = None
+        if archive.enabled:
+            archive_task = asyncio.create_task(run_archive(ARCHIVE_INTERVAL))
+
+        compaction_task = None
+        if CHUNKED_SENSORS:
+            compaction_task = asyncio.create_task(
+                run_compaction(CHUNKED_SENSORS, CHUNK_INTERVAL)
+            )
+
         yield
+
+        for task in (retention_task, archive_task, compaction_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
         if sessionmanager._engine is not None:
             await sessionmanager.close()
+        await ipc.unsubscribe(PubSubChannels.DATAPOINT.value)
+        await ipc.unsubscribe(PubSubChannels.DATAPOINT_DELETE.value)
+        for channel in DEVICE_CHANNELS:
+            await ipc.unsubscribe(channel.value)
         await ipc.close()
 
     api = FastAPI(title="SENSE Web - CoAP-HTTP Gateway", lifespan=lifespan)
@@ -1,11 +1,12 @@
 import argparse
+import itertools
 import os
 import uuid
 import asyncio
 import sys
 import json
 import subprocess
-from typing import IO, Any
+from typing import IO, Any, Dict
 from aiocoap import Context, Message, Code
 import aiocoap.resource as resource
 import logging
@@ -13,8 +14,14 @@ import cbor2
 import datetime
 import re
 
-from sense_web.db.session import sessionmanager
-from sense_web.services.datapoint import create_datapoint
+from sense_web.db.partitions import partitions
+from sense_web.db.session import env_uris, sessionmanager
+from sense_web.services.activity import activity, run_flush
+from sense_web.services.datapoint import (
+    BulkReading,
+    create_datapoint,
+    create_datapoints_bulk,
+)
 from sense_web.services.device import list_devices, get_device_by_uuid
 from sense_web.services.ipc import (
     ipc,
@@ -27,8 +34,17 @@ log = logging.getLogger("coap")
 log.setLevel(logging.INFO)
 
 DB_URI = os.getenv("DATABASE_URI", "sqlite+aiosqlite:///./dev.db")
+DB_SHARD_URIS = env_uris("DATABASE_SHARD_URIS")
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+DATAPOINT_PARTITIONING = os.getenv("DATAPOINT_PARTITIONING", "none")
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "30"))
+SIGNAL_SENSOR = os.getenv("SIGNAL_SENSOR", "rssi")
+
+# Datapoint messages carry this process's ID and a count of the messages
+# it has published, so subscribers can tell when one has been lost
+PUBLISHER_ID = uuid.uuid4().hex
+publish_sequence = itertools.count(1)
 
 coap_resource_pattern = re.compile(
     r"coap://(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?(/.*)"
@@ -36,7 +52,7 @@ coap_resource_pattern = re.compile(
 
 
 def format_coap_access_log(request: Message) -> str:
-    remote_path = request.remote.uri_base.lstrip("coap://")
+    remote_path = request.remote.uri_base.removeprefix("coap://")
     match = coap_resource_pattern.search(request.get_request_uri())
     resource_path = match.group(1) if match else "Match failed"
 
@@ -71,6 +87,81 @@ def start_coap(
     return proc
 
 
+class InvalidReading(Exception):
+    def __init__(self, code: Code, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def parse_reading(data: Dict[str, Any], imei: str) -> BulkReading:
+    """
+    Validate a single reading from a device data payload.
+
+    Raises:
+        InvalidReading: If the reading is malformed or its IMEI tail
+            does not match `imei`.
+    """
+    imei_tail = str(data.get("i", None))
+    if not imei_tail or len(imei_tail) != 6:
+        raise InvalidReading(Code.UNAUTHORIZED, "Missing or invalid imei_tail")
+
+    if imei[-6:] != imei_tail:
+        raise InvalidReading(Code.UNAUTHORIZED, "Unauthorised")
+
+    ts = data.get("t", None)
+    if not isinstance(ts, (int, float)):
+        raise InvalidReading(Code.BAD_REQUEST, "Invalid timestamp format")
+
+    try:
+        timestamp = datetime.datetime.fromtimestamp(
+            ts, tz=datetime.timezone.utc
+        )
+    except (OverflowError, OSError) as e:
+        raise InvalidReading(
+            Code.BAD_REQUEST, "Invalid timestamp value"
+        ) from e
+
+    sensor = data.get("s", None)
+    val_int = data.get("n", None)
+    val_float = data.get("f", None)
+    val_str = data.get("r", None)
+    val_units = data.get("u", None)
+
+    if sensor is None:
+        raise InvalidReading(Code.BAD_REQUEST, "Missing sensor")
+
+    if val_float is None and val_str is None and val_int is None:
+        raise InvalidReading(Code.BAD_REQUEST, "Missing value")
+
+    return (timestamp, sensor, val_int, val_float, val_str, val_units)
+
+
+def datapoint_message(
+    datapoint_uuid: uuid.UUID, device_uuid: uuid.UUID, reading: BulkReading
+) -> str:
+    """
+    Serialise a stored reading in the same shape as
+    `DataPointDTO.model_dump_json`, without building the DTO, stamped
+    with the publisher and its next sequence number.
+    """
+    timestamp, sensor, val_int, val_float, val_str, val_units = reading
+    return json.dumps(
+        {
+            "uuid": str(datapoint_uuid),
+            "device_uuid": str(device_uuid),
+            "timestamp": timestamp.isoformat(),
+            "sensor": sensor,
+            "val_int": val_int,
+            "val_float": val_float,
+            "val_str": val_str,
+            "val_units": val_units,
+            "publisher": PUBLISHER_ID,
+            "seq": next(publish_sequence),
+        }
+    )
+
+
 class DeviceResource(resource.Resource):
     def __init__(self, uuid: uuid.UUID) -> None:
         self._uuid = uuid
@@ -99,6 +190,7 @@ class DeviceCommandResource(resource.Resource):
 
     async def render_get(self, request: Message) -> Message:
         log.info(format_coap_access_log(request))
+        activity.record(self._uuid)
 
         commands = await peek_commands(str(self._uuid))
         if len(commands) == 0:
@@ -117,7 +209,8 @@ class DeviceDataResource(resource.Resource):
         """
         Handle POST requests from SENSE Core devices.
 
-        Devices will send a CBOR payload with the following fields:
+        Devices will send a CBOR map, or an array of maps to upload
+        several readings at once, with the following fields:
         - i -> imei_tail: Last 6 digits of device IMEI for validation
         - t -> timestamp: Unix timestamp indicating when value was recorded
         - s -> sensor: Sensor where value was recorded
@@ -127,6 +220,7 @@ class DeviceDataResource(resource.Resource):
         - u -> val_units: Units of value if applicable
 
         The IMEI tail will be used to verify the identity of the device.
+        A batch is rejected as a whole if any of its readings is invalid.
         """
         log_start = format_coap_access_log(request)
 
@@ -137,7 +231,9 @@ class DeviceDataResource(resource.Resource):
             log.info(f"{log_start} FAILED: Invalid CBOR")
             return Message(code=Code.BAD_REQUEST, payload=b"Invalid CBOR")
 
-        if not isinstance(data, dict):
+        batch = isinstance(data, list)
+        items = data if batch else [data]
+        if not items or not all(isinstance(d, dict) for d in items):
             log.info(f"{log_start} FAILED: Invalid CBOR")
             return Message(code=Code.BAD_REQUEST, payload=b"Invalid CBOR")
 
@@ -146,62 +242,58 @@ class DeviceDataResource(resource.Resource):
             log.info(f"{log_start} FAILED: Invalid device")
             return Message(code=Code.BAD_REQUEST, payload=b"Invalid device")
 
-        imei_tail = str(data.get("i", None))
-        if not imei_tail or len(imei_tail) != 6:
-            log.info(f"{log_start} FAILED: Missing or invalid imei_tail")
-            return Message(
-                code=Code.UNAUTHORIZED, payload=b"Missing or invalid imei_tail"
+        try:
+            readings = [parse_reading(d, device.imei) for d in items]
+        except InvalidReading as e:
+            log.info(f"{log_start} FAILED: {e.message}")
+            return Message(code=e.code, payload=e.message.encode())
+
+        if not batch:
+            timestamp, sensor, val_int, val_float, val_str, val_units = (
+                readings[0]
+            )
+            dp = await create_datapoint(
+                device_uuid=device.uuid,
+                timestamp=timestamp,
+                sensor=sensor,
+                val_int=val_int,
+                val_float=val_float,
+                val_str=val_str,
+                val_units=val_units,
             )
 
-        if device.imei[-6:] != imei_tail:
-            log.info(f"{log_start} FAILED: Unauthorised")
-            return Message(code=Code.UNAUTHORIZED, payload=b"Unauthorised")
+            activity.record(device.uuid, readings)
 
-        ts = data.get("t", None)
-        if not isinstance(ts, (int, float)):
-            log.info(f"{log_start} FAILED: Invalid timestamp format")
-            return Message(
-                code=Code.BAD_REQUEST, payload=b"Invalid timestamp format"
-            )
+            log.info(f"{log_start} ACCEPTED")
+            log.info(f"Created DataPoint:\n{dp!r}")
 
-        try:
-            timestamp = datetime.datetime.fromtimestamp(
-                ts, tz=datetime.timezone.utc
-            )
-        except (OverflowError, OSError):
-            log.info(f"{log_start} FAILED: Invalid timestamp value")
-            return Message(
-                code=Code.BAD_REQUEST, payload=b"Invalid timestamp value"
+            await ipc.publish(
+                PubSubChannels.DATAPOINT.value,
+                datapoint_message(dp.uuid, device.uuid, readings[0]),
             )
 
-        sensor = data.get("s", None)
-        val_int = data.get("n", None)
-        val_float = data.get("f", None)
-        val_str = data.get("r", None)
-        val_units = data.get("u", None)
-
-        if sensor is None:
-            log.info(f"{log_start} FAILED: Missing sensor")
-            return Message(code=Code.BAD_REQUEST, payload=b"Missing sensor")
-
-        if val_float is None and val_str is None and val_int is None:
-            log.info(f"{log_start} FAILED: Missing value")
-            return Message(code=Code.BAD_REQUEST, payload=b"Missing value")
-
-        dp = await create_datapoint(
-            device_uuid=device.uuid,
-            timestamp=timestamp,
-            sensor=sensor,
-            val_int=val_int,
-            val_float=val_float,
-            val_str=val_str,
-            val_units=val_units,
+            return Message(code=Code.CREATED, payload=b"DataPoint accepted")
+
+        ids = await create_datapoints_bulk(
+            device.uuid, readings, return_ids=True
         )
 
-        log.info(f"{log_start} ACCEPTED")
-        log.info(f"Created DataPoint:\n{dp!r}")
+        activity.record(device.uuid, readings)
 
-        return Message(code=Code.CREATED, payload=b"DataPoint accepted")
+        log.info(f"{log_start} ACCEPTED {len(ids)} readings")
+
+        await ipc.publish_many(
+            PubSubChannels.DATAPOINT.value,
+            [
+                datapoint_message(id_, device.uuid, reading)
+                for id_, reading in zip(ids, readings, strict=True)
+            ],
+        )
+
+        return Message(
+            code=Code.CREATED,
+            payload=f"{len(ids)} DataPoints accepted".encode(),
+        )
 
 
 class State:
@@ -212,22 +304,28 @@ class State:
 state = State()
 
 
-async def device_registration_callback(device: str) -> None:
-    log.info(f"Registering new device {device}")
+async def device_registration_callback(message: str) -> None:
     if state.coap_site is None:
         raise RuntimeError("CoAP server state is not initialised")
-    state.coap_site.add_resource([device], DeviceResource(uuid.UUID(device)))
-    state.coap_site.add_resource(
-        [device, "commands"], DeviceCommandResource(uuid.UUID(device))
-    )
-    state.coap_site.add_resource(
-        [str(device), "data"], DeviceDataResource(uuid.UUID(device))
-    )
+    # Batch registrations publish their UUIDs as one comma separated event
+    for device in message.split(","):
+        log.info(f"Registering new device {device}")
+        state.coap_site.add_resource(
+            [device], DeviceResource(uuid.UUID(device))
+        )
+        state.coap_site.add_resource(
+            [device, "commands"], DeviceCommandResource(uuid.UUID(device))
+        )
+        state.coap_site.add_resource(
+            [device, "data"], DeviceDataResource(uuid.UUID(device))
+        )
 
 
 async def main(server_ip: str, server_port: int) -> None:
-    await sessionmanager.init(DB_URI)
+    await sessionmanager.init(DB_URI, shard_uris=DB_SHARD_URIS)
+    partitions.init(enabled=DATAPOINT_PARTITIONING == "monthly")
     await ipc.init(host=REDIS_HOST, port=REDIS_PORT)
+    activity.init(SIGNAL_SENSOR)
 
     await ipc.subscribe(
         PubSubChannels.DEVICE_REGISTRATION.value, device_registration_callback
@@ -256,11 +354,20 @@ async def main(server_ip: str, server_port: int) -> None:
         transports=["udp6"],
     )
 
+    flush_task = asyncio.create_task(run_flush(ACTIVITY_FLUSH_INTERVAL))
+
     try:
         await asyncio.get_running_loop().create_future()
     except asyncio.CancelledError:
         log.info("CoAP server shutting down cleanly.")
 
+    flush_task.cancel()
+    try:
+        await flush_task
+    except asyncio.CancelledError:
+        pass
+    await activity.flush()
+
     await sessionmanager.close()
     await ipc.unsubscribe(PubSubChannels.DEVICE_REGISTRATION.value)
     await ipc.close()
@@ -0,0 +1,93 @@
+from typing import Any, Iterable, List, Sequence, Tuple
+from sqlalchemy import Index, Table, TypeDecorator, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+
+from sense_web.exceptions import UnsupportedDialect
+
+
+def dialect_name(session: AsyncSession) -> str:
+    return session.get_bind().dialect.name
+
+
+def index_supported(index: Index, name: str) -> bool:
+    """
+    Return whether `index` should be created on dialect `name`. BRIN
+    indexes only exist on PostgreSQL, and would otherwise be created as
+    plain B-trees.
+    """
+    using = index.dialect_options["postgresql"]["using"]
+    return name == "postgresql" or using != "brin"
+
+
+def upsert(session: AsyncSession, table: Any) -> Any:
+    """
+    Return a dialect-specific `INSERT` for `table` that supports
+    `on_conflict_do_update` and `on_conflict_do_nothing`.
+
+    Only SQLite and PostgreSQL are supported.
+    """
+    name = dialect_name(session)
+    if name == "sqlite":
+        return sqlite.insert(table)
+    if name == "postgresql":
+        return postgresql.insert(table)
+    raise UnsupportedDialect(f"Upserts are not supported on {name}")
+
+
+def least(session: AsyncSession, *args: Any) -> ColumnElement[Any]:
+    if dialect_name(session) == "sqlite":
+        return func.min(*args)
+    return func.least(*args)
+
+
+def greatest(session: AsyncSession, *args: Any) -> ColumnElement[Any]:
+    if dialect_name(session) == "sqlite":
+        return func.max(*args)
+    return func.greatest(*args)
+
+
+def supports_copy(session: AsyncSession) -> bool:
+    bind = session.get_bind()
+    return (
+        bind.dialect.name == "postgresql" and bind.dialect.driver == "asyncpg"
+    )
+
+
+async def copy_rows(
+    session: AsyncSession,
+    table: Table,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+) -> None:
+    """
+    Load `rows` into `table` with `COPY ... FROM STDIN` on the session's
+    connection, so it shares the session's transaction. Only supported
+    when `supports_copy()` is true.
+
+    COPY bypasses SQLAlchemy's type handling, so values of columns with
+    a `TypeDecorator`, such as epoch microsecond timestamps, are
+    converted here first.
+    """
+    connection = await session.connection()
+    dialect = connection.dialect
+    converters: List[Tuple[int, TypeDecorator[Any]]] = []
+    for i, name in enumerate(columns):
+        type_ = table.c[name].type
+        if isinstance(type_, TypeDecorator):
+            converters.append((i, type_))
+    if converters:
+        converted = [list(row) for row in rows]
+        for row in converted:
+            for i, type_ in converters:
+                row[i] = type_.process_bind_param(row[i], dialect)
+        rows = converted
+
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(  # type: ignore[union-attr]
+        table.name,
+        records=rows,
+        columns=list(columns),
+        schema_name=table.schema,
+    )
@@ -0,0 +1,40 @@
+import datetime
+import os
+import time
+import uuid
+
+from sense_web.dto.series import EPOCH, to_epoch_us
+
+_MAX_MS = (1 << 48) - 1
+
+
+def uuid7(timestamp: datetime.datetime | None = None) -> uuid.UUID:
+    """
+    Return a time-ordered UUIDv7 (RFC 9562).
+
+    The top 48 bits hold milliseconds since the Unix epoch, taken from
+    `timestamp` if given and the current time otherwise, so ids sort
+    by time and new rows append to the end of a B-tree index. The
+    remaining 74 bits are random.
+    """
+    if timestamp is None:
+        ms = time.time_ns() // 1_000_000
+    else:
+        ms = to_epoch_us(timestamp) // 1000
+    ms = min(max(ms, 0), _MAX_MS)
+
+    rand = int.from_bytes(os.urandom(10), "big")
+    rand_a = rand >> 68
+    rand_b = rand & ((1 << 62) - 1)
+
+    value = (ms << 80) | (0x7 << 76) | (rand_a << 64) | (0b10 << 62) | rand_b
+    return uuid.UUID(int=value)
+
+
+def uuid7_timestamp(value: uuid.UUID) -> datetime.datetime | None:
+    """
+    Return the time embedded in a UUIDv7, or `None` for other versions.
+    """
+    if value.version != 7:
+        return None
+    return EPOCH + datetime.timedelta(milliseconds=value.int >> 80)
@@ -0,0 +1,128 @@
+import weakref
+from typing import Collection, Dict, Tuple, cast
+
+from sqlalchemy import Engine, Table, event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import BindParameter, ColumnElement, Label
+from sqlalchemy.sql.selectable import Join
+
+from .dialect import upsert
+from .models import Sensor, Unit
+
+SENSORS = cast(Table, Sensor.__table__)
+UNITS = cast(Table, Unit.__table__)
+
+# Session.info key for ids interned in a transaction that has not yet
+# committed
+_PENDING = "pending_lookups"
+
+
+def joined(table: Table) -> Join:
+    """
+    Join a datapoint table to its sensor and unit names. Select
+    `sensor_name()` and `units_name()` from the result.
+    """
+    return table.join(SENSORS, table.c.sensor_id == SENSORS.c.id).outerjoin(
+        UNITS, table.c.units_id == UNITS.c.id
+    )
+
+
+def sensor_name() -> Label[str]:
+    return SENSORS.c.name.label("sensor")
+
+
+def units_name() -> Label[str]:
+    return UNITS.c.name.label("val_units")
+
+
+def sensor_is(
+    table: Table, name: str | BindParameter[str]
+) -> ColumnElement[bool]:
+    return table.c.sensor_id == (
+        select(SENSORS.c.id).where(SENSORS.c.name == name).scalar_subquery()
+    )
+
+
+def sensor_in(table: Table, names: Collection[str]) -> ColumnElement[bool]:
+    return table.c.sensor_id.in_(
+        select(SENSORS.c.id).where(SENSORS.c.name.in_(names))
+    )
+
+
+def sensor_not_in(table: Table, names: Collection[str]) -> ColumnElement[bool]:
+    return table.c.sensor_id.not_in(
+        select(SENSORS.c.id).where(SENSORS.c.name.in_(names))
+    )
+
+
+class LookupCache:
+    """
+    Interns sensor and unit names into their lookup tables.
+
+    Ids are cached per engine once the transaction that created or read
+    them commits, so ingest only touches the lookup tables the first
+    time a process sees a name. Ids from a transaction that rolls back
+    are discarded, since the rows they refer to may not exist.
+    """
+
+    def __init__(self) -> None:
+        self._ids: weakref.WeakKeyDictionary[
+            Engine, Dict[Tuple[str, str], int]
+        ] = weakref.WeakKeyDictionary()
+
+    def clear(self) -> None:
+        self._ids = weakref.WeakKeyDictionary()
+
+    async def intern(
+        self, session: AsyncSession, table: Table, name: str
+    ) -> int:
+        """
+        Return the id of `name` in `table`, inserting it if needed. The
+        caller owns the transaction.
+        """
+        key = (table.name, name)
+
+        cached = self._ids.get(session.get_bind().engine, {}).get(key)
+        if cached is not None:
+            return cached
+
+        pending: Dict[Tuple[str, str], int] = session.info.setdefault(
+            _PENDING, {}
+        )
+        if key in pending:
+            return pending[key]
+
+        await session.execute(
+            upsert(session, table).values(name=name).on_conflict_do_nothing()
+        )
+        result = await session.execute(
+            select(table.c.id).where(table.c.name == name)
+        )
+        pending[key] = result.scalar_one()
+        return pending[key]
+
+    async def sensor_id(self, session: AsyncSession, name: str) -> int:
+        return await self.intern(session, SENSORS, name)
+
+    async def units_id(
+        self, session: AsyncSession, name: str | None
+    ) -> int | None:
+        if name is None:
+            return None
+        return await self.intern(session, UNITS, name)
+
+    def _after_commit(self, session: Session) -> None:
+        pending = session.info.pop(_PENDING, None)
+        if pending:
+            engine = session.get_bind().engine
+            self._ids.setdefault(engine, {}).update(pending)
+
+    def _after_rollback(self, session: Session) -> None:
+        session.info.pop(_PENDING, None)
+
+
+lookups = LookupCache()
+
+event.listen(Session, "after_commit", lookups._after_commit)
+event.listen(Session, "after_rollback", lookups._after_rollback)
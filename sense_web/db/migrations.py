@@ -0,0 +1,555 @@
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+from typing import Any, Dict, List, cast
+
+from sqlalchemy import (
+    BigInteger,
+    String,
+    Table,
+    bindparam,
+    delete,
+    func,
+    insert,
+    inspect,
+    literal_column,
+    select,
+    text,
+    type_coerce,
+    update,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql.elements import ColumnElement
+
+from sense_web.dto.series import to_epoch_us
+
+from .dialect import dialect_name
+from .ids import uuid7
+from .models import (
+    DataPointRollup,
+    Device,
+    DeviceStatus,
+    LatestValue,
+    TableVersion,
+    TextPoint,
+)
+from .partitions import partitions
+from .session import env_uris, sessionmanager
+
+log = logging.getLogger("migrations")
+log.setLevel(logging.INFO)
+
+
+# Run through `run_sync` with the table name as an argument, so each
+# inspection reads the table of its own loop iteration
+def _get_columns(connection: Connection, table_name: str) -> List[Any]:
+    return inspect(connection).get_columns(table_name)
+
+
+def _get_indexes(connection: Connection, table_name: str) -> List[Any]:
+    return inspect(connection).get_indexes(table_name)
+
+
+def _has_table(connection: Connection, table_name: str) -> bool:
+    return inspect(connection).has_table(table_name)
+
+
+async def migrate_datapoint_uuids(batch_size: int = 1000) -> int:
+    """
+    Replace the UUIDs of datapoints that are not UUIDv7 with ones
+    derived from their timestamp, so every datapoint sorts by time and
+    can be located by its UUID alone.
+
+    Rows are rewritten in transactions of at most `batch_size`, so the
+    migration can run against a live database and be resumed if it is
+    interrupted. Readings that have already been archived or compacted
+    into chunks are not affected. Run `migrate_datapoint_timestamps`
+    first on databases created before timestamps were stored as epoch
+    microseconds.
+
+    Returns the number of datapoints migrated.
+    """
+    migrated = 0
+
+    async with sessionmanager.session() as session:
+        tables = await partitions.existing(session)
+
+    for table in tables:
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("row_id"))
+            .values(uuid=bindparam("new_uuid"))
+        )
+        last_id = 0
+        while True:
+            async with sessionmanager.session() as session:
+                result = await session.execute(
+                    select(table.c.id, table.c.uuid, table.c.timestamp)
+                    .where(table.c.id > last_id)
+                    .order_by(table.c.id)
+                    .limit(batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+
+                params: List[Dict[str, Any]] = [
+                    {"row_id": row_id, "new_uuid": uuid7(timestamp)}
+                    for row_id, value, timestamp in rows
+                    if value.version != 7
+                ]
+                if params:
+                    await session.execute(stmt, params)
+                    await session.commit()
+
+            migrated += len(params)
+            last_id = rows[-1][0]
+            await asyncio.sleep(0)
+
+        log.info(f"Migrated {table.name}")
+
+    return migrated
+
+
+async def _alter_timestamp(table: Table) -> int:
+    """
+    Alter the `timestamp` column of `table` to epoch microseconds on
+    PostgreSQL, returning 1 if it was altered and 0 if it already was.
+    """
+    async with sessionmanager.connect() as connection:
+        columns = await connection.run_sync(_get_columns, table.name)
+        column = next(c for c in columns if c["name"] == "timestamp")
+        if isinstance(column["type"], BigInteger):
+            return 0
+        await connection.execute(
+            text(
+                f"ALTER TABLE {table.name} "
+                "ALTER COLUMN timestamp TYPE BIGINT "
+                "USING (EXTRACT(EPOCH FROM timestamp) * 1000000)::BIGINT"
+            )
+        )
+    return 1
+
+
+async def migrate_datapoint_timestamps(batch_size: int = 1000) -> int:
+    """
+    Convert datapoint timestamps stored as `DateTime` into the epoch
+    microsecond integers written by `EpochMicroseconds`.
+
+    On PostgreSQL each table's column is altered in place. SQLite does
+    not enforce column types, so there the rows still holding text are
+    rewritten in transactions of at most `batch_size`. Running the
+    migration again is a no-op.
+
+    Returns the number of datapoints migrated, or of tables altered on
+    PostgreSQL.
+    """
+    migrated = 0
+
+    async with sessionmanager.session() as session:
+        tables = await partitions.existing(session)
+        postgres = dialect_name(session) == "postgresql"
+
+    for table in tables:
+        if postgres:
+            migrated += await _alter_timestamp(table)
+            continue
+
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("row_id"))
+            .values(timestamp=bindparam("epoch_us"))
+        )
+        while True:
+            async with sessionmanager.session() as session:
+                result = await session.execute(
+                    select(table.c.id, type_coerce(table.c.timestamp, String))
+                    .where(func.typeof(table.c.timestamp) != "integer")
+                    .limit(batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+
+                await session.execute(
+                    stmt,
+                    [
+                        {
+                            "row_id": row_id,
+                            "epoch_us": to_epoch_us(
+                                datetime.datetime.fromisoformat(value)
+                            ),
+                        }
+                        for row_id, value in rows
+                    ],
+                )
+                await session.commit()
+
+            migrated += len(rows)
+            await asyncio.sleep(0)
+
+        log.info(f"Migrated {table.name}")
+
+    return migrated
+
+
+async def migrate_datapoint_lookups() -> int:
+    """
+    Move datapoint sensor and unit names into the `sensors` and `units`
+    lookup tables, replacing the `sensor` and `val_units` columns with
+    `sensor_id` and `units_id`.
+
+    Each table is altered in place in its own transaction: the names
+    are interned, the id columns added and filled from the lookup
+    tables, and the indexes over the old columns rebuilt over the new
+    ones. Tables that already have `sensor_id` are skipped, so running
+    the migration again is a no-op. Dropping the old columns needs
+    SQLite 3.35 or later.
+
+    Returns the number of tables migrated.
+    """
+    migrated = 0
+
+    async with sessionmanager.session() as session:
+        tables = await partitions.existing(session)
+        postgres = dialect_name(session) == "postgresql"
+
+    for table in tables:
+        name = table.name
+        async with sessionmanager.connect() as connection:
+            columns = await connection.run_sync(_get_columns, name)
+            if any(c["name"] == "sensor_id" for c in columns):
+                continue
+
+            indexes = await connection.run_sync(_get_indexes, name)
+            for index in indexes:
+                if {"sensor", "val_units"} & set(index["column_names"]):
+                    await connection.execute(
+                        text(f"DROP INDEX {index['name']}")
+                    )
+
+            for lookup, column in (
+                ("sensors", "sensor"),
+                ("units", "val_units"),
+            ):
+                await connection.execute(
+                    text(
+                        f"INSERT INTO {lookup} (name) "
+                        f"SELECT DISTINCT {column} FROM {name} "
+                        f"WHERE {column} IS NOT NULL "
+                        f"AND {column} NOT IN (SELECT name FROM {lookup})"
+                    )
+                )
+
+            await connection.execute(
+                text(
+                    f"ALTER TABLE {name} "
+                    "ADD COLUMN sensor_id INTEGER REFERENCES sensors (id)"
+                )
+            )
+            await connection.execute(
+                text(
+                    f"ALTER TABLE {name} "
+                    "ADD COLUMN units_id INTEGER REFERENCES units (id)"
+                )
+            )
+            await connection.execute(
+                text(
+                    f"UPDATE {name} SET "
+                    "sensor_id = (SELECT id FROM sensors "
+                    f"WHERE sensors.name = {name}.sensor), "
+                    "units_id = (SELECT id FROM units "
+                    f"WHERE units.name = {name}.val_units)"
+                )
+            )
+            if postgres:
+                await connection.execute(
+                    text(
+                        f"ALTER TABLE {name} "
+                        "ALTER COLUMN sensor_id SET NOT NULL"
+                    )
+                )
+            await connection.execute(
+                text(f"ALTER TABLE {name} DROP COLUMN sensor")
+            )
+            await connection.execute(
+                text(f"ALTER TABLE {name} DROP COLUMN val_units")
+            )
+
+            for new_index in table.indexes:
+                if {"sensor_id", "units_id"} & set(new_index.columns.keys()):
+                    await connection.run_sync(new_index.create)
+
+        log.info(f"Migrated {name}")
+        migrated += 1
+
+    return migrated
+
+
+async def migrate_datapoint_text(batch_size: int = 1000) -> int:
+    """
+    Move datapoints with a string value out of `data_points` and its
+    partitions into `text_points`, leaving only numeric readings behind.
+
+    Rows are moved in transactions of at most `batch_size`. On
+    PostgreSQL the emptied `val_str` column and the old check constraint
+    are then dropped. SQLite cannot drop a column named in a check
+    constraint without rebuilding the table, so there the column is
+    left in place, empty. Run `migrate_datapoint_lookups` first.
+
+    Returns the number of datapoints moved.
+    """
+    migrated = 0
+    val_str: ColumnElement[str] = literal_column("val_str")
+    text_points = cast(Table, TextPoint.__table__)
+
+    async with sessionmanager.session() as session:
+        tables = await partitions.existing(session)
+        postgres = dialect_name(session) == "postgresql"
+
+    for table in tables:
+        async with sessionmanager.connect() as connection:
+            columns = await connection.run_sync(_get_columns, table.name)
+        if not any(c["name"] == "val_str" for c in columns):
+            continue
+
+        while True:
+            async with sessionmanager.session() as session:
+                result = await session.execute(
+                    select(
+                        table.c.id,
+                        table.c.uuid,
+                        table.c.device_uuid,
+                        table.c.timestamp,
+                        table.c.sensor_id,
+                        val_str,
+                        table.c.val_int,
+                        table.c.val_float,
+                        table.c.units_id,
+                    )
+                    .where(val_str.is_not(None))
+                    .limit(batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+
+                await session.execute(
+                    insert(text_points),
+                    [
+                        {k: v for k, v in row._mapping.items() if k != "id"}
+                        for row in rows
+                    ],
+                )
+                await session.execute(
+                    delete(table).where(table.c.id.in_(r[0] for r in rows))
+                )
+                await session.commit()
+
+            migrated += len(rows)
+            await asyncio.sleep(0)
+
+        if postgres:
+            async with sessionmanager.connect() as connection:
+                for statement in (
+                    "DROP CONSTRAINT IF EXISTS check_value_present",
+                    "DROP COLUMN val_str",
+                    (
+                        "ADD CONSTRAINT check_numeric_present CHECK "
+                        "((val_float IS NOT NULL) OR (val_int IS NOT NULL))"
+                    ),
+                ):
+                    await connection.execute(
+                        text(f"ALTER TABLE {table.name} {statement}")
+                    )
+
+        log.info(f"Migrated {table.name}")
+
+    return migrated
+
+
+async def _create_index(
+    connection: AsyncConnection, table: Table, name: str
+) -> bool:
+    """Create the model index `name` on `table` if it does not exist."""
+    index = next(i for i in table.indexes if i.name == name)
+    indexes = await connection.run_sync(_get_indexes, table.name)
+    if any(i["name"] == name for i in indexes):
+        return False
+    await connection.run_sync(index.create)
+    return True
+
+
+async def migrate_device_listing() -> int:
+    """
+    Create the `devices` name index and the `table_versions` and
+    `device_status` tables used to page through, filter, annotate and
+    conditionally serve the device list.
+
+    Each is created only if missing, so running the migration again is
+    a no-op. The device list version starts counting from the next
+    change to the devices table.
+
+    Returns the number of objects created.
+    """
+    created = 0
+
+    async with sessionmanager.connect() as connection:
+        if await _create_index(
+            connection, cast(Table, Device.__table__), "ix_devices_name"
+        ):
+            created += 1
+
+        for table in (TableVersion.__table__, DeviceStatus.__table__):
+            table = cast(Table, table)
+            if not await connection.run_sync(_has_table, table.name):
+                await connection.run_sync(table.create)
+                created += 1
+
+    log.info("Migrated devices")
+    return created
+
+
+async def migrate_rollup_sensor_index() -> int:
+    """
+    Create the rollup index led by the sensor, used to aggregate one
+    sensor across many devices. Running the migration again is a no-op.
+
+    Returns the number of indexes created.
+    """
+    async with sessionmanager.connect() as connection:
+        created = await _create_index(
+            connection,
+            cast(Table, DataPointRollup.__table__),
+            "idx_rollup_sensor_bucket",
+        )
+
+    log.info("Migrated data_point_rollups")
+    return int(created)
+
+
+# Columns holding seconds since the epoch, widened so they do not
+# overflow a 32 bit integer in 2038
+EPOCH_SECOND_COLUMNS = (
+    ("data_point_rollups", "bucket_start"),
+    ("series_chunks", "chunk_start"),
+)
+
+
+async def migrate_epoch_second_columns() -> int:
+    """
+    Widen the columns in `EPOCH_SECOND_COLUMNS` to 64 bit integers on
+    PostgreSQL. SQLite integers are already 64 bit, so nothing changes
+    there. Running the migration again is a no-op.
+
+    Returns the number of columns widened.
+    """
+    widened = 0
+
+    async with sessionmanager.connect() as connection:
+        if connection.dialect.name != "postgresql":
+            return 0
+
+        for table_name, column_name in EPOCH_SECOND_COLUMNS:
+            columns = await connection.run_sync(_get_columns, table_name)
+            column = next(c for c in columns if c["name"] == column_name)
+            if isinstance(column["type"], BigInteger):
+                continue
+            await connection.execute(
+                text(
+                    f"ALTER TABLE {table_name} "
+                    f"ALTER COLUMN {column_name} TYPE BIGINT"
+                )
+            )
+            widened += 1
+
+    log.info(f"Widened {widened} epoch second columns")
+    return widened
+
+
+async def migrate_latest_timestamps() -> int:
+    """
+    Convert latest value timestamps stored as `DateTime` into epoch
+    microseconds, as `migrate_datapoint_timestamps` does for datapoints.
+    The table holds one row per device and sensor, so on SQLite the
+    rows still holding text are rewritten in one transaction. Running
+    the migration again is a no-op.
+
+    Returns the number of latest values migrated, or 1 if the column
+    was altered on PostgreSQL.
+    """
+    table = cast(Table, LatestValue.__table__)
+
+    async with sessionmanager.session() as session:
+        if dialect_name(session) == "postgresql":
+            return await _alter_timestamp(table)
+
+        result = await session.execute(
+            select(
+                table.c.device_uuid,
+                table.c.sensor,
+                type_coerce(table.c.timestamp, String),
+            ).where(func.typeof(table.c.timestamp) != "integer")
+        )
+        rows = result.all()
+        if rows:
+            await session.execute(
+                update(table)
+                .where(
+                    table.c.device_uuid == bindparam("row_device"),
+                    table.c.sensor == bindparam("row_sensor"),
+                )
+                .values(timestamp=bindparam("epoch_us")),
+                [
+                    {
+                        "row_device": device_uuid,
+                        "row_sensor": sensor,
+                        "epoch_us": to_epoch_us(
+                            datetime.datetime.fromisoformat(value)
+                        ),
+                    }
+                    for device_uuid, sensor, value in rows
+                ],
+            )
+            await session.commit()
+
+    log.info(f"Migrated {len(rows)} latest values")
+    return len(rows)
+
+
+MIGRATIONS = {
+    "uuid7": migrate_datapoint_uuids,
+    "epoch_us": migrate_datapoint_timestamps,
+    "latest_epoch_us": migrate_latest_timestamps,
+    "lookups": migrate_datapoint_lookups,
+    "text": migrate_datapoint_text,
+    "devices": migrate_device_listing,
+    "rollup_index": migrate_rollup_sensor_index,
+    "epoch_seconds": migrate_epoch_second_columns,
+}
+
+
+async def main(db_uri: str, name: str) -> None:
+    # Each shard is migrated as a database of its own
+    for uri in (db_uri, *env_uris("DATABASE_SHARD_URIS")):
+        await sessionmanager.init(uri)
+        count = await MIGRATIONS[name]()
+        log.info(f"Migrated {count} rows")
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a data migration")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+
+    args = parser.parse_args()
+
+    asyncio.run(
+        main(
+            os.getenv("DATABASE_URI", "sqlite+aiosqlite:///./dev.db"),
+            args.migration,
+        )
+    )
@@ -1,15 +1,21 @@
+import datetime
 from sqlalchemy import (
     String,
     Integer,
     Uuid,
     Index,
     ForeignKey,
-    DateTime,
     Float,
     CheckConstraint,
+    UniqueConstraint,
+    Boolean,
+    BigInteger,
+    LargeBinary,
+    Date,
 )
 from sqlalchemy.orm import Mapped, mapped_column
 from .base import Base
+from .types import EpochMicroseconds
 
 
 class Device(Base):
@@ -31,7 +37,7 @@ class Device(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     imei: Mapped[str] = mapped_column(String, unique=True, index=True)
     uuid: Mapped[str] = mapped_column(Uuid(), unique=True, index=True)
-    name: Mapped[str] = mapped_column(String)
+    name: Mapped[str] = mapped_column(String, index=True)
 
     def __repr__(self) -> str:
         return (
@@ -44,10 +50,56 @@ class Device(Base):
         )
 
 
+class Sensor(Base):
+    """
+    A sensor name reported by devices. Data points refer to sensors by
+    id so the name is stored once rather than on every row.
+
+    Latest values, rollups and chunks keep the name itself. They hold a
+    row per sensor, bucket or hour rather than per reading, so an id
+    would save little. Keeping the name also lets them be read without
+    a join. Names are never renamed or removed from this table, so the
+    two forms cannot drift apart.
+
+    Attributes:
+        id (int): The primary key of the sensor.
+        name (str): A short string identifier for the sensor or data
+            source (e.g., "gps_lat", "temp", "rs232_msg").
+    """
+
+    __tablename__ = "sensors"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(30), unique=True)
+
+    def __repr__(self) -> str:
+        return f"Sensor(id={self.id!r}, name={self.name!r})"
+
+
+class Unit(Base):
+    """
+    A unit of measurement reported by devices, stored once and referred
+    to by id from data points.
+
+    Attributes:
+        id (int): The primary key of the unit.
+        name (str): The unit (e.g., "degrees", "V", "ppm").
+    """
+
+    __tablename__ = "units"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String, unique=True)
+
+    def __repr__(self) -> str:
+        return f"Unit(id={self.id!r}, name={self.name!r})"
+
+
 class DataPoint(Base):
     """
-    Represents a single sensor reading or message reported by a SENSE
-    Core device.
+    Represents a single numeric sensor reading reported by a SENSE Core
+    device. Readings carrying a string value are stored as `TextPoint`s
+    instead, so this table stays narrow for numeric scans.
 
     Attributes:
         id (int): The primary key of the data point.
@@ -55,17 +107,14 @@ class DataPoint(Base):
         device_uuid (str): The UUID of the device that reported the
             data point.
         timestamp (datetime): The device-local timestamp when the data
-            was recorded.
-        sensor (str): A short string identifier for the sensor or data
-            source (e.g., "gps_lat", "temp", "rs232_msg").
+            was recorded, stored as epoch microseconds.
+        sensor_id (int): The `Sensor` the data point was reported by.
         val_int (float, optional): An integer value, if applicable
             for the sensor.
         val_float (float, optional): A decimal value, if applicable
             for the sensor.
-        val_str (str, optional): A string value, for cases like serial
-            input or textual messages.
-        val_units (str, optional): The unit of measurement for
-            `val_float`, if any (e.g., "degrees", "V", "ppm").
+        units_id (int, optional): The `Unit` of measurement for the
+            value, if any.
     """
 
     __tablename__ = "data_points"
@@ -77,25 +126,31 @@ class DataPoint(Base):
         ForeignKey("devices.uuid"), nullable=False
     )
 
-    sensor: Mapped[str] = mapped_column(String(30), nullable=False)
+    sensor_id: Mapped[int] = mapped_column(
+        ForeignKey("sensors.id"), nullable=False
+    )
 
-    timestamp: Mapped[DateTime] = mapped_column(
-        DateTime(timezone=True), nullable=False
+    timestamp: Mapped[datetime.datetime] = mapped_column(
+        EpochMicroseconds, nullable=False
     )
 
     val_int: Mapped[int] = mapped_column(Integer, nullable=True)
     val_float: Mapped[float] = mapped_column(Float, nullable=True)
-    val_str: Mapped[str] = mapped_column(String, nullable=True)
-    val_units: Mapped[str] = mapped_column(String, nullable=True)
+    units_id: Mapped[int] = mapped_column(
+        ForeignKey("units.id"), nullable=True
+    )
 
     __table_args__ = (
-        Index("idx_sensor_time", "sensor", "timestamp"),
-        Index("idx_device_sensor", "device_uuid", "sensor"),
+        Index("idx_sensor_time", "sensor_id", "timestamp"),
+        Index("idx_device_sensor", "device_uuid", "sensor_id"),
+        # Rows arrive roughly in time order, so on PostgreSQL a BRIN
+        # index serves time range scans at a fraction of a B-tree's size
+        Index("idx_time_brin", "timestamp", postgresql_using="brin").ddl_if(
+            dialect="postgresql"
+        ),
         CheckConstraint(
-            "(val_float IS NOT NULL) OR "
-            "(val_str IS NOT NULL) OR "
-            "(val_int IS NOT NULL)",
-            name="check_value_present",
+            "(val_float IS NOT NULL) OR (val_int IS NOT NULL)",
+            name="check_numeric_present",
         ),
     )
 
@@ -105,11 +160,320 @@ class DataPoint(Base):
             f"  id={self.id!r}),\n"
             f"  uuid={self.uuid!r}\n"
             f"  device_uuid={self.device_uuid!r}\n"
-            f"  sensor={self.sensor!r}\n"
+            f"  sensor_id={self.sensor_id!r}\n"
             f"  timestamp={self.timestamp!r}\n"
             f"  val_int={self.val_float!r}\n"
             f"  val_float={self.val_float!r}\n"
+            f"  units_id={self.units_id!r}\n"
+            f")"
+        )
+
+
+class TextPoint(Base):
+    """
+    Represents a sensor reading with a string value, such as serial
+    input or a textual message. Text readings are rare next to numeric
+    ones and are kept in a single table, apart from `data_points`.
+
+    Attributes:
+        id (int): The primary key of the text point.
+        uuid (str): A globally unique identifier for the text point.
+        device_uuid (str): The UUID of the device that reported the
+            text point.
+        timestamp (datetime): The device-local timestamp when the data
+            was recorded, stored as epoch microseconds.
+        sensor_id (int): The `Sensor` the text point was reported by.
+        val_str (str): The string value.
+        val_int (int, optional): An integer value, for the odd reading
+            that carries both.
+        val_float (float, optional): A decimal value, for the odd
+            reading that carries both.
+        units_id (int, optional): The `Unit` of measurement for the
+            value, if any.
+    """
+
+    __tablename__ = "text_points"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    uuid: Mapped[str] = mapped_column(Uuid(), unique=True)
+
+    device_uuid: Mapped[str] = mapped_column(
+        ForeignKey("devices.uuid"), nullable=False
+    )
+
+    sensor_id: Mapped[int] = mapped_column(
+        ForeignKey("sensors.id"), nullable=False
+    )
+
+    timestamp: Mapped[datetime.datetime] = mapped_column(
+        EpochMicroseconds, nullable=False
+    )
+
+    val_str: Mapped[str] = mapped_column(String, nullable=False)
+    val_int: Mapped[int] = mapped_column(Integer, nullable=True)
+    val_float: Mapped[float] = mapped_column(Float, nullable=True)
+    units_id: Mapped[int] = mapped_column(
+        ForeignKey("units.id"), nullable=True
+    )
+
+    __table_args__ = (
+        Index("idx_text_device_time", "device_uuid", "timestamp"),
+        Index("idx_text_time", "timestamp"),
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"TextPoint(\n"
+            f"  id={self.id!r}),\n"
+            f"  uuid={self.uuid!r}\n"
+            f"  device_uuid={self.device_uuid!r}\n"
+            f"  sensor_id={self.sensor_id!r}\n"
+            f"  timestamp={self.timestamp!r}\n"
+            f"  val_str={self.val_str!r}\n"
+            f"  units_id={self.units_id!r}\n"
+            f")"
+        )
+
+
+class DataPointRollup(Base):
+    """
+    Pre-aggregated numeric readings for a single device, sensor and
+    time bucket. Rollups are maintained incrementally on ingest and can
+    be rebuilt from `data_points` with `backfill_rollups`.
+
+    Attributes:
+        id (int): The primary key of the rollup.
+        device_uuid (str): The UUID of the device that reported the
+            readings.
+        sensor (str): The sensor the readings belong to.
+        resolution (int): The width of the bucket in seconds.
+        bucket_start (int): The start of the bucket in seconds since the
+            Unix epoch, aligned to `resolution`.
+        count (int): The number of numeric readings in the bucket.
+        sum (float): The sum of the readings in the bucket.
+        min (float): The smallest reading in the bucket.
+        max (float): The largest reading in the bucket.
+    """
+
+    __tablename__ = "data_point_rollups"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    device_uuid: Mapped[str] = mapped_column(
+        ForeignKey("devices.uuid"), nullable=False
+    )
+    sensor: Mapped[str] = mapped_column(String(30), nullable=False)
+    resolution: Mapped[int] = mapped_column(Integer, nullable=False)
+    bucket_start: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    sum: Mapped[float] = mapped_column(Float, nullable=False)
+    min: Mapped[float] = mapped_column(Float, nullable=False)
+    max: Mapped[float] = mapped_column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "device_uuid",
+            "sensor",
+            "resolution",
+            "bucket_start",
+            name="uq_rollup_bucket",
+        ),
+        # Serves queries for one sensor across many devices
+        Index(
+            "idx_rollup_sensor_bucket", "sensor", "resolution", "bucket_start"
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"DataPointRollup(\n"
+            f"  device_uuid={self.device_uuid!r}\n"
+            f"  sensor={self.sensor!r}\n"
+            f"  resolution={self.resolution!r}\n"
+            f"  bucket_start={self.bucket_start!r}\n"
+            f"  count={self.count!r}\n"
+            f"  sum={self.sum!r}\n"
+            f"  min={self.min!r}\n"
+            f"  max={self.max!r}\n"
+            f")"
+        )
+
+
+class LatestValue(Base):
+    """
+    The most recent reading for each sensor of each device, maintained
+    on ingest so that current values can be read without touching
+    `data_points`.
+
+    Attributes:
+        device_uuid (str): The UUID of the device that reported the
+            reading.
+        sensor (str): The sensor the reading belongs to.
+        timestamp (datetime): The device-local timestamp of the reading.
+        val_int (int, optional): The integer value of the reading.
+        val_float (float, optional): The decimal value of the reading.
+        val_str (str, optional): The string value of the reading.
+        val_units (str, optional): The units of the reading.
+    """
+
+    __tablename__ = "latest_values"
+
+    device_uuid: Mapped[str] = mapped_column(
+        ForeignKey("devices.uuid"), primary_key=True
+    )
+    sensor: Mapped[str] = mapped_column(String(30), primary_key=True)
+
+    timestamp: Mapped[datetime.datetime] = mapped_column(
+        EpochMicroseconds, nullable=False
+    )
+
+    val_int: Mapped[int] = mapped_column(Integer, nullable=True)
+    val_float: Mapped[float] = mapped_column(Float, nullable=True)
+    val_str: Mapped[str] = mapped_column(String, nullable=True)
+    val_units: Mapped[str] = mapped_column(String, nullable=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"LatestValue(\n"
+            f"  device_uuid={self.device_uuid!r}\n"
+            f"  sensor={self.sensor!r}\n"
+            f"  timestamp={self.timestamp!r}\n"
+            f"  val_int={self.val_int!r}\n"
+            f"  val_float={self.val_float!r}\n"
             f"  val_str={self.val_str!r}\n"
             f"  val_units={self.val_units!r}\n"
             f")"
         )
+
+
+class SeriesChunk(Base):
+    """
+    A compressed block of numeric readings for a single device, sensor
+    and hour. Dense sensors are compacted from `data_points` into chunks
+    by `compact_chunks`, which stores one row per hour instead of one
+    per reading.
+
+    Attributes:
+        id (int): The primary key of the chunk.
+        device_uuid (str): The UUID of the device that reported the
+            readings.
+        sensor (str): The sensor the readings belong to.
+        chunk_start (int): The start of the hour covered by the chunk in
+            seconds since the Unix epoch.
+        count (int): The number of readings in the chunk.
+        first_timestamp (int): The earliest reading in epoch
+            microseconds.
+        last_timestamp (int): The latest reading in epoch microseconds.
+        is_int (bool): Whether the readings were reported as integers.
+        val_units (str, optional): The units of the readings.
+        data (bytes): The encoded timestamps and values.
+    """
+
+    __tablename__ = "series_chunks"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    device_uuid: Mapped[str] = mapped_column(
+        ForeignKey("devices.uuid"), nullable=False
+    )
+    sensor: Mapped[str] = mapped_column(String(30), nullable=False)
+    chunk_start: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    first_timestamp: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    last_timestamp: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    is_int: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    val_units: Mapped[str] = mapped_column(String, nullable=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "device_uuid",
+            "sensor",
+            "chunk_start",
+            name="uq_series_chunk",
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"SeriesChunk(\n"
+            f"  device_uuid={self.device_uuid!r}\n"
+            f"  sensor={self.sensor!r}\n"
+            f"  chunk_start={self.chunk_start!r}\n"
+            f"  count={self.count!r}\n"
+            f"  is_int={self.is_int!r}\n"
+            f"  val_units={self.val_units!r}\n"
+            f")"
+        )
+
+
+class TableVersion(Base):
+    """
+    A change counter for a table whose contents are served to polling
+    clients. The version is bumped in the same transaction as every
+    change, so it can be used as an HTTP validator without reading the
+    table itself.
+
+    Attributes:
+        table_name (str): The name of the versioned table.
+        version (int): Incremented on every change to the table.
+        modified (datetime): When the table was last changed, stored as
+            epoch microseconds.
+    """
+
+    __tablename__ = "table_versions"
+
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    modified: Mapped[datetime.datetime] = mapped_column(
+        EpochMicroseconds, nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"TableVersion(table_name={self.table_name!r}, "
+            f"version={self.version!r}, modified={self.modified!r})"
+        )
+
+
+class DeviceStatus(Base):
+    """
+    Recent activity of a single device, tracked in memory by the CoAP
+    server and flushed here periodically so it can be shown without
+    scanning readings.
+
+    Attributes:
+        device_uuid (str): The UUID of the device.
+        last_seen (datetime): When the server last heard from the
+            device, stored as epoch microseconds.
+        readings_day (date): The UTC day `readings_today` counts for.
+        readings_today (int): The number of readings received on
+            `readings_day`.
+        last_signal (float, optional): The latest value reported by the
+            device's signal strength sensor, if it has one.
+    """
+
+    __tablename__ = "device_status"
+
+    device_uuid: Mapped[str] = mapped_column(
+        ForeignKey("devices.uuid"), primary_key=True
+    )
+    last_seen: Mapped[datetime.datetime] = mapped_column(
+        EpochMicroseconds, nullable=False
+    )
+    readings_day: Mapped[datetime.date] = mapped_column(Date, nullable=False)
+    readings_today: Mapped[int] = mapped_column(Integer, nullable=False)
+    last_signal: Mapped[float] = mapped_column(Float, nullable=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"DeviceStatus(\n"
+            f"  device_uuid={self.device_uuid!r}\n"
+            f"  last_seen={self.last_seen!r}\n"
+            f"  readings_day={self.readings_day!r}\n"
+            f"  readings_today={self.readings_today!r}\n"
+            f"  last_signal={self.last_signal!r}\n"
+            f")"
+        )
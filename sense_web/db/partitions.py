@@ -0,0 +1,230 @@
+import datetime
+import time
+import weakref
+from typing import Dict, List, Set, Tuple, cast
+
+from sqlalchemy import Connection, Engine, MetaData, Table, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable, DropTable
+from sqlalchemy.sql.elements import quoted_name
+
+from .dialect import dialect_name, index_supported
+from .models import DataPoint, Device, Sensor, TextPoint, Unit
+
+PARTITION_PREFIX = "data_points_"
+
+# Session info key of the partitions created or dropped in a
+# transaction
+_PENDING = "pending_partitions"
+
+# Seconds a process keeps using its list of partitions before reading
+# it again, so that partitions created by other processes are seen
+PARTITION_LIST_TTL = 30.0
+
+DATA_POINTS = cast(Table, DataPoint.__table__)
+TEXT_POINTS = cast(Table, TextPoint.__table__)
+
+
+def partition_name(timestamp: datetime.datetime) -> str:
+    """Return the name of the monthly partition holding `timestamp`."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.UTC)
+    return f"{PARTITION_PREFIX}{timestamp:%Y%m}"
+
+
+def is_partition(name: str) -> bool:
+    suffix = name.removeprefix(PARTITION_PREFIX)
+    return name.startswith(PARTITION_PREFIX) and (
+        len(suffix) == 6 and suffix.isdigit()
+    )
+
+
+def partition_bounds(
+    name: str,
+) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Return the `[start, end)` range of timestamps held by `name`."""
+    suffix = name.removeprefix(PARTITION_PREFIX)
+    year, month = int(suffix[:4]), int(suffix[4:])
+    start = datetime.datetime(year, month, 1, tzinfo=datetime.UTC)
+    if month == 12:
+        end = start.replace(year=year + 1, month=1)
+    else:
+        end = start.replace(month=month + 1)
+    return start, end
+
+
+def list_partitions(connection: Connection) -> List[str]:
+    return sorted(
+        name
+        for name in inspect(connection).get_table_names()
+        if is_partition(name)
+    )
+
+
+def drop_partitions(connection: Connection) -> None:
+    for name in list_partitions(connection):
+        connection.execute(DropTable(partitions.table(name)))
+
+
+class PartitionManager:
+    """
+    Routes datapoints to monthly partition tables.
+
+    Each partition is a copy of the `data_points` table named
+    `data_points_YYYYMM`, holding the readings with a timestamp in that
+    (UTC) month. The original `data_points` table is always read as
+    well, so rows written before partitioning was enabled stay visible.
+
+    Use `init()` to enable or disable partitioning. While it is enabled,
+    reads include every partition that can overlap the requested range.
+    The list of partitions is cached per engine, updated as this process
+    creates and drops partitions, and read again every
+    `PARTITION_LIST_TTL` seconds to pick up those of other processes.
+    While partitioning is disabled only `data_points` is read, without
+    looking for partitions at all.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._metadata = MetaData()
+        for model in (Device, Sensor, Unit):
+            cast(Table, model.__table__).to_metadata(self._metadata)
+        self._tables: Dict[str, Table] = {}
+        # Partitions of open months known to exist, per engine
+        self._created: weakref.WeakKeyDictionary[Engine, Set[str]] = (
+            weakref.WeakKeyDictionary()
+        )
+        # Partition names and when they were listed, per engine
+        self._listed: weakref.WeakKeyDictionary[
+            Engine, Tuple[float, List[str]]
+        ] = weakref.WeakKeyDictionary()
+
+    def init(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self._created = weakref.WeakKeyDictionary()
+        self._listed = weakref.WeakKeyDictionary()
+
+    def table(self, name: str) -> Table:
+        table = self._tables.get(name)
+        if table is None:
+            table = DATA_POINTS.to_metadata(self._metadata, name=name)
+            for index in table.indexes:
+                # SQLite index names are global, so give each partition
+                # its own copy of the named indexes.
+                if index.name and not index.name.startswith(name):
+                    index.name = quoted_name(f"{name}_{index.name}", None)
+            self._tables[name] = table
+        return table
+
+    async def table_for(
+        self, session: AsyncSession, timestamp: datetime.datetime
+    ) -> Table:
+        """
+        Return the table a reading taken at `timestamp` is written to,
+        creating its partition if needed.
+        """
+        if not self.enabled:
+            return DATA_POINTS
+
+        name = partition_name(timestamp)
+        table = self.table(name)
+
+        created = self._created.get(session.get_bind().engine, set())
+        pending: Set[str] = session.info.setdefault(_PENDING, set())
+        if name not in created and name not in pending:
+            await session.execute(CreateTable(table, if_not_exists=True))
+            for index in table.indexes:
+                if index_supported(index, dialect_name(session)):
+                    await session.execute(
+                        CreateIndex(index, if_not_exists=True)
+                    )
+            pending.add(name)
+
+        return table
+
+    async def partition_names(self, session: AsyncSession) -> List[str]:
+        return await session.run_sync(
+            lambda s: list_partitions(s.connection())
+        )
+
+    async def tables(
+        self,
+        session: AsyncSession,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+        text: bool = False,
+    ) -> List[Table]:
+        """
+        Return every table that may hold numeric readings in
+        `[start, end)`, followed by `text_points` if `text` is set.
+
+        Partitions whose month cannot overlap the range are skipped.
+        """
+        tables: List[Table] = [DATA_POINTS]
+        if self.enabled:
+            if start is not None and start.tzinfo is None:
+                start = start.replace(tzinfo=datetime.UTC)
+            if end is not None and end.tzinfo is None:
+                end = end.replace(tzinfo=datetime.UTC)
+
+            for name in await self._cached_names(session):
+                lo, hi = partition_bounds(name)
+                if start is not None and hi <= start:
+                    continue
+                if end is not None and lo >= end:
+                    continue
+                tables.append(self.table(name))
+        if text:
+            tables.append(TEXT_POINTS)
+        return tables
+
+    async def existing(self, session: AsyncSession) -> List[Table]:
+        """
+        Return `data_points` and every partition in the database,
+        whether or not partitioning is enabled, as read from the
+        database itself.
+        """
+        return [
+            DATA_POINTS,
+            *map(self.table, await self.partition_names(session)),
+        ]
+
+    async def _cached_names(self, session: AsyncSession) -> List[str]:
+        engine = session.get_bind().engine
+        listed = self._listed.get(engine)
+        if listed is None or listed[0] <= time.monotonic():
+            names = await self.partition_names(session)
+            listed = (time.monotonic() + PARTITION_LIST_TTL, names)
+            self._listed[engine] = listed
+        return listed[1]
+
+    async def drop(self, session: AsyncSession, name: str) -> None:
+        """Drop a whole partition. The caller owns the transaction."""
+        await session.execute(DropTable(self.table(name), if_exists=True))
+        created = self._created.get(session.get_bind().engine)
+        if created is not None:
+            created.discard(name)
+        session.info.setdefault(_PENDING, set())
+
+    def _after_commit(self, session: Session) -> None:
+        pending = session.info.pop(_PENDING, None)
+        if pending is None:
+            return
+
+        # Partitions of closed months may be archived or dropped by
+        # another process, so they are only remembered while their
+        # month is open and are created again on every late write
+        now = datetime.datetime.now(datetime.UTC)
+        created = self._created.setdefault(session.get_bind().engine, set())
+        created.update(n for n in pending if partition_bounds(n)[1] > now)
+        self._listed.clear()
+
+    def _after_rollback(self, session: Session) -> None:
+        session.info.pop(_PENDING, None)
+
+
+partitions = PartitionManager()
+
+event.listen(Session, "after_commit", partitions._after_commit)
+event.listen(Session, "after_rollback", partitions._after_rollback)
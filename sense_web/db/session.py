@@ -1,6 +1,21 @@
+import asyncio
 import contextlib
+import hashlib
+import math
 import os
-from typing import AsyncIterator
+import time
+import uuid
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Sequence,
+    TypeVar,
+)
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
     AsyncEngine,
@@ -9,10 +24,107 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 from .base import Base
+from .partitions import drop_partitions
 import logging as log
 
 log.basicConfig(level=log.INFO)
 
+T = TypeVar("T")
+
+
+def env_uris(name: str) -> List[str]:
+    """Read a comma separated list of database URIs from the environment."""
+    return [s.strip() for s in os.getenv(name, "").split(",") if s.strip()]
+
+
+# Set on every connection to a file-backed SQLite database
+SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # KiB
+    "mmap_size": 256 * 1024 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+# Connections kept open for read-only sessions on SQLite
+SQLITE_READERS = 4
+
+# Seconds after a write during which reads go to the primary
+READ_YOUR_WRITES = 2.0
+
+# Compiled statements kept per engine. Reads over partitions compile a
+# statement per combination of tables and filters, so this is larger
+# than SQLAlchemy's default of 500.
+QUERY_CACHE_SIZE = 2000
+
+# Engine options for PostgreSQL. Connections are checked before use so
+# that a failover or idle timeout does not surface as a failed request.
+# The pool is otherwise left at SQLAlchemy's defaults; larger pools made
+# no measurable difference in benchmarks/postgres_profile.py.
+POSTGRES_POOL = {
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+}
+
+# Sent by asyncpg on connect. JIT compilation only pays off for long
+# analytical queries. Without statistics, as for a freshly filled
+# partition, the planner overestimates range scans and compiles them,
+# which halved their throughput in benchmarks/postgres_profile.py.
+ASYNCPG_SETTINGS = {"jit": "off", "application_name": "sense-web"}
+
+
+def _sqlite_path(db_uri: str) -> str | None:
+    if not db_uri.startswith("sqlite+aiosqlite:///"):
+        return None
+    path = db_uri.split(":///")[-1]
+    return None if path == ":memory:" else path
+
+
+def _is_postgres(db_uri: str) -> bool:
+    return db_uri.startswith(("postgresql:", "postgresql+"))
+
+
+def _create_engine(
+    db_uri: str, query_cache_size: int, postgres_profile: bool = True
+) -> AsyncEngine:
+    if not (_is_postgres(db_uri) and postgres_profile):
+        return create_async_engine(db_uri, query_cache_size=query_cache_size)
+    options: Dict[str, Any] = dict(POSTGRES_POOL)
+    if db_uri.startswith("postgresql+asyncpg:"):
+        options["connect_args"] = {"server_settings": ASYNCPG_SETTINGS}
+    return create_async_engine(
+        db_uri, query_cache_size=query_cache_size, **options
+    )
+
+
+def _reader_engine(
+    db_uri: str, query_cache_size: int, postgres_profile: bool = True
+) -> AsyncEngine:
+    if _sqlite_path(db_uri) is None:
+        return _create_engine(db_uri, query_cache_size, postgres_profile)
+    engine = create_async_engine(
+        db_uri,
+        pool_size=SQLITE_READERS,
+        max_overflow=0,
+        query_cache_size=query_cache_size,
+    )
+    event.listen(engine.sync_engine, "connect", _sqlite_pragmas(True))
+    return engine
+
+
+def _sqlite_pragmas(readonly: bool) -> Callable[[Any, Any], None]:
+    def on_connect(dbapi_connection: Any, _: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        if readonly:
+            cursor.execute("PRAGMA query_only=ON")
+        else:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return on_connect
+
 
 class DatabaseSessionManager:
     """
@@ -22,33 +134,184 @@ class DatabaseSessionManager:
     Use `init()` to initialise the engine and sessionmaker. Use
     `session()` to get an async session context manager. Use `connect()`
     if you need direct access to a lower-level connection.
+
+    File-backed SQLite databases get a profile suited to one process
+    writing while others read: the database is put in WAL mode and
+    every connection is tuned with `SQLITE_PRAGMAS`. Writes go through
+    a single pooled connection, so writers in a process queue for it
+    rather than contending for the database lock, and sessions opened
+    with `readonly` use a separate pool of query-only connections that
+    WAL lets run alongside the writer.
+
+    PostgreSQL engines use the pool settings in `POSTGRES_POOL`, unless
+    `postgres_profile` is off, and missing tables are created on
+    `init()`.
+
+    When replica URIs are given, `readonly` sessions are spread across
+    the replicas instead. Replicas may lag the primary, so for
+    `read_your_writes` seconds after this process last opened a
+    session that may write, `readonly` sessions go to the primary and
+    see what it wrote.
+
+    When shard URIs are given, readings are spread across the shards by
+    a hash of their device's UUID. Pass `device` to `session()` to
+    reach the shard holding a device's readings, or `shard` to pick one
+    of `shards` directly; sessions with neither go to the main
+    database, which keeps everything that is not per device. Work over
+    the whole fleet runs on every shard concurrently with `fan_out()`.
+    Each shard gets the SQLite or PostgreSQL profile of its own URI.
+
+    Every engine caches up to `query_cache_size` compiled statements, so
+    services that reuse statements with bound parameters skip compiling
+    SQL after the first call.
     """
 
     def __init__(self) -> None:
         self._engine: AsyncEngine | None = None
         self._sessionmaker: async_sessionmaker[AsyncSession] | None = None
+        self._readers: List[AsyncEngine] = []
+        self._reader_sessionmakers: List[async_sessionmaker[AsyncSession]] = []
+        self._replicated = False
+        self._read_your_writes = 0.0
+        self._last_write = -math.inf
+        self._next_reader = 0
+        self._shards: List[DatabaseSessionManager] = []
+
+    async def init(
+        self,
+        db_uri: str,
+        replica_uris: Sequence[str] = (),
+        read_your_writes: float = READ_YOUR_WRITES,
+        sqlite_profile: bool = True,
+        shard_uris: Sequence[str] = (),
+        postgres_profile: bool = True,
+        query_cache_size: int = QUERY_CACHE_SIZE,
+    ) -> None:
+        path = _sqlite_path(db_uri)
+        profile = path is not None and sqlite_profile
+        if profile:
+            self._engine = create_async_engine(
+                db_uri,
+                pool_size=1,
+                max_overflow=0,
+                query_cache_size=query_cache_size,
+            )
+            event.listen(
+                self._engine.sync_engine, "connect", _sqlite_pragmas(False)
+            )
+        else:
+            self._engine = _create_engine(
+                db_uri, query_cache_size, postgres_profile
+            )
+
+        if replica_uris:
+            self._readers = [
+                _reader_engine(uri, query_cache_size, postgres_profile)
+                for uri in replica_uris
+            ]
+        elif profile:
+            self._readers = [_reader_engine(db_uri, query_cache_size)]
+        else:
+            self._readers = []
 
-    async def init(self, db_uri: str) -> None:
-        self._engine = create_async_engine(db_uri)
         self._sessionmaker = async_sessionmaker(
             autocommit=False, bind=self._engine
         )
+        self._reader_sessionmakers = [
+            async_sessionmaker(autocommit=False, bind=reader)
+            for reader in self._readers
+        ]
+        self._replicated = bool(replica_uris)
+        self._read_your_writes = read_your_writes
+        self._last_write = -math.inf
+
+        if path is not None or _is_postgres(db_uri):
+            if path is not None and not os.path.exists(path):
+                log.info(f"Creating database: {path}")
+            # Only creates the tables that are missing, so databases
+            # created by earlier versions gain the tables added since.
+            # Changes to existing tables are left to the migrations.
+            async with self.connect() as connection:
+                await self.create_all(connection)
 
-        if db_uri.startswith("sqlite+aiosqlite:///"):
-            path = db_uri.split(":///")[-1]
-            if not os.path.exists(path) and not path == ":memory:":
-                async with self.connect() as connection:
-                    log.info(f"Creating database: {path}")
-                    await self.create_all(connection)
+        self._shards = []
+        for shard_uri in shard_uris:
+            shard = DatabaseSessionManager()
+            await shard.init(
+                shard_uri,
+                sqlite_profile=sqlite_profile,
+                query_cache_size=query_cache_size,
+                postgres_profile=postgres_profile,
+            )
+            self._shards.append(shard)
 
     async def close(self) -> None:
+        for shard in self._shards:
+            await shard.close()
+        self._shards = []
         if self._engine is not None:
             await self._engine.dispose()
             self._engine = None
+        for reader in self._readers:
+            await reader.dispose()
+        self._readers = []
         self._sessionmaker = None
+        self._reader_sessionmakers = []
+
+    def _readonly_sessionmaker(
+        self,
+    ) -> async_sessionmaker[AsyncSession] | None:
+        if not self._reader_sessionmakers:
+            return self._sessionmaker
+        if self._replicated and (
+            time.monotonic() - self._last_write < self._read_your_writes
+        ):
+            return self._sessionmaker
+
+        index = self._next_reader % len(self._reader_sessionmakers)
+        self._next_reader = index + 1
+        return self._reader_sessionmakers[index]
+
+    @property
+    def shards(self) -> List[int | None]:
+        """
+        The shards to visit for work over the whole fleet, or `[None]`
+        for just the main database when readings are not sharded.
+        """
+        return list(range(len(self._shards))) or [None]
+
+    def shard_for(self, device_uuid: uuid.UUID) -> int | None:
+        """Return the shard holding a device's readings, if sharded."""
+        if not self._shards:
+            return None
+        digest = hashlib.blake2b(device_uuid.bytes, digest_size=8).digest()
+        return int.from_bytes(digest, "big") % len(self._shards)
+
+    def _route(
+        self, device: uuid.UUID | None, shard: int | None
+    ) -> "DatabaseSessionManager":
+        if device is not None:
+            shard = self.shard_for(device)
+        return self if shard is None else self._shards[shard]
+
+    async def fan_out(
+        self, fn: Callable[[int | None], Awaitable[T]]
+    ) -> List[T]:
+        """
+        Call `fn` with each of `shards` concurrently and return the
+        results in shard order.
+        """
+        return list(await asyncio.gather(*(fn(s) for s in self.shards)))
 
     @contextlib.asynccontextmanager
-    async def connect(self) -> AsyncIterator[AsyncConnection]:
+    async def connect(
+        self, shard: int | None = None
+    ) -> AsyncIterator[AsyncConnection]:
+        if shard is not None:
+            async with self._shards[shard].connect() as connection:
+                yield connection
+            return
+
         if self._engine is None:
             raise Exception("DatabaseSessionManager is not initialised")
 
@@ -58,13 +321,35 @@ class DatabaseSessionManager:
             except Exception:
                 await connection.rollback()
                 raise
+            finally:
+                self._last_write = time.monotonic()
 
     @contextlib.asynccontextmanager
-    async def session(self) -> AsyncIterator[AsyncSession]:
-        if self._sessionmaker is None:
+    async def session(
+        self,
+        readonly: bool = False,
+        device: uuid.UUID | None = None,
+        shard: int | None = None,
+    ) -> AsyncIterator[AsyncSession]:
+        """
+        Open a session. Pass `readonly` for sessions that only read, so
+        that they can be served by a replica, and on SQLite do not wait
+        on the writer connection. Pass `device` or `shard` to open it on
+        a shard.
+        """
+        target = self._route(device, shard)
+        if target is not self:
+            async with target.session(readonly) as session:
+                yield session
+            return
+
+        sessionmaker = (
+            self._readonly_sessionmaker() if readonly else self._sessionmaker
+        )
+        if sessionmaker is None:
             raise Exception("DatabaseSessionManager is not initialised")
 
-        session = self._sessionmaker()
+        session = sessionmaker()
 
         try:
             yield session
@@ -73,11 +358,36 @@ class DatabaseSessionManager:
             raise
         finally:
             await session.close()
+            if not readonly:
+                self._last_write = time.monotonic()
+
+    @contextlib.asynccontextmanager
+    async def reuse(
+        self,
+        session: AsyncSession | None,
+        readonly: bool = False,
+        device: uuid.UUID | None = None,
+        shard: int | None = None,
+    ) -> AsyncIterator[AsyncSession]:
+        """
+        Yield `session` if one was given by the caller, such as the
+        session for an API request, or open one as `session()` would.
+        Sessions on the main database are only reused for work that
+        would not be routed to a shard. The caller keeps ownership of a
+        reused session, so it is neither rolled back nor closed here.
+        """
+        if session is not None and self._route(device, shard) is self:
+            yield session
+            return
+
+        async with self.session(readonly, device, shard) as opened:
+            yield opened
 
     async def create_all(self, connection: AsyncConnection) -> None:
         await connection.run_sync(Base.metadata.create_all)
 
     async def drop_all(self, connection: AsyncConnection) -> None:
+        await connection.run_sync(drop_partitions)
         await connection.run_sync(Base.metadata.drop_all)
 
 
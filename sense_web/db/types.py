@@ -0,0 +1,37 @@
+import datetime
+from typing import Any
+
+from sqlalchemy import BigInteger, Dialect
+from sqlalchemy.types import TypeDecorator
+
+from sense_web.dto.series import EPOCH, to_epoch_us
+
+
+class EpochMicroseconds(TypeDecorator[datetime.datetime]):
+    """
+    Stores datetimes as signed 64-bit microseconds since the Unix epoch.
+
+    Integer columns make for smaller indexes and cheaper comparisons
+    than SQLite's text timestamps, and keep full microsecond precision
+    on every backend. Naive datetimes are treated as UTC. Values are
+    always read back as aware UTC datetimes. Plain integers are bound
+    as-is, so callers that already hold epoch microseconds can skip the
+    conversion.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(
+        self, value: datetime.datetime | int | None, dialect: Dialect
+    ) -> int | None:
+        if value is None or isinstance(value, int):
+            return value
+        return to_epoch_us(value)
+
+    def process_result_value(
+        self, value: Any, dialect: Dialect
+    ) -> datetime.datetime | None:
+        if value is None:
+            return None
+        return EPOCH + datetime.timedelta(microseconds=int(value))
@@ -0,0 +1,49 @@
+import datetime
+from typing import Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sense_web.dto.series import EPOCH
+
+from .dialect import upsert
+from .models import TableVersion
+
+
+async def bump_version(session: AsyncSession, table_name: str) -> None:
+    """
+    Bump the version of `table_name` in the caller's transaction, so it
+    changes exactly when the change to the table is committed.
+    """
+    now = datetime.datetime.now(datetime.UTC)
+    stmt = upsert(session, TableVersion.__table__).values(
+        table_name=table_name, version=1, modified=now
+    )
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["table_name"],
+            set_={"version": TableVersion.version + 1, "modified": now},
+        )
+    )
+
+
+async def get_version(
+    session: AsyncSession, table_names: Sequence[str]
+) -> Tuple[int, datetime.datetime]:
+    """
+    Return a version covering all of `table_names` and when the last of
+    them changed.
+
+    The version is the sum of the tables' versions, so it goes up
+    whenever any of them changes. Tables that have never changed count
+    as version 0, changed at the epoch.
+    """
+    result = await session.execute(
+        select(
+            func.sum(TableVersion.version), func.max(TableVersion.modified)
+        ).where(TableVersion.table_name.in_(table_names))
+    )
+    version, modified = result.one()
+    if version is None:
+        return 0, EPOCH
+    return int(version), modified
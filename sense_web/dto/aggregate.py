@@ -0,0 +1,16 @@
+import datetime
+import uuid
+from pydantic import BaseModel
+
+
+class AggregateDTO(BaseModel):
+    bucket_start: datetime.datetime
+    count: int
+    sum: float
+    min: float
+    max: float
+    mean: float
+
+
+class FleetAggregateDTO(AggregateDTO):
+    device_uuid: uuid.UUID | None = None
@@ -1,8 +1,17 @@
 import datetime
-from pydantic import BaseModel, ConfigDict, field_validator
+from typing import List
+from pydantic import BaseModel, ConfigDict, TypeAdapter, field_validator
 from uuid import UUID
 
 
+def ensure_utc(value: datetime.datetime) -> datetime.datetime:
+    if value and value.tzinfo is None:
+        # Treat naive datetimes as UTC. Stored timestamps are always
+        # read back aware, but callers may still pass naive ones.
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
 class DataPointDTO(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -18,8 +27,27 @@ class DataPointDTO(BaseModel):
     @field_validator("timestamp", mode="before")
     @classmethod
     def ensure_utc(cls, value: datetime.datetime) -> datetime.datetime:
-        if value and value.tzinfo is None:
-            # Treat naive datetimes as UTC; this is required because SQLite
-            # DATETIME values lack timezones.
-            return value.replace(tzinfo=datetime.timezone.utc)
-        return value
+        return ensure_utc(value)
+
+
+class LatestValueDTO(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    device_uuid: UUID
+    sensor: str
+    timestamp: datetime.datetime
+    val_int: int | None = None
+    val_float: float | None = None
+    val_str: str | None = None
+    val_units: str | None = None
+
+    @field_validator("timestamp", mode="before")
+    @classmethod
+    def ensure_utc(cls, value: datetime.datetime) -> datetime.datetime:
+        return ensure_utc(value)
+
+
+# Validate a whole listing in one call, so the loop over rows runs in
+# pydantic-core. Pass `from_attributes=True` to read result rows.
+DATAPOINT_LIST = TypeAdapter(List[DataPointDTO])
+LATEST_VALUE_LIST = TypeAdapter(List[LatestValueDTO])
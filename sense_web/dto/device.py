@@ -1,4 +1,6 @@
-from pydantic import BaseModel, ConfigDict
+import datetime
+from typing import List
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 from uuid import UUID
 
 
@@ -8,3 +10,20 @@ class DeviceDTO(BaseModel):
     uuid: UUID
     imei: str
     name: str
+
+
+DEVICE_LIST = TypeAdapter(List[DeviceDTO])
+
+
+class DeviceStatusDTO(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    device_uuid: UUID
+    last_seen: datetime.datetime
+    readings_day: datetime.date
+    readings_today: int
+    last_signal: float | None = None
+
+    def readings_on(self, day: datetime.date) -> int:
+        """Return the number of readings received on `day`, if known."""
+        return self.readings_today if self.readings_day == day else 0
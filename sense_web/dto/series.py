@@ -0,0 +1,99 @@
+import datetime
+import math
+import sys
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def to_epoch_us(timestamp: datetime.datetime) -> int:
+    """
+    Convert a datetime to integer microseconds since the Unix epoch.
+
+    Naive datetimes are treated as UTC, matching `DataPointDTO`.
+    """
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return (timestamp - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+@dataclass(slots=True)
+class SeriesDTO:
+    """
+    Columnar representation of all readings for a single sensor.
+
+    Attributes:
+        sensor (str): The sensor the readings belong to.
+        val_units (str, optional): The units reported with the most
+            recent reading, if any.
+        timestamps (array): Epoch microseconds as signed 64-bit integers.
+        values (array): Numeric values as 64-bit floats. Readings
+            without a numeric value are stored as NaN.
+        strings (list, optional): String values, parallel to
+            `timestamps`. Only present if the sensor reported at least
+            one string value.
+    """
+
+    sensor: str
+    val_units: str | None = None
+    timestamps: "array[int]" = field(default_factory=lambda: array("q"))
+    values: "array[float]" = field(default_factory=lambda: array("d"))
+    strings: List[str | None] | None = None
+
+    def append(
+        self,
+        timestamp_us: int,
+        val_int: int | None,
+        val_float: float | None,
+        val_str: str | None,
+    ) -> None:
+        if val_float is not None:
+            value = float(val_float)
+        elif val_int is not None:
+            value = float(val_int)
+        else:
+            value = math.nan
+
+        if val_str is not None and self.strings is None:
+            self.strings = [None] * len(self.timestamps)
+
+        self.timestamps.append(timestamp_us)
+        self.values.append(value)
+        if self.strings is not None:
+            self.strings.append(val_str)
+
+    @staticmethod
+    def le_bytes(column: "array[Any]") -> bytes:
+        """Return the raw little-endian bytes of one of the columns."""
+        if sys.byteorder == "little":
+            return column.tobytes()
+        swapped = array(column.typecode, column)
+        swapped.byteswap()
+        return swapped.tobytes()
+
+
+def series_from_rows(rows: Iterable[Any]) -> List[SeriesDTO]:
+    """
+    Group raw datapoint rows into one `SeriesDTO` per sensor.
+
+    Each row must be a tuple of `(sensor, timestamp, val_int, val_float,
+    val_str, val_units)`, which is the shape returned by
+    `get_datapoint_rows_by_device_uuid`. The timestamp may be a datetime
+    or epoch microseconds. Rows are appended in the order given, so
+    callers should sort them by timestamp first.
+    """
+    series: dict[str, SeriesDTO] = {}
+
+    for sensor, timestamp, val_int, val_float, val_str, val_units in rows:
+        s = series.get(sensor)
+        if s is None:
+            s = series[sensor] = SeriesDTO(sensor=sensor)
+        if not isinstance(timestamp, int):
+            timestamp = to_epoch_us(timestamp)
+        s.append(timestamp, val_int, val_float, val_str)
+        if val_units is not None:
+            s.val_units = val_units
+
+    return [series[k] for k in sorted(series)]
@@ -2,3 +2,21 @@ class DeviceAlreadyExists(Exception):
     """Raised when trying to register a device that already exists."""
 
     pass
+
+
+class DataPointCompacted(Exception):
+    """
+    Raised when trying to delete a datapoint that has been compacted
+    into a chunk, and so no longer exists on its own.
+    """
+
+    pass
+
+
+class UnsupportedDialect(Exception):
+    """
+    Raised when a statement has no form for the database dialect in
+    use. Only SQLite and PostgreSQL are supported.
+    """
+
+    pass
@@ -0,0 +1,190 @@
+import asyncio
+import datetime
+import logging
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Sequence
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sense_web.db.dialect import greatest, upsert
+from sense_web.db.models import Device, DeviceStatus
+from sense_web.db.session import sessionmanager
+from sense_web.db.versions import bump_version
+from sense_web.dto.device import DeviceStatusDTO
+from sense_web.services.datapoint import BulkReading
+
+log = logging.getLogger("activity")
+log.setLevel(logging.INFO)
+
+# Read as plain rows rather than entities, so no ORM objects are built
+_COLUMNS = DeviceStatus.__table__.c
+
+
+@dataclass(slots=True)
+class _Activity:
+    last_seen: datetime.datetime
+    readings_day: datetime.date
+    readings_today: int
+    last_signal: float | None
+
+
+class ActivityTracker:
+    """
+    Tracks when each device was last heard from, how many readings it
+    sent today and its latest signal strength, in memory.
+
+    Use `init()` to configure and clear the tracker, `record()` whenever
+    a device makes a request, and `flush()` (or `run_flush()`) to write
+    the activity gathered since the last flush to `device_status` in one
+    transaction. Recording never touches the database, so tracking costs
+    one write per device per flush rather than one per request.
+    """
+
+    def __init__(self) -> None:
+        self._signal_sensor = "rssi"
+        self._pending: Dict[uuid.UUID, _Activity] = {}
+
+    def init(self, signal_sensor: str) -> None:
+        self._signal_sensor = signal_sensor
+        self._pending = {}
+
+    def record(
+        self,
+        device_uuid: uuid.UUID,
+        readings: Sequence[BulkReading] = (),
+        now: datetime.datetime | None = None,
+    ) -> None:
+        """
+        Record a request from a device carrying `readings`, which may be
+        none for requests that only poll for commands.
+        """
+        now = now or datetime.datetime.now(datetime.UTC)
+        day = now.date()
+
+        entry = self._pending.get(device_uuid)
+        if entry is None or entry.readings_day != day:
+            # Readings counted for a previous day are no longer needed
+            signal = entry.last_signal if entry else None
+            entry = _Activity(now, day, 0, signal)
+            self._pending[device_uuid] = entry
+
+        entry.last_seen = now
+        entry.readings_today += len(readings)
+        for _, sensor, val_int, val_float, _, _ in readings:
+            if sensor != self._signal_sensor:
+                continue
+            value = val_float if val_float is not None else val_int
+            if value is not None:
+                entry.last_signal = float(value)
+
+    async def flush(self) -> int:
+        """
+        Write the activity recorded since the last flush. Activity that
+        fails to be written is kept for the next flush.
+
+        Returns the number of devices written.
+        """
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            async with sessionmanager.session() as session:
+                written = await _write(session, pending)
+                await session.commit()
+        except BaseException:
+            # Including cancellation, so a flush interrupted at shutdown
+            # can be run again
+            self._restore(pending)
+            raise
+
+        return written
+
+    def _restore(self, pending: Dict[uuid.UUID, _Activity]) -> None:
+        for device_uuid, entry in pending.items():
+            newer = self._pending.get(device_uuid)
+            if newer is None:
+                self._pending[device_uuid] = entry
+                continue
+            if newer.readings_day == entry.readings_day:
+                newer.readings_today += entry.readings_today
+            if newer.last_signal is None:
+                newer.last_signal = entry.last_signal
+
+
+async def _write(
+    session: AsyncSession, pending: Dict[uuid.UUID, _Activity]
+) -> int:
+    # Devices deleted since they were last heard from are skipped rather
+    # than failing the whole flush on the foreign key
+    result = await session.execute(
+        select(Device.uuid).where(Device.uuid.in_(pending))
+    )
+    found = set(result.scalars())
+    rows = [
+        {"device_uuid": device_uuid, **asdict(entry)}
+        for device_uuid, entry in pending.items()
+        if device_uuid in found
+    ]
+    if not rows:
+        return 0
+
+    table = DeviceStatus.__table__
+    stmt = upsert(session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.device_uuid],
+        set_={
+            "last_seen": greatest(
+                session, table.c.last_seen, stmt.excluded.last_seen
+            ),
+            "readings_day": stmt.excluded.readings_day,
+            "readings_today": case(
+                (
+                    table.c.readings_day == stmt.excluded.readings_day,
+                    table.c.readings_today + stmt.excluded.readings_today,
+                ),
+                else_=stmt.excluded.readings_today,
+            ),
+            "last_signal": func.coalesce(
+                stmt.excluded.last_signal, table.c.last_signal
+            ),
+        },
+    )
+    await session.execute(stmt, rows)
+    await bump_version(session, DeviceStatus.__tablename__)
+    return len(rows)
+
+
+async def get_device_status(
+    devices: Iterable[uuid.UUID], session: AsyncSession | None = None
+) -> Dict[uuid.UUID, DeviceStatusDTO]:
+    """
+    Return the last flushed activity of `devices`, by device UUID.
+    Devices that have never been heard from are left out.
+    """
+    async with sessionmanager.reuse(session, readonly=True) as db:
+        result = await db.execute(
+            select(*_COLUMNS).where(DeviceStatus.device_uuid.in_(devices))
+        )
+        return {
+            row.device_uuid: DeviceStatusDTO.model_validate(row)
+            for row in result
+        }
+
+
+async def run_flush(interval: float) -> None:
+    """
+    Flush device activity every `interval` seconds until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            flushed = await activity.flush()
+            log.debug(f"Flushed activity of {flushed} devices")
+        except Exception:
+            log.exception("Activity flush failed")
+
+
+activity = ActivityTracker()
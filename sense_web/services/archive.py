@@ -0,0 +1,563 @@
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import uuid
+from typing import Any, Collection, Dict, List, Sequence, Tuple, cast
+
+from sqlalchemy import (
+    CursorResult,
+    String,
+    Table,
+    delete,
+    func,
+    null,
+    select,
+    text,
+    union_all,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sense_web.db.dialect import dialect_name
+from sense_web.db.lookups import joined, sensor_name, units_name
+from sense_web.db.partitions import (
+    TEXT_POINTS,
+    partition_bounds,
+    partition_name,
+    partitions,
+)
+from sense_web.db.session import env_uris, sessionmanager
+from sense_web.dto.datapoint import DATAPOINT_LIST, DataPointDTO
+from sense_web.dto.series import to_epoch_us
+from sense_web.services.rollup import backfill_rollups
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+log = logging.getLogger("archive")
+log.setLevel(logging.INFO)
+
+# Columns of `data_points` kept in the archive. The integer primary key
+# is only meaningful inside the database and is dropped.
+ARCHIVE_COLUMNS = (
+    "uuid",
+    "device_uuid",
+    "timestamp",
+    "sensor",
+    "val_int",
+    "val_float",
+    "val_str",
+    "val_units",
+)
+
+# Rows written to the archive at a time
+ARCHIVE_BATCH = 10_000
+
+# Columns needed to build a `SeriesDTO`, in the order of
+# `get_datapoint_rows_by_device_uuid`
+ROW_COLUMNS = [
+    "sensor",
+    "timestamp",
+    "val_int",
+    "val_float",
+    "val_str",
+    "val_units",
+]
+
+
+def _schema() -> Any:
+    return pa.schema(
+        [
+            ("uuid", pa.string()),
+            ("device_uuid", pa.string()),
+            ("timestamp", pa.timestamp("us", tz="UTC")),
+            ("sensor", pa.string()),
+            ("val_int", pa.int64()),
+            ("val_float", pa.float64()),
+            ("val_str", pa.string()),
+            ("val_units", pa.string()),
+        ]
+    )
+
+
+def _utc(timestamp: datetime.datetime) -> datetime.datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=datetime.UTC)
+    return timestamp
+
+
+class Archive:
+    """
+    Cold storage for closed datapoint partitions.
+
+    Each archived partition becomes a zstd-compressed Parquet file named
+    after it and the first reading it held, e.g.
+    `data_points_202501.<uuid>.parquet`, together with the month's text
+    readings. A partition recreated by late readings is archived to a
+    file of its own, and archiving the same partition again replaces
+    its file. Rows are sorted by device, sensor and timestamp, so the
+    min/max statistics Parquet keeps for every row group let reads skip
+    most of a file.
+
+    Use `init()` to set the archive directory, or disable the archive
+    with `None`. Reads are memory-mapped and only touch the files whose
+    month overlaps the requested range.
+    """
+
+    def __init__(self) -> None:
+        self.directory: str | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def init(self, directory: str | None) -> None:
+        if directory is not None:
+            if pa is None:
+                raise RuntimeError(
+                    "The Parquet archive requires pyarrow. Install "
+                    "sense-web[archive]."
+                )
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def path(self, name: str) -> str:
+        if self.directory is None:
+            raise Exception("Archive is not initialised")
+        return os.path.join(self.directory, f"{name}.parquet")
+
+    def names(self) -> List[str]:
+        """Return the names of the archive files, oldest first."""
+        if self.directory is None:
+            return []
+        return sorted(
+            entry.removesuffix(".parquet")
+            for entry in os.listdir(self.directory)
+            if entry.endswith(".parquet")
+        )
+
+    def _files(
+        self,
+        start: datetime.datetime | None,
+        end: datetime.datetime | None,
+    ) -> List[str]:
+        files = []
+        for name in self.names():
+            lo, hi = self.bounds(name)
+            if start is not None and hi <= _utc(start):
+                continue
+            if end is not None and lo >= _utc(end):
+                continue
+            files.append(self.path(name))
+        return files
+
+    def bounds(self, name: str) -> Tuple[datetime.datetime, datetime.datetime]:
+        """Return the `[start, end)` range of the archive file `name`."""
+        return partition_bounds(name.split(".")[0])
+
+    def open(self, name: str) -> Any:
+        """
+        Start writing the archive file `name`. Rows are added with
+        `append()` and only become visible to reads once the file is
+        completed with `commit()`.
+        """
+        return pq.ParquetWriter(
+            f"{self.path(name)}.tmp",
+            _schema(),
+            compression="zstd",
+            write_statistics=True,
+            use_dictionary=["device_uuid", "sensor", "val_units"],
+        )
+
+    def append(self, writer: Any, rows: Sequence[Any]) -> None:
+        writer.write_table(
+            pa.Table.from_pylist(
+                [
+                    {
+                        **row._mapping,
+                        "uuid": str(row.uuid),
+                        "device_uuid": str(row.device_uuid),
+                        "timestamp": _utc(row.timestamp),
+                    }
+                    for row in rows
+                ],
+                schema=_schema(),
+            )
+        )
+
+    def commit(self, name: str, writer: Any) -> None:
+        # Rename so readers never see a partial file, and a file written
+        # for the same partition before is replaced rather than added to
+        writer.close()
+        os.replace(f"{self.path(name)}.tmp", self.path(name))
+
+    def discard(self, name: str, writer: Any) -> None:
+        writer.close()
+        os.remove(f"{self.path(name)}.tmp")
+
+    def remove(self, name: str) -> None:
+        os.remove(self.path(name))
+
+    def read(
+        self,
+        device_uuid: uuid.UUID | Collection[uuid.UUID] | None,
+        columns: Sequence[str],
+        sensor: str | None = None,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the archived readings in `[start, end)` of a device, of a
+        collection of devices, or of every device if `device_uuid` is
+        `None`, as dicts holding `columns`, ordered by sensor and
+        timestamp.
+        """
+        filters: List[Any] = []
+        if isinstance(device_uuid, uuid.UUID):
+            filters.append(("device_uuid", "=", str(device_uuid)))
+        elif device_uuid is not None:
+            filters.append(
+                ("device_uuid", "in", [str(d) for d in device_uuid])
+            )
+        if sensor is not None:
+            filters.append(("sensor", "=", sensor))
+        if start is not None:
+            filters.append(("timestamp", ">=", _utc(start)))
+        if end is not None:
+            filters.append(("timestamp", "<", _utc(end)))
+
+        rows: List[Dict[str, Any]] = []
+        for path in self._files(start, end):
+            table = pq.read_table(
+                path,
+                columns=list(columns),
+                filters=filters or None,
+                memory_map=True,
+            )
+            rows.extend(table.to_pylist())
+
+        if "sensor" in columns and "timestamp" in columns:
+            rows.sort(key=lambda r: (r["sensor"], r["timestamp"]))
+        return rows
+
+    def datapoints(
+        self,
+        device_uuid: uuid.UUID,
+        sensor: str | None = None,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+    ) -> List[DataPointDTO]:
+        return DATAPOINT_LIST.validate_python(
+            self.read(
+                device_uuid,
+                ARCHIVE_COLUMNS,
+                sensor=sensor,
+                start=start,
+                end=end,
+            )
+        )
+
+    def sensor_datapoints(
+        self,
+        sensor: str,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+        devices: Collection[uuid.UUID] | None = None,
+    ) -> List[DataPointDTO]:
+        """
+        Return the archived readings of `sensor` in `[start, end)` from
+        every device, or only from `devices`.
+        """
+        return DATAPOINT_LIST.validate_python(
+            self.read(
+                devices,
+                ARCHIVE_COLUMNS,
+                sensor=sensor,
+                start=start,
+                end=end,
+            )
+        )
+
+    def rows(
+        self,
+        device_uuid: uuid.UUID,
+        sensor: str | None = None,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+    ) -> List[Any]:
+        """
+        Return archived readings in the row shape of
+        `get_datapoint_rows_by_device_uuid`, with epoch microsecond
+        timestamps.
+        """
+        return [
+            (
+                row["sensor"],
+                to_epoch_us(row["timestamp"]),
+                row["val_int"],
+                row["val_float"],
+                row["val_str"],
+                row["val_units"],
+            )
+            for row in self.read(
+                device_uuid, ROW_COLUMNS, sensor=sensor, start=start, end=end
+            )
+        ]
+
+
+async def archive_partitions(before: datetime.datetime | None = None) -> int:
+    """
+    Move every partition for a month before the one containing `before`
+    into the archive and drop it from the database. By default every
+    month before the current one is archived.
+
+    Shards are archived concurrently. Each partition is written to a
+    file named after its first reading, so every shard writes files of
+    its own.
+
+    Returns the number of partitions archived.
+    """
+    if not archive.enabled:
+        return 0
+
+    before = _utc(before or datetime.datetime.now(datetime.UTC))
+    current = partition_bounds(partition_name(before))[0]
+
+    return sum(
+        await sessionmanager.fan_out(
+            lambda shard: _archive_shard(current, shard)
+        )
+    )
+
+
+async def _archive_months(
+    session: AsyncSession, current: datetime.datetime
+) -> List[str]:
+    """
+    Return the months before `current` with readings in the database,
+    as partition names. Text readings are not partitioned, so months
+    holding only text readings are found from `text_points`.
+    """
+    names = {
+        name
+        for name in await partitions.partition_names(session)
+        if partition_bounds(name)[1] <= current
+    }
+
+    after = None
+    while True:
+        stmt = select(func.min(TEXT_POINTS.c.timestamp)).where(
+            TEXT_POINTS.c.timestamp < current
+        )
+        if after is not None:
+            stmt = stmt.where(TEXT_POINTS.c.timestamp >= after)
+        first = (await session.execute(stmt)).scalar_one_or_none()
+        if first is None:
+            break
+        name = partition_name(first)
+        names.add(name)
+        after = partition_bounds(name)[1]
+
+    return sorted(names)
+
+
+def _archive_columns(table: Table) -> List[Any]:
+    columns: List[Any] = [
+        table.c[c] if c in table.c else null().cast(String).label(c)
+        for c in ARCHIVE_COLUMNS
+        if c not in ("sensor", "val_units")
+    ]
+    return [*columns, sensor_name(), units_name()]
+
+
+async def _archive_month(name: str, shard: int | None) -> int | None:
+    """
+    Write the readings of month `name`, from its partition and from
+    `text_points`, to the month's archive file, then remove them from
+    the database.
+
+    Rows are streamed from a read-only session and written a batch at a
+    time off the event loop, so neither the writer session nor the
+    loop is held while the file is built. The finished file replaces
+    any earlier one for the partition only after the readings have been
+    counted and deleted, in the transaction that drops the partition,
+    so an interrupted run is simply repeated.
+
+    Returns the number of readings archived, or `None` if readings were
+    added to the month while it was being written.
+    """
+    start, end = partition_bounds(name)
+    text_filters = [
+        TEXT_POINTS.c.timestamp >= start,
+        TEXT_POINTS.c.timestamp < end,
+    ]
+    selects = [
+        select(*_archive_columns(TEXT_POINTS))
+        .select_from(joined(TEXT_POINTS))
+        .where(*text_filters)
+    ]
+    firsts = [
+        select(TEXT_POINTS.c.uuid)
+        .where(*text_filters)
+        .order_by(TEXT_POINTS.c.id)
+        .limit(1)
+    ]
+
+    async with sessionmanager.session(readonly=True, shard=shard) as session:
+        table = None
+        if name in await partitions.partition_names(session):
+            table = partitions.table(name)
+            selects.append(
+                select(*_archive_columns(table)).select_from(joined(table))
+            )
+            firsts.insert(
+                0, select(table.c.uuid).order_by(table.c.id).limit(1)
+            )
+
+        # The first reading written to the partition names its file, so
+        # archiving the same partition again replaces the file, while a
+        # partition recreated by late readings gets one of its own
+        first = None
+        for stmt in firsts:
+            first = (await session.execute(stmt)).scalar_one_or_none()
+            if first is not None:
+                break
+
+        count = 0
+        file, writer = "", None
+        if first is not None:
+            file = f"{name}.{first.hex}"
+            rows = union_all(*selects).subquery()
+            writer = await asyncio.to_thread(archive.open, file)
+            try:
+                result = await session.stream(
+                    select(rows).order_by(
+                        rows.c.device_uuid, rows.c.sensor, rows.c.timestamp
+                    )
+                )
+                async for batch in result.partitions(ARCHIVE_BATCH):
+                    await asyncio.to_thread(archive.append, writer, batch)
+                    count += len(batch)
+            except BaseException:
+                await asyncio.to_thread(archive.discard, file, writer)
+                raise
+
+    try:
+        async with sessionmanager.session(shard=shard) as session:
+            if table is not None and dialect_name(session) == "postgresql":
+                await session.execute(text(f"LOCK TABLE {table.name}"))
+            deleted = await session.execute(
+                delete(TEXT_POINTS).where(*text_filters)
+            )
+            held = cast(CursorResult[Any], deleted).rowcount
+            if table is not None:
+                held += (
+                    await session.execute(
+                        select(func.count()).select_from(table)
+                    )
+                ).scalar_one()
+
+            if held != count:
+                await session.rollback()
+                return None
+
+            if writer is not None:
+                await asyncio.to_thread(archive.commit, file, writer)
+                writer = None
+            if table is not None:
+                await partitions.drop(session, name)
+            await session.commit()
+    finally:
+        if writer is not None:
+            await asyncio.to_thread(archive.discard, file, writer)
+
+    return count
+
+
+async def _archive_shard(current: datetime.datetime, shard: int | None) -> int:
+    async with sessionmanager.session(shard=shard) as session:
+        names = await _archive_months(session, current)
+
+    archived = 0
+    for name in names:
+        start, end = partition_bounds(name)
+
+        # Rollups must cover the partition before its rows leave the
+        # database
+        await backfill_rollups(start=start, end=end, shard=shard)
+
+        count = await _archive_month(name, shard)
+        if count is None:
+            log.warning(f"Readings were added to {name}, archiving later")
+            continue
+
+        log.info(f"Archived {name} ({count} readings)")
+        archived += 1
+
+    return archived
+
+
+async def run_archive(interval: float) -> None:
+    """
+    Archive closed partitions every `interval` seconds until cancelled.
+    """
+    while True:
+        try:
+            await archive_partitions()
+        except Exception:
+            log.exception("Archive run failed")
+
+        await asyncio.sleep(interval)
+
+
+def merge_rows(hot: Sequence[Any], cold: Sequence[Any]) -> List[Any]:
+    """
+    Merge two lists of rows ordered by sensor and timestamp.
+    """
+    if not cold:
+        return list(hot)
+    if not hot:
+        return list(cold)
+    return sorted([*hot, *cold], key=lambda r: (r[0], r[1]))
+
+
+archive = Archive()
+
+
+async def main(
+    db_uri: str, archive_dir: str, before: datetime.datetime | None
+) -> None:
+    await sessionmanager.init(
+        db_uri, shard_uris=env_uris("DATABASE_SHARD_URIS")
+    )
+    archive.init(archive_dir)
+    archived = await archive_partitions(before)
+    log.info(f"Archived {archived} partitions")
+    await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move closed datapoint partitions to Parquet files"
+    )
+    parser.add_argument(
+        "--before",
+        default=None,
+        type=datetime.datetime.fromisoformat,
+        help="Archive the months before this ISO 8601 timestamp",
+    )
+
+    args = parser.parse_args()
+
+    asyncio.run(
+        main(
+            os.getenv("DATABASE_URI", "sqlite+aiosqlite:///./dev.db"),
+            os.getenv("ARCHIVE_DIR", "./archive"),
+            before=args.before,
+        )
+    )
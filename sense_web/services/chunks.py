@@ -0,0 +1,575 @@
+import asyncio
+import datetime
+import logging
+import struct
+import uuid
+import zlib
+from array import array
+from typing import Any, Collection, Dict, List, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+
+from sense_web.db.dialect import upsert
+from sense_web.db.lookups import (
+    joined,
+    sensor_in,
+    sensor_name,
+    units_name,
+)
+from sense_web.db.models import SeriesChunk
+from sense_web.db.partitions import partitions
+from sense_web.db.session import sessionmanager
+from sense_web.dto.datapoint import DataPointDTO
+from sense_web.dto.series import EPOCH, SeriesDTO, to_epoch_us
+
+log = logging.getLogger("chunks")
+log.setLevel(logging.INFO)
+
+# Width of a chunk in seconds
+CHUNK_SECONDS = 3600
+
+# Integers beyond this cannot round-trip through a float64
+_MAX_SAFE_INT = 2**53
+
+# version, count, first timestamp, timestamp width, timestamp block size
+_HEADER = struct.Struct("<BIqBI")
+_VERSION = 1
+
+# Compacted readings have no stored UUID, so a UUIDv5 is derived from
+# the device, sensor and timestamp instead. Being version 5 tells it
+# apart from the UUIDs of stored datapoints.
+_UUID_NAMESPACE = uuid.UUID("9d4b1c52-6f0e-4c53-9a43-3c1f6bb1f0a7")
+
+Timestamps = npt.NDArray[np.int64]
+Values = npt.NDArray[np.float64]
+
+
+def is_chunk_uuid(datapoint_uuid: uuid.UUID) -> bool:
+    """Return whether `datapoint_uuid` was derived for a compacted reading."""
+    return datapoint_uuid.version == 5
+
+
+def encode_chunk(timestamps: Timestamps, values: Values) -> bytes:
+    """
+    Encode sorted epoch microsecond `timestamps` and their `values`.
+
+    Timestamps are stored as zigzagged deltas-of-deltas packed to the
+    narrowest integer width that fits. Values are XORed with their
+    predecessor and split into byte planes, so the leading bytes shared
+    by similar floats end up as long runs of zeros. Both blocks are then
+    deflated. Unlike Gorilla's bit-level packing every step is byte
+    aligned, so `decode_chunk` can undo it with whole-array operations.
+    """
+    ts = np.asarray(timestamps, dtype=np.int64)
+    count = len(ts)
+
+    deltas = np.diff(ts, prepend=ts[:1])
+    dods = np.diff(deltas, prepend=np.int64(0))
+    zigzag = ((dods << 1) ^ (dods >> 63)).view(np.uint64)
+
+    peak = int(zigzag.max()) if count else 0
+    width = next(w for w in (1, 2, 4, 8) if peak < 1 << (8 * w))
+    ts_block = zlib.compress(zigzag.astype(f"<u{width}").tobytes())
+
+    bits = np.asarray(values, dtype="<f8").view("<u8")
+    xored = bits ^ np.concatenate((np.zeros(1, "<u8"), bits[:-1]))
+    planes = xored.view(np.uint8).reshape(count, 8).T
+    val_block = zlib.compress(planes.tobytes())
+
+    header = _HEADER.pack(
+        _VERSION, count, int(ts[0]) if count else 0, width, len(ts_block)
+    )
+    return header + ts_block + val_block
+
+
+def decode_chunk(data: bytes) -> Tuple[Timestamps, Values]:
+    """Decode a chunk written by `encode_chunk`."""
+    version, count, first, width, ts_size = _HEADER.unpack_from(data)
+    if version != _VERSION:
+        raise ValueError(f"Unsupported chunk version {version}")
+
+    offset = _HEADER.size
+    zigzag = np.frombuffer(
+        zlib.decompress(data[offset : offset + ts_size]), dtype=f"<u{width}"
+    ).astype(np.uint64)
+    dods = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(
+        zigzag & np.uint64(1)
+    ).astype(np.int64)
+    timestamps = first + np.cumsum(np.cumsum(dods))
+
+    planes = np.frombuffer(
+        zlib.decompress(data[offset + ts_size :]), dtype=np.uint8
+    ).reshape(8, count)
+    xored = np.ascontiguousarray(planes.T).view("<u8").reshape(count)
+    values = np.bitwise_xor.accumulate(xored).view("<f8")
+
+    return timestamps.astype(np.int64), values.astype(np.float64)
+
+
+def _chunk_filters(
+    device_uuid: uuid.UUID | None,
+    sensor: str | None,
+    start: datetime.datetime | None,
+    end: datetime.datetime | None,
+) -> List[ColumnElement[bool]]:
+    filters: List[ColumnElement[bool]] = []
+    if device_uuid is not None:
+        filters.append(SeriesChunk.device_uuid == device_uuid)
+    if sensor is not None:
+        filters.append(SeriesChunk.sensor == sensor)
+    if start is not None:
+        filters.append(SeriesChunk.last_timestamp >= to_epoch_us(start))
+    if end is not None:
+        filters.append(SeriesChunk.first_timestamp < to_epoch_us(end))
+    return filters
+
+
+async def chunk_arrays(
+    session: AsyncSession,
+    filters: Sequence[ColumnElement[bool]],
+) -> List[Tuple[Any, str, str | None, bool, Timestamps, Values]]:
+    """
+    Decode every chunk matching `filters`, ordered by device, sensor and
+    time. Each item is `(device_uuid, sensor, val_units, is_int,
+    timestamps, values)`.
+    """
+    stmt = (
+        select(
+            SeriesChunk.device_uuid,
+            SeriesChunk.sensor,
+            SeriesChunk.val_units,
+            SeriesChunk.is_int,
+            SeriesChunk.data,
+        )
+        .where(*filters)
+        .order_by(
+            SeriesChunk.device_uuid,
+            SeriesChunk.sensor,
+            SeriesChunk.chunk_start,
+        )
+    )
+    result = await session.execute(stmt)
+    return [
+        (dev, sen, units, is_int, *decode_chunk(data))
+        for dev, sen, units, is_int, data in result
+    ]
+
+
+def _to_array(column: npt.NDArray[Any], typecode: str) -> "array[Any]":
+    out = array(typecode)
+    out.frombytes(column.astype(f"={typecode}").tobytes())
+    return out
+
+
+def _mask(
+    timestamps: Timestamps,
+    start: datetime.datetime | None,
+    end: datetime.datetime | None,
+) -> npt.NDArray[np.bool_]:
+    mask = np.ones(len(timestamps), dtype=np.bool_)
+    if start is not None:
+        mask &= timestamps >= to_epoch_us(start)
+    if end is not None:
+        mask &= timestamps < to_epoch_us(end)
+    return mask
+
+
+async def get_chunk_series(
+    device_uuid: uuid.UUID,
+    sensor: str | None = None,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    session: AsyncSession | None = None,
+) -> List[SeriesDTO]:
+    """
+    Return the compacted readings of a device in `[start, end)` as one
+    `SeriesDTO` per sensor.
+    """
+    async with sessionmanager.reuse(
+        session, readonly=True, device=device_uuid
+    ) as db:
+        chunks = await chunk_arrays(
+            db, _chunk_filters(device_uuid, sensor, start, end)
+        )
+
+    by_sensor: Dict[str, List[Tuple[str | None, Timestamps, Values]]] = {}
+    for _, sen, units, _, ts, values in chunks:
+        mask = _mask(ts, start, end)
+        by_sensor.setdefault(sen, []).append((units, ts[mask], values[mask]))
+
+    series = []
+    for sen in sorted(by_sensor):
+        parts = by_sensor[sen]
+        ts = np.concatenate([p[1] for p in parts])
+        if not len(ts):
+            continue
+        series.append(
+            SeriesDTO(
+                sensor=sen,
+                val_units=parts[-1][0],
+                timestamps=_to_array(ts, "q"),
+                values=_to_array(np.concatenate([p[2] for p in parts]), "d"),
+            )
+        )
+    return series
+
+
+async def get_chunk_datapoints(
+    device_uuid: uuid.UUID,
+    sensor: str | None = None,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    session: AsyncSession | None = None,
+) -> List[DataPointDTO]:
+    """
+    Return the compacted readings of a device in `[start, end)` as
+    datapoints. Their UUIDs are derived from the device, sensor and
+    timestamp, since the original ones are not kept.
+    """
+    async with sessionmanager.reuse(
+        session, readonly=True, device=device_uuid
+    ) as db:
+        chunks = await chunk_arrays(
+            db, _chunk_filters(device_uuid, sensor, start, end)
+        )
+    return _chunk_datapoints(chunks, start, end)
+
+
+async def newest_chunk_datapoint(
+    session: AsyncSession, device_uuid: uuid.UUID, sensor: str
+) -> DataPointDTO | None:
+    """
+    Return the newest compacted reading of a device's sensor, if any.
+    """
+    stmt = (
+        select(
+            SeriesChunk.device_uuid,
+            SeriesChunk.sensor,
+            SeriesChunk.val_units,
+            SeriesChunk.is_int,
+            SeriesChunk.data,
+        )
+        .where(
+            SeriesChunk.device_uuid == device_uuid,
+            SeriesChunk.sensor == sensor,
+        )
+        .order_by(SeriesChunk.last_timestamp.desc())
+        .limit(1)
+    )
+    row = (await session.execute(stmt)).first()
+    if row is None:
+        return None
+    dev, sen, units, is_int, data = row
+    ts, values = decode_chunk(data)
+    return _chunk_datapoints(
+        [(dev, sen, units, is_int, ts[-1:], values[-1:])], None, None
+    )[0]
+
+
+async def get_sensor_chunk_datapoints(
+    session: AsyncSession,
+    sensor: str,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    devices: Collection[uuid.UUID] | None = None,
+) -> List[DataPointDTO]:
+    """
+    Return the compacted readings of `sensor` in `[start, end)` from
+    every device in the session's database, or only from `devices`.
+    """
+    filters = _chunk_filters(None, sensor, start, end)
+    if devices is not None:
+        filters.append(SeriesChunk.device_uuid.in_(devices))
+    return _chunk_datapoints(await chunk_arrays(session, filters), start, end)
+
+
+def _chunk_datapoints(
+    chunks: Sequence[Tuple[Any, str, str | None, bool, Timestamps, Values]],
+    start: datetime.datetime | None,
+    end: datetime.datetime | None,
+) -> List[DataPointDTO]:
+    datapoints = []
+    for device_uuid, sen, units, is_int, ts, values in chunks:
+        mask = _mask(ts, start, end)
+        for t, v in zip(ts[mask].tolist(), values[mask].tolist(), strict=True):
+            datapoints.append(
+                DataPointDTO.model_construct(
+                    uuid=uuid.uuid5(
+                        _UUID_NAMESPACE, f"{device_uuid}/{sen}/{t}"
+                    ),
+                    device_uuid=device_uuid,
+                    timestamp=EPOCH + datetime.timedelta(microseconds=t),
+                    sensor=sen,
+                    val_int=int(v) if is_int else None,
+                    val_float=None if is_int else v,
+                    val_str=None,
+                    val_units=units,
+                )
+            )
+    return datapoints
+
+
+def merge_series(
+    hot: List[SeriesDTO], cold: List[SeriesDTO]
+) -> List[SeriesDTO]:
+    """
+    Merge two lists of series, interleaving the readings of any sensor
+    present in both by timestamp.
+    """
+    if not cold:
+        return hot
+    if not hot:
+        return cold
+
+    merged = {s.sensor: s for s in cold}
+    for s in hot:
+        other = merged.get(s.sensor)
+        if other is None:
+            merged[s.sensor] = s
+            continue
+
+        ts = np.concatenate(
+            (
+                np.frombuffer(other.timestamps, dtype=np.int64),
+                np.frombuffer(s.timestamps, dtype=np.int64),
+            )
+        )
+        values = np.concatenate(
+            (
+                np.frombuffer(other.values, dtype=np.float64),
+                np.frombuffer(s.values, dtype=np.float64),
+            )
+        )
+        order = np.argsort(ts, kind="stable")
+
+        strings = None
+        if s.strings is not None:
+            padded = [None] * len(other.timestamps) + s.strings
+            strings = [padded[i] for i in order.tolist()]
+
+        merged[s.sensor] = SeriesDTO(
+            sensor=s.sensor,
+            val_units=s.val_units or other.val_units,
+            timestamps=_to_array(ts[order], "q"),
+            values=_to_array(values[order], "d"),
+            strings=strings,
+        )
+
+    return [merged[k] for k in sorted(merged)]
+
+
+async def _compact_range(
+    sensors: Collection[str],
+    start: datetime.datetime,
+    end: datetime.datetime,
+    shard: int | None = None,
+) -> int:
+    async with sessionmanager.session(shard=shard) as session:
+        groups: Dict[Tuple[Any, str, int], List[Any]] = {}
+        ids: Dict[str, List[int]] = {}
+        for table in await partitions.tables(session, start, end):
+            stmt = (
+                select(
+                    table.c.id,
+                    table.c.device_uuid,
+                    sensor_name(),
+                    table.c.timestamp,
+                    table.c.val_int,
+                    table.c.val_float,
+                    units_name(),
+                )
+                .select_from(joined(table))
+                .where(
+                    sensor_in(table, sensors),
+                    table.c.timestamp >= start,
+                    table.c.timestamp < end,
+                )
+            )
+            for (
+                id_,
+                dev,
+                sen,
+                ts,
+                val_int,
+                val_float,
+                units,
+            ) in await session.execute(stmt):
+                ts_us = to_epoch_us(ts)
+                key = (dev, sen, ts_us // 1_000_000 // CHUNK_SECONDS)
+                groups.setdefault(key, []).append(
+                    (table.name, id_, ts_us, val_int, val_float, units)
+                )
+
+        compacted = 0
+        for (dev, sen, hour), readings in groups.items():
+            units = {r[5] for r in readings}
+            is_int = {r[4] is None for r in readings}
+            if len(units) > 1 or len(is_int) > 1:
+                # Chunks hold a single kind of value in a single unit
+                continue
+            if True in is_int and any(
+                abs(r[3]) > _MAX_SAFE_INT for r in readings
+            ):
+                continue
+
+            chunk_start = hour * CHUNK_SECONDS
+            ts = np.fromiter((r[2] for r in readings), dtype=np.int64)
+            values = np.fromiter(
+                (r[4] if r[4] is not None else r[3] for r in readings),
+                dtype=np.float64,
+            )
+
+            existing = (
+                await session.execute(
+                    select(
+                        SeriesChunk.data,
+                        SeriesChunk.is_int,
+                        SeriesChunk.val_units,
+                    ).where(
+                        SeriesChunk.device_uuid == dev,
+                        SeriesChunk.sensor == sen,
+                        SeriesChunk.chunk_start == chunk_start,
+                    )
+                )
+            ).one_or_none()
+            if existing is not None:
+                if (existing.is_int, existing.val_units) != (
+                    True in is_int,
+                    next(iter(units)),
+                ):
+                    # Late readings of another kind or unit would
+                    # relabel the chunk's values, so they stay raw
+                    continue
+                old_ts, old_values = decode_chunk(existing.data)
+                ts = np.concatenate((old_ts, ts))
+                values = np.concatenate((old_values, values))
+
+            order = np.argsort(ts, kind="stable")
+            ts, values = ts[order], values[order]
+
+            row = {
+                "device_uuid": dev,
+                "sensor": sen,
+                "chunk_start": chunk_start,
+                "count": len(ts),
+                "first_timestamp": int(ts[0]),
+                "last_timestamp": int(ts[-1]),
+                "is_int": True in is_int,
+                "val_units": units.pop(),
+                "data": encode_chunk(ts, values),
+            }
+            stmt = upsert(session, SeriesChunk.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["device_uuid", "sensor", "chunk_start"],
+                set_={
+                    k: stmt.excluded[k]
+                    for k in row
+                    if k not in ("device_uuid", "sensor", "chunk_start")
+                },
+            )
+            await session.execute(stmt, [row])
+
+            for name, id_, *_ in readings:
+                ids.setdefault(name, []).append(id_)
+            compacted += len(readings)
+
+        for table in await partitions.tables(session, start, end):
+            table_ids = ids.get(table.name, [])
+            for i in range(0, len(table_ids), 500):
+                await session.execute(
+                    delete(table).where(table.c.id.in_(table_ids[i : i + 500]))
+                )
+
+        await session.commit()
+        return compacted
+
+
+async def compact_chunks(
+    sensors: Collection[str],
+    before: datetime.datetime | None = None,
+    batch: datetime.timedelta = datetime.timedelta(days=1),
+) -> int:
+    """
+    Move the numeric readings of `sensors` for every hour that ended
+    before `before` out of `data_points` and into chunks, merging with
+    any existing chunk for the same hour. Work is done in transactions
+    covering at most `batch` of readings.
+
+    Readings for an hour that mix units, or integer and float values,
+    are left in `data_points`, as are late readings whose units or kind
+    differ from those of the hour's existing chunk.
+
+    Each shard is compacted concurrently.
+
+    Returns the number of readings compacted.
+    """
+    if not sensors:
+        return 0
+
+    seconds = to_epoch_us(before or datetime.datetime.now(datetime.UTC))
+    seconds //= 1_000_000
+    cutoff = datetime.datetime.fromtimestamp(
+        seconds - seconds % CHUNK_SECONDS, datetime.UTC
+    )
+
+    async def compact_shard(shard: int | None) -> int:
+        return await _compact_shard(sensors, cutoff, batch, shard)
+
+    return sum(await sessionmanager.fan_out(compact_shard))
+
+
+async def _compact_shard(
+    sensors: Collection[str],
+    cutoff: datetime.datetime,
+    batch: datetime.timedelta,
+    shard: int | None,
+) -> int:
+    async with sessionmanager.session(shard=shard) as session:
+        oldest = None
+        for table in await partitions.tables(session, end=cutoff):
+            first = (
+                await session.execute(
+                    select(func.min(table.c.timestamp)).where(
+                        sensor_in(table, sensors),
+                        table.c.timestamp < cutoff,
+                    )
+                )
+            ).scalar_one_or_none()
+            if first is not None:
+                first = EPOCH + datetime.timedelta(
+                    microseconds=to_epoch_us(first)
+                )
+                if oldest is None or first < oldest:
+                    oldest = first
+
+    compacted = 0
+    while oldest is not None and oldest < cutoff:
+        start = oldest - datetime.timedelta(
+            seconds=int(oldest.timestamp()) % CHUNK_SECONDS,
+            microseconds=oldest.microsecond,
+        )
+        end = min(start + batch, cutoff)
+        compacted += await _compact_range(sensors, start, end, shard)
+        oldest = end
+        await asyncio.sleep(0)
+
+    return compacted
+
+
+async def run_compaction(sensors: Collection[str], interval: float) -> None:
+    """
+    Compact the readings of `sensors` every `interval` seconds until
+    cancelled.
+    """
+    while True:
+        try:
+            compacted = await compact_chunks(sensors)
+            log.info(f"Compacted {compacted} readings into chunks")
+        except Exception:
+            log.exception("Compaction run failed")
+
+        await asyncio.sleep(interval)
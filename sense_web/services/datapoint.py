@@ -1,11 +1,96 @@
+import asyncio
+import functools
+import heapq
+import itertools
 import uuid
-from typing import List
-from datetime import datetime
+from typing import (
+    Any,
+    AsyncIterator,
+    Collection,
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    Sequence,
+    Tuple,
+    overload,
+)
+from datetime import datetime, timedelta
 
-from sqlalchemy import select, delete
-from sense_web.db.models import DataPoint
+from sqlalchemy import (
+    BigInteger,
+    String,
+    Table,
+    and_,
+    bindparam,
+    cast,
+    delete,
+    insert,
+    null,
+    or_,
+    select,
+    type_coerce,
+    union_all,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import CompoundSelect, Select
+from sense_web.db.dialect import copy_rows, supports_copy
+from sense_web.db.ids import uuid7, uuid7_timestamp
+from sense_web.db.lookups import (
+    joined,
+    lookups,
+    sensor_is,
+    sensor_name,
+    units_name,
+)
+from sense_web.db.partitions import TEXT_POINTS, partition_name, partitions
 from sense_web.db.session import sessionmanager
-from sense_web.dto.datapoint import DataPointDTO
+from sense_web.dto.datapoint import DATAPOINT_LIST, DataPointDTO
+from sense_web.dto.series import SeriesDTO, series_from_rows
+from sense_web.exceptions import DataPointCompacted
+from sense_web.services.archive import archive, merge_rows
+from sense_web.services.chunks import (
+    get_chunk_datapoints,
+    get_chunk_series,
+    get_sensor_chunk_datapoints,
+    is_chunk_uuid,
+    merge_series,
+    newest_chunk_datapoint,
+)
+from sense_web.services.latest import (
+    delete_latest_value,
+    update_latest_values,
+)
+from sense_web.services.rollup import (
+    Reading,
+    numeric_value,
+    rebuild_rollups,
+    update_rollups,
+)
+
+# (timestamp, sensor, val_int, val_float, val_str, val_units)
+BulkReading = Tuple[
+    datetime, str, int | None, float | None, str | None, str | None
+]
+
+_BULK_COLUMNS = (
+    "uuid",
+    "device_uuid",
+    "timestamp",
+    "sensor_id",
+    "val_int",
+    "val_float",
+    "units_id",
+)
+_TEXT_COLUMNS = (*_BULK_COLUMNS, "val_str")
+
+# (device_uuid, timestamp, uuid) of a reading, the order sensor reads
+# are paged in
+DataCursor = Tuple[uuid.UUID, datetime, uuid.UUID]
+
+# Rows validated into DTOs at a time when reading a device's readings
+DATAPOINT_BATCH = 1000
 
 
 async def create_datapoint(
@@ -17,45 +102,736 @@ async def create_datapoint(
     val_str: str | None = None,
     val_units: str | None = None,
 ) -> DataPointDTO:
-    async with sessionmanager.session() as session:
-        dp = DataPoint(
-            uuid=uuid.uuid4(),
-            device_uuid=device_uuid,
-            timestamp=timestamp,
-            sensor=sensor,
-            val_int=val_int,
-            val_float=val_float,
-            val_str=val_str,
-            val_units=val_units,
-        )
-        dp_dto = DataPointDTO.model_validate(dp)
-        session.add(dp)
+    async with sessionmanager.session(device=device_uuid) as session:
+        values: Dict[str, Any] = {
+            "uuid": uuid7(timestamp),
+            "device_uuid": device_uuid,
+            "timestamp": timestamp,
+            "sensor": sensor,
+            "val_int": val_int,
+            "val_float": val_float,
+            "val_str": val_str,
+            "val_units": val_units,
+        }
+        dp_dto = DataPointDTO.model_validate(values)
+
+        row = {
+            "uuid": values["uuid"],
+            "device_uuid": device_uuid,
+            "timestamp": timestamp,
+            "sensor_id": await lookups.sensor_id(session, sensor),
+            "val_int": val_int,
+            "val_float": val_float,
+            "units_id": await lookups.units_id(session, val_units),
+        }
+
+        if val_str is None:
+            table = await partitions.table_for(session, timestamp)
+        else:
+            row["val_str"] = val_str
+            table = TEXT_POINTS
+        await session.execute(insert(table), row)
+
+        await update_latest_values(
+            session,
+            [
+                {
+                    "device_uuid": device_uuid,
+                    "sensor": sensor,
+                    "timestamp": timestamp,
+                    "val_int": val_int,
+                    "val_float": val_float,
+                    "val_str": val_str,
+                    "val_units": val_units,
+                }
+            ],
+        )
+
+        value = numeric_value(val_int, val_float)
+        if value is not None:
+            await update_rollups(
+                session, [(device_uuid, sensor, timestamp, value)]
+            )
+
         await session.commit()
         return dp_dto
 
 
+@overload
+async def create_datapoints_bulk(
+    device_uuid: uuid.UUID,
+    readings: Sequence[BulkReading],
+    return_ids: Literal[False] = False,
+) -> int: ...
+
+
+@overload
+async def create_datapoints_bulk(
+    device_uuid: uuid.UUID,
+    readings: Sequence[BulkReading],
+    return_ids: Literal[True],
+) -> List[uuid.UUID]: ...
+
+
+async def create_datapoints_bulk(
+    device_uuid: uuid.UUID,
+    readings: Sequence[BulkReading],
+    return_ids: bool = False,
+) -> int | List[uuid.UUID]:
+    """
+    Insert many readings from a single device in one transaction.
+
+    Readings are plain tuples in `BulkReading` order and are written
+    with a single executemany per table, or `COPY` on PostgreSQL with
+    asyncpg. No ORM objects or DTOs are built, so callers are expected
+    to have validated the readings already.
+
+    Returns the number of readings inserted, or their UUIDs in the
+    order given if `return_ids` is set.
+    """
+    if not readings:
+        return [] if return_ids else 0
+
+    ids = [uuid7(reading[0]) for reading in readings]
+
+    async with sessionmanager.session(device=device_uuid) as session:
+        sensor_ids = {
+            name: await lookups.sensor_id(session, name)
+            for name in {reading[1] for reading in readings}
+        }
+        units_ids = {
+            name: await lookups.units_id(session, name)
+            for name in {reading[5] for reading in readings}
+        }
+
+        by_table: Dict[str | None, List[Tuple[Any, ...]]] = {}
+        first: Dict[str | None, datetime] = {}
+        text_rows: List[Tuple[Any, ...]] = []
+        for id_, reading in zip(ids, readings, strict=True):
+            timestamp, sensor, val_int, val_float, val_str, val_units = reading
+            row = (
+                id_,
+                device_uuid,
+                timestamp,
+                sensor_ids[sensor],
+                val_int,
+                val_float,
+                units_ids[val_units],
+            )
+            if val_str is not None:
+                text_rows.append((*row, val_str))
+                continue
+            key = partition_name(timestamp) if partitions.enabled else None
+            first.setdefault(key, timestamp)
+            by_table.setdefault(key, []).append(row)
+
+        batches: List[Tuple[Table, Sequence[str], List[Tuple[Any, ...]]]] = [
+            (
+                await partitions.table_for(session, first[key]),
+                _BULK_COLUMNS,
+                rows,
+            )
+            for key, rows in by_table.items()
+        ]
+        if text_rows:
+            batches.append((TEXT_POINTS, _TEXT_COLUMNS, text_rows))
+
+        use_copy = supports_copy(session)
+        for table, columns, rows in batches:
+            if use_copy:
+                await copy_rows(session, table, columns, rows)
+            else:
+                await session.execute(
+                    insert(table),
+                    [dict(zip(columns, row, strict=True)) for row in rows],
+                )
+
+        await update_latest_values(
+            session,
+            (
+                {
+                    "device_uuid": device_uuid,
+                    "timestamp": reading[0],
+                    "sensor": reading[1],
+                    "val_int": reading[2],
+                    "val_float": reading[3],
+                    "val_str": reading[4],
+                    "val_units": reading[5],
+                }
+                for reading in readings
+            ),
+        )
+
+        numeric: List[Reading] = []
+        for timestamp, sensor, val_int, val_float, _, _ in readings:
+            value = numeric_value(val_int, val_float)
+            if value is not None:
+                numeric.append((device_uuid, sensor, timestamp, value))
+        if numeric:
+            await update_rollups(session, numeric)
+
+        await session.commit()
+
+    return ids if return_ids else len(ids)
+
+
+def _filters(
+    table: Table, sensor: bool, start: bool, end: bool
+) -> List[ColumnElement[bool]]:
+    filters = [table.c.device_uuid == bindparam("device_uuid")]
+    if sensor:
+        filters.append(sensor_is(table, bindparam("sensor")))
+    if start:
+        filters.append(table.c.timestamp >= bindparam("start"))
+    if end:
+        filters.append(table.c.timestamp < bindparam("end"))
+    return filters
+
+
+def _params(
+    device_uuid: uuid.UUID,
+    sensor: str | None,
+    start: datetime | None,
+    end: datetime | None,
+) -> Dict[str, Any]:
+    params = {
+        "device_uuid": device_uuid,
+        "sensor": sensor,
+        "start": start,
+        "end": end,
+    }
+    return {k: v for k, v in params.items() if v is not None}
+
+
+def _val_str(table: Table) -> ColumnElement[Any]:
+    # Numeric tables have no `val_str`, but are read alongside
+    # `text_points` as one set of rows
+    if "val_str" in table.c:
+        return table.c.val_str
+    return cast(null(), String).label("val_str")
+
+
+def _uuid(column: ColumnElement[Any]) -> ColumnElement[Any]:
+    # UUIDs are read as the database returns them and parsed while the
+    # DTOs are validated, which pydantic-core does far faster than
+    # SQLAlchemy's result processing building `uuid.UUID`s in Python
+    return type_coerce(column, String).label(column.key)
+
+
+def _union(selects: List[Select[Any]]) -> Select[Any] | CompoundSelect[Any]:
+    if len(selects) == 1:
+        return selects[0]
+    return union_all(*selects)
+
+
+# Reads are built once per combination of tables and filters, with the
+# filter values bound at execution, so repeated reads reuse both the
+# statement and its compiled SQL
+@functools.lru_cache(maxsize=256)
+def _datapoints_stmt(
+    tables: Tuple[Table, ...],
+    sensor: bool,
+    start: bool,
+    end: bool,
+    newest_first: bool = False,
+) -> Select[Any] | CompoundSelect[Any]:
+    stmt = _union(
+        [
+            select(
+                _uuid(t.c.uuid),
+                _uuid(t.c.device_uuid),
+                t.c.timestamp,
+                sensor_name(),
+                t.c.val_int,
+                t.c.val_float,
+                _val_str(t),
+                units_name(),
+            )
+            .select_from(joined(t))
+            .where(*_filters(t, sensor, start, end))
+            for t in tables
+        ]
+    )
+    if newest_first:
+        return stmt.order_by(stmt.selected_columns.timestamp.desc())
+    return stmt
+
+
+@functools.lru_cache(maxsize=256)
+def _rows_stmt(
+    tables: Tuple[Table, ...], sensor: bool, start: bool, end: bool
+) -> Select[Any] | CompoundSelect[Any]:
+    stmt = _union(
+        [
+            select(
+                sensor_name(),
+                type_coerce(t.c.timestamp, BigInteger).label("timestamp"),
+                t.c.val_int,
+                t.c.val_float,
+                _val_str(t),
+                units_name(),
+            )
+            .select_from(joined(t))
+            .where(*_filters(t, sensor, start, end))
+            for t in tables
+        ]
+    )
+    return stmt.order_by(
+        stmt.selected_columns.sensor, stmt.selected_columns.timestamp
+    )
+
+
 async def get_datapoints_by_device_uuid(
-    device_uuid: uuid.UUID, sort_descending: bool = True
+    device_uuid: uuid.UUID,
+    sort_descending: bool = True,
+    sensor: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    session: AsyncSession | None = None,
 ) -> List[DataPointDTO]:
-    async with sessionmanager.session() as session:
-        stmt = select(DataPoint).where(DataPoint.device_uuid == device_uuid)
-        result = await session.execute(stmt)
+    async with sessionmanager.reuse(
+        session, readonly=True, device=device_uuid
+    ) as db:
+        tables = await partitions.tables(db, start, end, text=True)
+        stmt = _datapoints_stmt(
+            tuple(tables),
+            sensor is not None,
+            start is not None,
+            end is not None,
+        )
+        result = await db.execute(
+            stmt, _params(device_uuid, sensor, start, end)
+        )
         if result is None:
             return []
 
-        datapoint_list = [
-            DataPointDTO.model_validate(dp) for dp in result.scalars().all()
+        # Validated a batch at a time, so that only one batch of rows is
+        # alive alongside the DTOs
+        datapoint_list: List[DataPointDTO] = []
+        for rows in result.partitions(DATAPOINT_BATCH):
+            datapoint_list.extend(
+                DATAPOINT_LIST.validate_python(rows, from_attributes=True)
+            )
+
+        chunked = await get_chunk_datapoints(
+            device_uuid, sensor, start, end, db
+        )
+
+    if archive.enabled:
+        # Archived readings are always older than those in the database
+        cold = await asyncio.to_thread(
+            archive.datapoints, device_uuid, sensor, start, end
+        )
+        datapoint_list = cold + datapoint_list
+
+    datapoint_list.extend(chunked)
+
+    if len(datapoint_list) > 1 and sort_descending:
+        datapoint_list.sort(key=lambda dp: dp.timestamp, reverse=True)
+
+    return datapoint_list
+
+
+def _newest(dp: DataPointDTO) -> datetime:
+    return dp.timestamp
+
+
+async def stream_datapoints_by_device_uuid(
+    device_uuid: uuid.UUID,
+    sensor: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    session: AsyncSession | None = None,
+    batch_size: int = DATAPOINT_BATCH,
+) -> AsyncIterator[List[DataPointDTO]]:
+    """
+    Yield the readings of a device newest first, about `batch_size` at
+    a time.
+
+    Rows are streamed from the database in timestamp order and merged
+    with the compacted and archived readings as they arrive, so a long
+    listing never holds more than one batch of database rows at once.
+    """
+    async with sessionmanager.reuse(
+        session, readonly=True, device=device_uuid
+    ) as db:
+        # Compacted and archived readings are already held as DTOs, so
+        # they are read up front and merged into the stream
+        older = await get_chunk_datapoints(device_uuid, sensor, start, end, db)
+        if archive.enabled:
+            older.extend(
+                await asyncio.to_thread(
+                    archive.datapoints, device_uuid, sensor, start, end
+                )
+            )
+        older.sort(key=_newest, reverse=True)
+
+        tables = await partitions.tables(db, start, end, text=True)
+        stmt = _datapoints_stmt(
+            tuple(tables),
+            sensor is not None,
+            start is not None,
+            end is not None,
+            newest_first=True,
+        )
+        result = await db.stream(
+            stmt, _params(device_uuid, sensor, start, end)
+        )
+        taken = 0
+        async for rows in result.partitions(batch_size):
+            batch = DATAPOINT_LIST.validate_python(rows, from_attributes=True)
+            oldest = batch[-1].timestamp
+            merged = taken
+            while merged < len(older) and older[merged].timestamp >= oldest:
+                merged += 1
+            if merged > taken:
+                batch = list(
+                    heapq.merge(
+                        batch, older[taken:merged], key=_newest, reverse=True
+                    )
+                )
+                taken = merged
+            yield batch
+
+    for i in range(taken, len(older), batch_size):
+        yield older[i : i + batch_size]
+
+
+def _sensor_filters(
+    table: Table, devices: bool, start: bool, end: bool
+) -> List[ColumnElement[bool]]:
+    # Led by the sensor, so numeric tables are read through
+    # `idx_sensor_time` whichever devices are asked for
+    filters = [sensor_is(table, bindparam("sensor"))]
+    if start:
+        filters.append(table.c.timestamp >= bindparam("start"))
+    if end:
+        filters.append(table.c.timestamp < bindparam("end"))
+    if devices:
+        filters.append(
+            table.c.device_uuid.in_(bindparam("devices", expanding=True))
+        )
+    return filters
+
+
+def _after_cursor(table: Table) -> ColumnElement[bool]:
+    # Spelled out rather than as a row value comparison so each column
+    # binds through its own type
+    device = table.c.device_uuid
+    return or_(
+        device > bindparam("after_device"),
+        and_(
+            device == bindparam("after_device"),
+            or_(
+                table.c.timestamp > bindparam("after_time"),
+                and_(
+                    table.c.timestamp == bindparam("after_time"),
+                    table.c.uuid > bindparam("after_uuid"),
+                ),
+            ),
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _sensor_stmt(
+    tables: Tuple[Table, ...],
+    devices: bool,
+    start: bool,
+    end: bool,
+    after: bool = False,
+    limit: bool = False,
+) -> Select[Any] | CompoundSelect[Any]:
+    stmt = _union(
+        [
+            select(
+                _uuid(t.c.uuid),
+                _uuid(t.c.device_uuid),
+                t.c.timestamp,
+                sensor_name(),
+                t.c.val_int,
+                t.c.val_float,
+                _val_str(t),
+                units_name(),
+            )
+            .select_from(joined(t))
+            .where(
+                *_sensor_filters(t, devices, start, end),
+                *([_after_cursor(t)] if after else []),
+            )
+            for t in tables
         ]
+    )
+    # Ordered in the database, so each shard's rows can be merged with
+    # the compacted and archived readings without sorting them again
+    columns = stmt.selected_columns
+    stmt = stmt.order_by(columns.device_uuid, columns.timestamp, columns.uuid)
+    if not limit:
+        return stmt
+    return stmt.limit(bindparam("limit"))
 
-        if len(datapoint_list) > 1 and sort_descending:
-            datapoint_list.sort(key=lambda dp: dp.timestamp, reverse=True)
 
-        return datapoint_list
+# Order of `get_datapoints_by_sensor`, and the cursor that pages it
+def _sensor_order(dp: DataPointDTO) -> DataCursor:
+    return (dp.device_uuid, dp.timestamp, dp.uuid)
 
 
-async def delete_datapoint(datapoint_uuid: uuid.UUID) -> bool:
-    async with sessionmanager.session() as session:
-        stmt = delete(DataPoint).where(DataPoint.uuid == datapoint_uuid)
-        result = await session.execute(stmt)
-        await session.commit()
-        return result.rowcount > 0
+async def get_datapoints_by_sensor(
+    sensor: str,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    devices: Collection[uuid.UUID] | None = None,
+    session: AsyncSession | None = None,
+    *,
+    after: DataCursor | None = None,
+    limit: int | None = None,
+) -> List[DataPointDTO]:
+    """
+    Fetch one sensor's readings across every device, or only across
+    `devices`, ordered by device, timestamp and UUID.
+
+    Each table is read with one scan of its sensor and time index
+    rather than one query per device. On a sharded database only the
+    shards holding the requested devices are read. Archived and
+    compacted readings in the range are merged in.
+
+    With `limit` at most that many readings are returned, and only
+    those ordered after the `after` cursor, which is the
+    `(device_uuid, timestamp, uuid)` of the last reading of the
+    previous page.
+    """
+    if devices is not None and not devices:
+        return []
+
+    shards = None
+    if devices is not None:
+        shards = {sessionmanager.shard_for(d) for d in devices}
+
+    params: Dict[str, Any] = {
+        "sensor": sensor,
+        "start": start,
+        "end": end,
+        "limit": limit,
+    }
+    if devices is not None:
+        params["devices"] = list(devices)
+    if after is not None:
+        params["after_device"], params["after_time"], params["after_uuid"] = (
+            after
+        )
+    params = {k: v for k, v in params.items() if v is not None}
+
+    def page(datapoints: Iterable[DataPointDTO]) -> List[DataPointDTO]:
+        # Compacted and archived readings are read for the whole range,
+        # so each source is cut to one page before it is merged
+        if after is not None:
+            datapoints = (dp for dp in datapoints if _sensor_order(dp) > after)
+        if limit is None:
+            return sorted(datapoints, key=_sensor_order)
+        return heapq.nsmallest(limit, datapoints, key=_sensor_order)
+
+    def merge(sources: Iterable[List[DataPointDTO]]) -> List[DataPointDTO]:
+        merged = heapq.merge(*sources, key=_sensor_order)
+        return list(itertools.islice(merged, limit))
+
+    async def read_shard(shard: int | None) -> List[DataPointDTO]:
+        if shards is not None and shard not in shards:
+            return []
+        async with sessionmanager.reuse(
+            session, readonly=True, shard=shard
+        ) as db:
+            tables = await partitions.tables(db, start, end, text=True)
+            stmt = _sensor_stmt(
+                tuple(tables),
+                devices is not None,
+                start is not None,
+                end is not None,
+                after is not None,
+                limit is not None,
+            )
+            result = await db.execute(stmt, params)
+            datapoints: List[DataPointDTO] = []
+            for rows in result.partitions(DATAPOINT_BATCH):
+                datapoints.extend(
+                    DATAPOINT_LIST.validate_python(rows, from_attributes=True)
+                )
+            chunked = page(
+                await get_sensor_chunk_datapoints(
+                    db, sensor, start, end, devices
+                )
+            )
+            return merge([datapoints, chunked])
+
+    sources = await sessionmanager.fan_out(read_shard)
+    if archive.enabled:
+        sources.append(
+            page(
+                await asyncio.to_thread(
+                    archive.sensor_datapoints, sensor, start, end, devices
+                )
+            )
+        )
+
+    return merge(sources)
+
+
+async def get_datapoint_rows_by_device_uuid(
+    device_uuid: uuid.UUID,
+    sensor: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    session: AsyncSession | None = None,
+) -> Sequence[Any]:
+    """
+    Fetch the columns needed to build a `SeriesDTO` as plain rows,
+    ordered by sensor and timestamp. No ORM objects or DTOs are built,
+    and timestamps are returned as stored, in epoch microseconds.
+    Archived readings in the range are merged in.
+    """
+    async with sessionmanager.reuse(
+        session, readonly=True, device=device_uuid
+    ) as db:
+        tables = await partitions.tables(db, start, end, text=True)
+        stmt = _rows_stmt(
+            tuple(tables),
+            sensor is not None,
+            start is not None,
+            end is not None,
+        )
+        result = await db.execute(
+            stmt, _params(device_uuid, sensor, start, end)
+        )
+        rows: Sequence[Any] = result.all()
+
+    if archive.enabled:
+        cold = await asyncio.to_thread(
+            archive.rows, device_uuid, sensor, start, end
+        )
+        rows = merge_rows(rows, cold)
+
+    return rows
+
+
+async def get_series_by_device_uuid(
+    device_uuid: uuid.UUID,
+    sensor: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    session: AsyncSession | None = None,
+) -> List[SeriesDTO]:
+    """
+    Fetch a device's readings as one `SeriesDTO` per sensor, merging
+    raw readings with those compacted into chunks.
+    """
+    rows = await get_datapoint_rows_by_device_uuid(
+        device_uuid, sensor=sensor, start=start, end=end, session=session
+    )
+    chunked = await get_chunk_series(device_uuid, sensor, start, end, session)
+    return merge_series(series_from_rows(rows), chunked)
+
+
+async def _newest_reading(
+    session: AsyncSession, device_uuid: uuid.UUID, sensor: str
+) -> Dict[str, Any] | None:
+    # The newest reading of a device's sensor still in the database, as
+    # `LatestValue` columns. Each table is read through its device,
+    # sensor and time index, newest first.
+    newest: Dict[str, Any] | None = None
+    for table in await partitions.tables(session, text=True):
+        stmt = (
+            select(
+                table.c.timestamp,
+                table.c.val_int,
+                table.c.val_float,
+                _val_str(table),
+                units_name(),
+            )
+            .select_from(joined(table))
+            .where(
+                table.c.device_uuid == device_uuid, sensor_is(table, sensor)
+            )
+            .order_by(table.c.timestamp.desc())
+            .limit(1)
+        )
+        row = (await session.execute(stmt)).first()
+        if row is not None and (
+            newest is None or row.timestamp > newest["timestamp"]
+        ):
+            newest = row._asdict()
+
+    chunked = await newest_chunk_datapoint(session, device_uuid, sensor)
+    if chunked is not None and (
+        newest is None or chunked.timestamp > newest["timestamp"]
+    ):
+        newest = chunked.model_dump(
+            include={
+                "timestamp",
+                "val_int",
+                "val_float",
+                "val_str",
+                "val_units",
+            }
+        )
+
+    if newest is not None:
+        newest.update(device_uuid=device_uuid, sensor=sensor)
+    return newest
+
+
+async def delete_datapoint(
+    device_uuid: uuid.UUID,
+    datapoint_uuid: uuid.UUID,
+    session: AsyncSession | None = None,
+) -> bool:
+    """
+    Delete one reading of a device. Its sensor's latest value and
+    rollup buckets are brought back in step in the same transaction.
+
+    Raises:
+        DataPointCompacted: If the reading has been compacted into a
+            chunk, which has no per-reading rows to delete.
+    """
+    if is_chunk_uuid(datapoint_uuid):
+        raise DataPointCompacted(
+            f"Datapoint {datapoint_uuid} has been compacted into a chunk"
+        )
+
+    # A UUIDv7 carries the millisecond its reading was taken, so only
+    # the partition holding that time needs to be searched.
+    start = uuid7_timestamp(datapoint_uuid)
+    end = None if start is None else start + timedelta(milliseconds=1)
+
+    async with sessionmanager.reuse(session, device=device_uuid) as db:
+        for table in await partitions.tables(db, start, end, text=True):
+            found = (table.c.uuid == datapoint_uuid) & (
+                table.c.device_uuid == device_uuid
+            )
+            stmt = (
+                select(
+                    sensor_name(),
+                    table.c.timestamp,
+                    table.c.val_int,
+                    table.c.val_float,
+                )
+                .select_from(joined(table))
+                .where(found)
+            )
+            row = (await db.execute(stmt)).first()
+            if row is not None:
+                await db.execute(delete(table).where(found))
+                break
+        else:
+            return False
+
+        sensor, timestamp, val_int, val_float = row
+
+        if await delete_latest_value(db, device_uuid, sensor, timestamp):
+            newest = await _newest_reading(db, device_uuid, sensor)
+            if newest is not None:
+                await update_latest_values(db, [newest])
+
+        if numeric_value(val_int, val_float) is not None:
+            await rebuild_rollups(db, device_uuid, sensor, timestamp)
+
+        await db.commit()
+        return True
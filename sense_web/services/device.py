@@ -1,47 +1,311 @@
+import datetime
+import functools
+import sys
 import uuid
-from typing import List, Optional
-from sqlalchemy import select
+from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
+from sqlalchemy import (
+    CursorResult,
+    Select,
+    Table,
+    bindparam,
+    delete,
+    insert,
+    select,
+    update,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 from sense_web.exceptions import DeviceAlreadyExists
-from sense_web.db.models import Device
+from sense_web.db.dialect import upsert
+from sense_web.db.ids import uuid7
+from sense_web.db.models import (
+    DataPointRollup,
+    Device,
+    DeviceStatus,
+    LatestValue,
+    SeriesChunk,
+)
+from sense_web.db.partitions import partitions
 from sense_web.db.session import sessionmanager
-from sense_web.dto.device import DeviceDTO
+from sense_web.db.versions import bump_version, get_version
+from sense_web.dto.device import DEVICE_LIST, DeviceDTO
 
+# Built once and run with bound parameters, so their SQL is compiled on
+# the first call and served from the engine's statement cache after that.
+# They select plain columns, so no ORM objects are built.
+_COLUMNS = (Device.uuid, Device.imei, Device.name)
+_BY_UUID = select(*_COLUMNS).where(Device.uuid == bindparam("uuid"))
+_BY_IMEI = select(*_COLUMNS).where(Device.imei == bindparam("imei"))
+_DELETE = delete(Device).where(Device.uuid == bindparam("uuid"))
+_DELETE_STATUS = delete(DeviceStatus).where(
+    DeviceStatus.device_uuid == bindparam("uuid")
+)
 
-async def register_device(imei: str, name: str) -> DeviceDTO:
-    async with sessionmanager.session() as session:
-        stmt = select(Device).where(Device.imei == imei)
-        existing = (await session.execute(stmt)).scalars().first()
+# The device list shows each device's activity, so it changes with both
+_LIST_TABLES = (Device.__tablename__, DeviceStatus.__tablename__)
+
+
+@functools.lru_cache(maxsize=None)
+def _list_stmt(
+    after: bool, limit: bool, name_prefix: bool, imei_prefix: bool
+) -> Select[str, str, str]:
+    stmt = select(*_COLUMNS).order_by(Device.uuid)
+    if after:
+        stmt = stmt.where(Device.uuid > bindparam("after"))
+    for column, prefix in (
+        (Device.name, name_prefix),
+        (Device.imei, imei_prefix),
+    ):
+        if prefix:
+            # The range lets the column's index be used; LIKE keeps the
+            # match exact under collations that fold case or accents.
+            key = column.key
+            stmt = stmt.where(
+                column >= bindparam(f"{key}_low"),
+                column < bindparam(f"{key}_high"),
+                column.like(bindparam(f"{key}_pattern"), escape="/"),
+            )
+    if limit:
+        stmt = stmt.limit(bindparam("limit"))
+    return stmt
+
+
+def _prefix_params(key: str, prefix: str) -> Dict[str, str]:
+    # The smallest string that sorts after every string with `prefix`
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    high = (
+        stem[:-1] + chr(ord(stem[-1]) + 1)
+        if stem
+        else prefix + chr(sys.maxunicode)
+    )
+    escaped = prefix.replace("/", "//").replace("%", "/%").replace("_", "/_")
+    return {
+        f"{key}_low": prefix,
+        f"{key}_high": high,
+        f"{key}_pattern": escaped + "%",
+    }
+
+
+async def register_device(
+    imei: str, name: str, session: AsyncSession | None = None
+) -> DeviceDTO:
+    async with sessionmanager.reuse(session) as db:
+        result = await db.execute(_BY_IMEI, {"imei": imei})
+        existing = result.first()
         if existing is not None:
             raise DeviceAlreadyExists(
                 f"Device with IMEI {imei} already exists."
             )
-        device_uuid = uuid.uuid4()
+        device_uuid = uuid7()
         device = Device(imei=imei, uuid=device_uuid, name=name)
         device_dto = DeviceDTO.model_validate(device)
-        session.add(device)
-        await session.commit()
-        return device_dto
+        db.add(device)
+        await bump_version(db, Device.__tablename__)
+        await db.commit()
+
+    # Readings reference their device, so a sharded device is copied to
+    # the shard that will hold them
+    if sessionmanager.shard_for(device_uuid) is not None:
+        async with sessionmanager.session(device=device_uuid) as shard_session:
+            shard_session.add(Device(imei=imei, uuid=device_uuid, name=name))
+            await shard_session.commit()
+
+    return device_dto
+
+
+def is_valid_imei(imei: str) -> bool:
+    """Check that `imei` is 15 digits ending in a valid Luhn check digit."""
+    if len(imei) != 15 or not imei.isdigit():
+        return False
+    total = 0
+    for i, digit in enumerate(map(int, imei)):
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+async def register_devices(
+    devices: Sequence[Tuple[str, str]], session: AsyncSession | None = None
+) -> List[DeviceDTO | None]:
+    """
+    Register many devices, given as `(imei, name)` pairs, in a single
+    transaction.
+
+    All devices are inserted with one statement that skips IMEIs that
+    are already registered, so conflicts are found by the database in
+    one pass and devices registered concurrently are never duplicated.
+
+    Returns the registered device for each pair in the order given, or
+    `None` where the IMEI was already registered or repeats an earlier
+    pair.
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    for imei, name in devices:
+        rows.setdefault(imei, {"imei": imei, "uuid": uuid7(), "name": name})
+    if not rows:
+        return []
+
+    async with sessionmanager.reuse(session) as db:
+        stmt = (
+            upsert(db, Device.__table__)
+            .on_conflict_do_nothing(index_elements=["imei"])
+            .returning(Device.imei)
+        )
+        result = await db.execute(stmt, list(rows.values()))
+        created = set(result.scalars())
+        if created:
+            await bump_version(db, Device.__tablename__)
+        await db.commit()
 
+    by_shard: Dict[int, List[Dict[str, Any]]] = {}
+    for imei in created:
+        shard = sessionmanager.shard_for(rows[imei]["uuid"])
+        if shard is not None:
+            by_shard.setdefault(shard, []).append(rows[imei])
+    for shard, shard_rows in by_shard.items():
+        async with sessionmanager.session(shard=shard) as shard_session:
+            await shard_session.execute(insert(Device), shard_rows)
+            await shard_session.commit()
 
-async def get_device_by_uuid(uuid: uuid.UUID) -> Optional[DeviceDTO]:
-    async with sessionmanager.session() as session:
-        stmt = select(Device).where(Device.uuid == uuid)
-        result = (await session.execute(stmt)).scalars().one_or_none()
-        if result is None:
+    registered: List[DeviceDTO | None] = []
+    for imei, _ in devices:
+        if imei in created:
+            registered.append(DeviceDTO.model_validate(rows[imei]))
+            created.discard(imei)
+        else:
+            registered.append(None)
+    return registered
+
+
+async def get_device_by_uuid(
+    uuid: uuid.UUID, session: AsyncSession | None = None
+) -> Optional[DeviceDTO]:
+    async with sessionmanager.reuse(session, readonly=True) as db:
+        result = await db.execute(_BY_UUID, {"uuid": uuid})
+        row = result.one_or_none()
+        if row is None:
             return None
-        return DeviceDTO.model_validate(result)
+        return DeviceDTO.model_validate(row)
 
 
-async def get_device_by_imei(imei: str) -> Optional[DeviceDTO]:
-    async with sessionmanager.session() as session:
-        stmt = select(Device).where(Device.imei == imei)
-        result = (await session.execute(stmt)).scalars().one_or_none()
-        if result is None:
+async def get_device_by_imei(
+    imei: str, session: AsyncSession | None = None
+) -> Optional[DeviceDTO]:
+    async with sessionmanager.reuse(session, readonly=True) as db:
+        result = await db.execute(_BY_IMEI, {"imei": imei})
+        row = result.one_or_none()
+        if row is None:
             return None
-        return DeviceDTO.model_validate(result)
+        return DeviceDTO.model_validate(row)
+
+
+async def list_devices(
+    session: AsyncSession | None = None,
+    *,
+    after: uuid.UUID | None = None,
+    limit: int | None = None,
+    name_prefix: str | None = None,
+    imei_prefix: str | None = None,
+) -> List[DeviceDTO]:
+    """
+    List devices ordered by UUID, which for UUIDv7s is roughly the order
+    they were registered in.
+
+    At most `limit` devices are returned. Pass the UUID of the last
+    device of one page as `after` to fetch the next page; the page is
+    found through the UUID index however deep it is. Devices can be
+    filtered by the start of their name or IMEI, both of which are
+    indexed.
+    """
+    params: Dict[str, Any] = {"after": after, "limit": limit}
+    if name_prefix:
+        params.update(_prefix_params("name", name_prefix))
+    if imei_prefix:
+        params.update(_prefix_params("imei", imei_prefix))
+
+    stmt = _list_stmt(
+        after is not None,
+        limit is not None,
+        bool(name_prefix),
+        bool(imei_prefix),
+    )
+    async with sessionmanager.reuse(session, readonly=True) as db:
+        result = await db.execute(stmt, params)
+        return DEVICE_LIST.validate_python(result.all(), from_attributes=True)
+
+
+async def get_devices_version(
+    session: AsyncSession | None = None,
+) -> Tuple[int, datetime.datetime]:
+    """
+    Return the version of the device list and when it last changed.
 
+    The version is bumped by every registration, rename and deletion
+    and every flush of device activity, so clients can be told whether
+    their copy of the list is current without reading it. It is 0
+    before the first change.
+    """
+    async with sessionmanager.reuse(session, readonly=True) as db:
+        return await get_version(db, _LIST_TABLES)
+
+
+async def rename_device(
+    uuid: uuid.UUID, name: str, session: AsyncSession | None = None
+) -> Optional[DeviceDTO]:
+    """Rename a device, returning it or `None` if it does not exist."""
+    stmt = (
+        update(Device)
+        .where(Device.uuid == uuid)
+        .values(name=name)
+        .returning(*_COLUMNS)
+    )
+    async with sessionmanager.reuse(session) as db:
+        row = (await db.execute(stmt)).one_or_none()
+        if row is not None:
+            await bump_version(db, Device.__tablename__)
+        await db.commit()
+
+    if row is not None and sessionmanager.shard_for(uuid) is not None:
+        async with sessionmanager.session(device=uuid) as shard_session:
+            await shard_session.execute(stmt)
+            await shard_session.commit()
+
+    return None if row is None else DeviceDTO.model_validate(row)
+
+
+async def delete_device(
+    uuid: uuid.UUID, session: AsyncSession | None = None
+) -> bool:
+    """
+    Delete a device along with its readings, latest values, rollups,
+    chunks and activity. Readings already moved to the archive are kept.
+
+    Returns whether the device existed.
+    """
+    async with sessionmanager.reuse(session, device=uuid) as data_session:
+        tables = [
+            *await partitions.tables(data_session, text=True),
+            cast(Table, LatestValue.__table__),
+            cast(Table, DataPointRollup.__table__),
+            cast(Table, SeriesChunk.__table__),
+        ]
+        for table in tables:
+            await data_session.execute(
+                delete(table).where(table.c.device_uuid == uuid)
+            )
+        if sessionmanager.shard_for(uuid) is not None:
+            await data_session.execute(_DELETE, {"uuid": uuid})
+        await data_session.commit()
 
-async def list_devices() -> List[DeviceDTO]:
-    async with sessionmanager.session() as session:
-        result = await session.execute(select(Device))
-        return [DeviceDTO.model_validate(r) for r in result.scalars().all()]
+    async with sessionmanager.reuse(session) as db:
+        await db.execute(_DELETE_STATUS, {"uuid": uuid})
+        result = cast(
+            CursorResult[Any], await db.execute(_DELETE, {"uuid": uuid})
+        )
+        deleted = result.rowcount > 0
+        if deleted:
+            await bump_version(db, Device.__tablename__)
+        await db.commit()
+        return deleted
@@ -0,0 +1,72 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sense_web.dto.device import DeviceDTO
+from sense_web.services.device import get_device_by_uuid
+
+
+class DeviceDirectory:
+    """
+    An in-process, read-through cache of registered devices by UUID,
+    used to confirm a device exists without touching the database.
+
+    Use `init()` to configure and clear the cache and `get()` to look a
+    device up. At most `max_size` devices are kept, the least recently
+    used being evicted first, and each is reloaded once it is older
+    than `ttl` seconds. Devices that are not found are not cached, so a
+    newly registered device is visible straight away.
+
+    Processes that rename or delete devices publish the device's UUID
+    on `PubSubChannels.DEVICE_UPDATE`, and batch registrations publish
+    a comma separated list of UUIDs; pass `invalidate()` as the
+    subscriber callback so every process drops its copy. The TTL bounds
+    how stale an entry can get if an event is missed.
+    """
+
+    def __init__(self) -> None:
+        self._max_size = 1024
+        self._ttl = 60.0
+        self._devices: OrderedDict[uuid.UUID, Tuple[float, DeviceDTO]] = (
+            OrderedDict()
+        )
+
+    def init(self, max_size: int, ttl: float) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._devices = OrderedDict()
+
+    async def get(
+        self, device_uuid: uuid.UUID, session: AsyncSession | None = None
+    ) -> DeviceDTO | None:
+        entry = self._devices.get(device_uuid)
+        if entry is not None:
+            expires, device = entry
+            if expires > time.monotonic():
+                self._devices.move_to_end(device_uuid)
+                return device
+            del self._devices[device_uuid]
+
+        found = await get_device_by_uuid(device_uuid, session)
+        if found is not None:
+            self.put(found)
+        return found
+
+    def put(self, device: DeviceDTO) -> None:
+        self._devices[device.uuid] = (time.monotonic() + self._ttl, device)
+        self._devices.move_to_end(device.uuid)
+        while len(self._devices) > self._max_size:
+            self._devices.popitem(last=False)
+
+    def discard(self, device_uuid: uuid.UUID) -> None:
+        self._devices.pop(device_uuid, None)
+
+    async def invalidate(self, message: str) -> None:
+        for device_uuid in message.split(","):
+            self.discard(uuid.UUID(device_uuid))
+
+
+directory = DeviceDirectory()
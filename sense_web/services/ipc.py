@@ -1,19 +1,26 @@
 import asyncio
+import logging
 from enum import Enum
-from typing import Any, Callable
+from typing import Any, Callable, Sequence
 import redis.asyncio as redis
 import json
 
+log = logging.getLogger("ipc")
+
 
 class PubSubChannels(Enum):
     DEVICE_REGISTRATION = "reg"
+    DEVICE_UPDATE = "dev"
+    DATAPOINT = "dp"
+    DATAPOINT_DELETE = "dpdel"
 
 
 class IPC:
     def __init__(self) -> None:
         self._backend: redis.Redis | None = None
         self._pubsub: redis.client.PubSub | None = None
-        self._subscriber_tasks: dict[str, asyncio.Task[Any]] = {}
+        self._callbacks: dict[str, Callable[[str], Any]] = {}
+        self._listener: asyncio.Task[Any] | None = None
 
     async def init(
         self,
@@ -64,32 +71,67 @@ class IPC:
 
         await self._backend.publish(channel, message)
 
+    async def publish_many(
+        self, channel: str, messages: Sequence[str]
+    ) -> None:
+        """
+        Publish `messages` to `channel` in order, in a single round trip.
+        """
+        if self._backend is None:
+            raise RuntimeError("IPC not initialised")
+
+        async with self._backend.pipeline(transaction=False) as pipe:
+            for message in messages:
+                pipe.publish(channel, message)
+            await pipe.execute()
+
     async def subscribe(
         self, channel: str, callback: Callable[[str], Any]
     ) -> None:
+        """
+        Call `callback` with each message published to `channel`. All
+        channels share one connection, read by a single listener that
+        dispatches each message to the callback for its channel.
+        """
         if self._pubsub is None:
             raise RuntimeError("IPC not initialised")
 
-        async def _listener() -> None:
-            if self._pubsub is None:
-                raise RuntimeError("IPC not initialised")
+        self._callbacks[channel] = callback
+        await self._pubsub.subscribe(channel)
 
-            await self._pubsub.subscribe(channel)
-            async for msg in self._pubsub.listen():
-                if msg["type"] == "message":
-                    await callback(msg["data"])
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
 
-        task = asyncio.create_task(_listener())
-        self._subscriber_tasks[channel] = task
+    async def _listen(self) -> None:
+        if self._pubsub is None:
+            raise RuntimeError("IPC not initialised")
+
+        async for msg in self._pubsub.listen():
+            if msg["type"] != "message":
+                continue
+            callback = self._callbacks.get(msg["channel"])
+            if callback is None:
+                continue
+            try:
+                await callback(msg["data"])
+            except Exception:
+                # Keep delivering to the other channels
+                log.exception(f"Callback for {msg['channel']} failed")
 
     async def unsubscribe(self, channel: str) -> None:
-        task = self._subscriber_tasks.pop(channel, None)
-        if task:
-            task.cancel()
+        if self._callbacks.pop(channel, None) is None:
+            return
+
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(channel)
+
+        if not self._callbacks and self._listener is not None:
+            self._listener.cancel()
             try:
-                await task
+                await self._listener
             except asyncio.CancelledError:
                 pass
+            self._listener = None
 
 
 ipc = IPC()
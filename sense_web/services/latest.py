@@ -0,0 +1,125 @@
+import datetime
+import uuid
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sense_web.db.dialect import upsert
+from sense_web.db.models import LatestValue
+from sense_web.db.session import sessionmanager
+from sense_web.dto.datapoint import LATEST_VALUE_LIST, LatestValueDTO
+
+# Read as plain rows rather than entities, so no ORM objects are built
+_COLUMNS = LatestValue.__table__.c
+
+
+async def update_latest_values(
+    session: AsyncSession, readings: Iterable[Dict[str, Any]]
+) -> None:
+    """
+    Record readings as the latest value for their device and sensor.
+
+    Each reading is a dict of `LatestValue` columns. Readings older
+    than the stored value are ignored, so late or out-of-order
+    deliveries never overwrite a newer reading. The caller owns the
+    transaction.
+    """
+    latest: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+    for reading in readings:
+        key = (reading["device_uuid"], reading["sensor"])
+        current = latest.get(key)
+        if current is None or reading["timestamp"] >= current["timestamp"]:
+            latest[key] = reading
+
+    if not latest:
+        return
+
+    table = LatestValue.__table__
+    stmt = upsert(session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.device_uuid, table.c.sensor],
+        set_={
+            "timestamp": stmt.excluded.timestamp,
+            "val_int": stmt.excluded.val_int,
+            "val_float": stmt.excluded.val_float,
+            "val_str": stmt.excluded.val_str,
+            "val_units": stmt.excluded.val_units,
+        },
+        where=stmt.excluded.timestamp >= table.c.timestamp,
+    )
+    await session.execute(stmt, list(latest.values()))
+
+
+async def delete_latest_value(
+    session: AsyncSession,
+    device_uuid: uuid.UUID,
+    sensor: str,
+    timestamp: datetime.datetime,
+) -> bool:
+    """
+    Remove the latest value of a device's sensor if it was recorded at
+    `timestamp`, returning whether it was. The caller owns the
+    transaction.
+    """
+    stmt = (
+        delete(LatestValue)
+        .where(
+            LatestValue.device_uuid == device_uuid,
+            LatestValue.sensor == sensor,
+            LatestValue.timestamp == timestamp,
+        )
+        .returning(LatestValue.sensor)
+    )
+    result = await session.execute(stmt)
+    return result.first() is not None
+
+
+async def get_latest_by_device_uuid(
+    device_uuid: uuid.UUID,
+    session: AsyncSession | None = None,
+) -> List[LatestValueDTO]:
+    async with sessionmanager.reuse(
+        session, readonly=True, device=device_uuid
+    ) as db:
+        stmt = (
+            select(*_COLUMNS)
+            .where(LatestValue.device_uuid == device_uuid)
+            .order_by(LatestValue.sensor)
+        )
+        result = await db.execute(stmt)
+        return LATEST_VALUE_LIST.validate_python(
+            result.all(), from_attributes=True
+        )
+
+
+async def list_latest(
+    session: AsyncSession | None = None,
+    devices: Sequence[uuid.UUID] | None = None,
+) -> List[LatestValueDTO]:
+    """
+    List the latest value of every sensor, ordered by device and sensor.
+    Pass `devices` to only list the values of those devices.
+    """
+    stmt = select(*_COLUMNS).order_by(
+        LatestValue.device_uuid, LatestValue.sensor
+    )
+    if devices is not None:
+        stmt = stmt.where(LatestValue.device_uuid.in_(devices))
+
+    async def list_shard(shard: int | None) -> List[LatestValueDTO]:
+        async with sessionmanager.reuse(
+            session, readonly=True, shard=shard
+        ) as shard_session:
+            result = await shard_session.execute(stmt)
+            return LATEST_VALUE_LIST.validate_python(
+                result.all(), from_attributes=True
+            )
+
+    shards = await sessionmanager.fan_out(list_shard)
+    if len(shards) == 1:
+        return shards[0]
+    return sorted(
+        (latest for shard in shards for latest in shard),
+        key=lambda v: (v.device_uuid, v.sensor),
+    )
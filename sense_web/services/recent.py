@@ -0,0 +1,292 @@
+import datetime
+import time
+import uuid
+from array import array
+from itertools import pairwise
+from typing import Dict, List, Tuple
+
+from sense_web.dto.datapoint import DataPointDTO
+from sense_web.dto.series import SeriesDTO, to_epoch_us
+
+
+class RingBuffer:
+    """
+    A fixed-capacity, array-backed buffer of the most recent numeric
+    readings for a single device and sensor.
+
+    Storage is allocated once up front and overwritten in place, so
+    appending a reading never allocates. The buffer tracks the newest
+    timestamp it has evicted or could not hold; any range starting
+    after that is known to be complete.
+    """
+
+    __slots__ = (
+        "capacity",
+        "timestamps",
+        "values",
+        "is_int",
+        "uuids",
+        "val_units",
+        "head",
+        "size",
+        "evicted_until",
+    )
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.timestamps = array("q", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.is_int = bytearray(capacity)
+        self.uuids = bytearray(16 * capacity)
+        self.val_units: str | None = None
+        self.head = 0
+        self.size = 0
+        self.evicted_until = -(2**63)
+
+    def skip(self, timestamp: int) -> None:
+        """
+        Record a reading at `timestamp` that is not buffered, so ranges
+        including it are no longer answered from the buffer.
+        """
+        self.evicted_until = max(self.evicted_until, timestamp)
+
+    def clear(self) -> None:
+        """Evict every buffered reading."""
+        for n in range(self.size):
+            self.skip(self.timestamps[(self.head + n) % self.capacity])
+        self.head = 0
+        self.size = 0
+        self.val_units = None
+
+    def append(self, dp: DataPointDTO) -> None:
+        timestamp = to_epoch_us(dp.timestamp)
+
+        if dp.val_str is not None or (
+            dp.val_float is None and dp.val_int is None
+        ):
+            # Only numeric readings are buffered
+            self.skip(timestamp)
+            return
+
+        if self.size and dp.val_units != self.val_units:
+            # The buffer holds one unit, so the readings in the old one
+            # are evicted to make way for the new one
+            self.clear()
+
+        i = (self.head + self.size) % self.capacity
+
+        if self.size == self.capacity:
+            self.evicted_until = max(self.evicted_until, self.timestamps[i])
+            self.head = (self.head + 1) % self.capacity
+        else:
+            self.size += 1
+
+        self.timestamps[i] = timestamp
+        if dp.val_float is not None:
+            self.values[i] = dp.val_float
+            self.is_int[i] = 0
+        elif dp.val_int is not None:
+            self.values[i] = float(dp.val_int)
+            self.is_int[i] = 1
+        self.uuids[16 * i : 16 * (i + 1)] = dp.uuid.bytes
+        self.val_units = dp.val_units
+
+    def remove(self, datapoint_uuid: uuid.UUID) -> bool:
+        """
+        Drop the reading with UUID `datapoint_uuid`, moving the newer
+        readings down a slot to close the gap.
+        """
+        target = datapoint_uuid.bytes
+        slots = [(self.head + n) % self.capacity for n in range(self.size)]
+        for n, i in enumerate(slots):
+            if self.uuids[16 * i : 16 * (i + 1)] == target:
+                break
+        else:
+            return False
+
+        for i, j in pairwise(slots[n:]):
+            self.timestamps[i] = self.timestamps[j]
+            self.values[i] = self.values[j]
+            self.is_int[i] = self.is_int[j]
+            self.uuids[16 * i : 16 * (i + 1)] = self.uuids[
+                16 * j : 16 * (j + 1)
+            ]
+        self.size -= 1
+        return True
+
+    def indices(self, start_us: int, end_us: int | None) -> List[int]:
+        """
+        Return the slots holding readings in `[start_us, end_us)`,
+        ordered by timestamp.
+        """
+        matches = []
+        for n in range(self.size):
+            i = (self.head + n) % self.capacity
+            ts = self.timestamps[i]
+            if ts >= start_us and (end_us is None or ts < end_us):
+                matches.append(i)
+        matches.sort(key=lambda i: self.timestamps[i])
+        return matches
+
+
+class RecentWindow:
+    """
+    In-process ring buffers of recent readings, one per device and
+    sensor, used to answer live-chart queries without touching the
+    database.
+
+    Use `init()` to configure and clear the buffers, `start()` once the
+    process is receiving every ingested reading, `add()` for each
+    reading and `remove()` for each deleted one. `covers()` reports
+    whether a query can be answered from the buffers alone.
+
+    Coverage is judged against the time readings arrive, so a reading
+    stamped more than `max_skew_seconds` away from it is not buffered,
+    and ranges including it are read from the database. Text readings
+    are handled the same way, and a change of units evicts the readings
+    in the old one. Readings published with a sequence
+    number are checked for gaps; a lost message could belong to any
+    sensor, so a gap clears every buffer and starts again.
+    """
+
+    def __init__(self) -> None:
+        self._window = 300.0
+        self._capacity = 1024
+        self._max_skew = 60_000_000
+        self._buffers: Dict[Tuple[uuid.UUID, str], RingBuffer] = {}
+        self._sequences: Dict[str, int] = {}
+        self._started_at: int | None = None
+
+    def init(
+        self,
+        window_seconds: float,
+        capacity: int,
+        max_skew_seconds: float = 60.0,
+    ) -> None:
+        self._window = window_seconds
+        self._capacity = capacity
+        self._max_skew = int(max_skew_seconds * 1_000_000)
+        self._buffers = {}
+        self._sequences = {}
+        self._started_at = None
+
+    def start(self) -> None:
+        self._started_at = time.time_ns() // 1000
+
+    def add(
+        self,
+        dp: DataPointDTO,
+        publisher: str | None = None,
+        seq: int | None = None,
+    ) -> None:
+        if publisher is not None and seq is not None:
+            last = self._sequences.get(publisher)
+            self._sequences[publisher] = max(seq, last or seq)
+            if last is not None and seq > last + 1:
+                self._buffers = {}
+                self.start()
+
+        key = (dp.device_uuid, dp.sensor)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = RingBuffer(self._capacity)
+
+        arrived = time.time_ns() // 1000
+        timestamp = to_epoch_us(dp.timestamp)
+        if abs(arrived - timestamp) > self._max_skew:
+            buffer.skip(timestamp)
+            return
+        buffer.append(dp)
+
+    def remove(
+        self, device_uuid: uuid.UUID, datapoint_uuid: uuid.UUID
+    ) -> None:
+        for (device, _), buffer in self._buffers.items():
+            if device == device_uuid and buffer.remove(datapoint_uuid):
+                return
+
+    def covers(
+        self, device_uuid: uuid.UUID, sensor: str, start: datetime.datetime
+    ) -> bool:
+        if self._started_at is None:
+            return False
+
+        start_us = to_epoch_us(start)
+        window_start = time.time_ns() // 1000 - int(self._window * 1_000_000)
+        if start_us < max(self._started_at, window_start):
+            return False
+
+        buffer = self._buffers.get((device_uuid, sensor))
+        if buffer is None:
+            # Nothing has been reported since we started listening
+            return True
+
+        return start_us > buffer.evicted_until
+
+    def datapoints(
+        self,
+        device_uuid: uuid.UUID,
+        sensor: str,
+        start: datetime.datetime,
+        end: datetime.datetime | None = None,
+        sort_descending: bool = True,
+    ) -> List[DataPointDTO]:
+        buffer = self._buffers.get((device_uuid, sensor))
+        if buffer is None:
+            return []
+
+        indices = buffer.indices(
+            to_epoch_us(start), None if end is None else to_epoch_us(end)
+        )
+        if sort_descending:
+            indices.reverse()
+
+        epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC)
+        datapoints = []
+        for i in indices:
+            value = buffer.values[i]
+            datapoints.append(
+                DataPointDTO.model_construct(
+                    uuid=uuid.UUID(
+                        bytes=bytes(buffer.uuids[16 * i : 16 * (i + 1)])
+                    ),
+                    device_uuid=device_uuid,
+                    timestamp=epoch
+                    + datetime.timedelta(microseconds=buffer.timestamps[i]),
+                    sensor=sensor,
+                    val_int=int(value) if buffer.is_int[i] else None,
+                    val_float=None if buffer.is_int[i] else value,
+                    val_str=None,
+                    val_units=buffer.val_units,
+                )
+            )
+        return datapoints
+
+    def series(
+        self,
+        device_uuid: uuid.UUID,
+        sensor: str,
+        start: datetime.datetime,
+        end: datetime.datetime | None = None,
+    ) -> List[SeriesDTO]:
+        buffer = self._buffers.get((device_uuid, sensor))
+        if buffer is None:
+            return []
+
+        indices = buffer.indices(
+            to_epoch_us(start), None if end is None else to_epoch_us(end)
+        )
+        if not indices:
+            return []
+
+        return [
+            SeriesDTO(
+                sensor=sensor,
+                val_units=buffer.val_units,
+                timestamps=array("q", (buffer.timestamps[i] for i in indices)),
+                values=array("d", (buffer.values[i] for i in indices)),
+            )
+        ]
+
+
+recent = RecentWindow()
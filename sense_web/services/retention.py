@@ -0,0 +1,347 @@
+import asyncio
+import datetime
+import logging
+from typing import Any, Dict, List, Mapping, Sequence, cast
+
+from pydantic import BaseModel
+from sqlalchemy import CursorResult, Table, delete, func, select
+from sqlalchemy.sql.elements import ColumnElement
+
+from sense_web.db.lookups import sensor_is, sensor_not_in
+from sense_web.db.models import DataPointRollup, SeriesChunk
+from sense_web.db.partitions import partition_bounds, partitions
+from sense_web.db.session import sessionmanager
+from sense_web.dto.series import to_epoch_us
+from sense_web.services.archive import archive
+from sense_web.services.rollup import ROLLUP_RESOLUTIONS, backfill_rollups
+
+log = logging.getLogger("retention")
+log.setLevel(logging.INFO)
+
+
+class RetentionPolicy(BaseModel):
+    """
+    How long readings are kept before the retention task deletes them.
+
+    Attributes:
+        raw_days (int, optional): Days to keep raw readings for sensors
+            without an override. `None` keeps them forever.
+        rollup_days (int, optional): Days to keep rollups. `None` keeps
+            them forever.
+        sensor_raw_days (dict): Per-sensor overrides of `raw_days`. A
+            value of `None` keeps that sensor's readings forever.
+    """
+
+    raw_days: int | None = None
+    rollup_days: int | None = None
+    sensor_raw_days: Dict[str, int | None] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return (
+            self.raw_days is not None
+            or self.rollup_days is not None
+            or any(d is not None for d in self.sensor_raw_days.values())
+        )
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str]) -> "RetentionPolicy":
+        """
+        Build a policy from `RETENTION_RAW_DAYS`, `RETENTION_ROLLUP_DAYS`
+        and `RETENTION_SENSOR_RAW_DAYS`. The latter is a comma separated
+        list of `sensor=days` pairs, where `days` may be `none`.
+        """
+        sensor_raw_days: Dict[str, int | None] = {}
+        for item in env.get("RETENTION_SENSOR_RAW_DAYS", "").split(","):
+            if not item.strip():
+                continue
+            sensor, _, days = item.partition("=")
+            sensor_raw_days[sensor.strip()] = _parse_days(days)
+
+        return cls(
+            raw_days=_parse_days(env.get("RETENTION_RAW_DAYS")),
+            rollup_days=_parse_days(env.get("RETENTION_ROLLUP_DAYS")),
+            sensor_raw_days=sensor_raw_days,
+        )
+
+
+class RetentionResult(BaseModel):
+    raw_deleted: int = 0
+    rollups_deleted: int = 0
+    chunks_deleted: int = 0
+    partitions_dropped: int = 0
+
+
+def _parse_days(value: str | None) -> int | None:
+    if value is None or value.strip().lower() in ("", "none"):
+        return None
+    return int(value)
+
+
+def _cutoff(now: datetime.datetime, days: int) -> datetime.datetime:
+    # Align to the coarsest rollup bucket so that raw readings are only
+    # ever removed a whole bucket at a time.
+    coarsest = ROLLUP_RESOLUTIONS[-1]
+    seconds = int((now - datetime.timedelta(days=days)).timestamp())
+    return datetime.datetime.fromtimestamp(
+        seconds - seconds % coarsest, datetime.UTC
+    )
+
+
+async def _delete_in_chunks(
+    table: Table,
+    filters: Sequence[ColumnElement[bool]],
+    chunk_size: int,
+    shard: int | None = None,
+) -> int:
+    """
+    Delete rows matching `filters` in transactions of at most
+    `chunk_size` rows, yielding to the event loop between chunks so the
+    SQLite write lock is never held for long.
+    """
+    total = 0
+    while True:
+        ids = select(table.c.id).where(*filters).limit(chunk_size)
+        async with sessionmanager.session(shard=shard) as session:
+            result = cast(
+                CursorResult[Any],
+                await session.execute(
+                    delete(table).where(table.c.id.in_(ids))
+                ),
+            )
+            await session.commit()
+
+        total += result.rowcount
+        if result.rowcount < chunk_size:
+            return total
+
+        await asyncio.sleep(0)
+
+
+def _raw_filters(
+    table: Table,
+    cutoff: datetime.datetime,
+    sensor: str | None,
+    exclude_sensors: list[str],
+) -> List[ColumnElement[bool]]:
+    filters = [table.c.timestamp < cutoff]
+    if sensor is not None:
+        filters.append(sensor_is(table, sensor))
+    if exclude_sensors:
+        filters.append(sensor_not_in(table, exclude_sensors))
+    return filters
+
+
+def _chunk_filters(
+    cutoff: datetime.datetime,
+    sensor: str | None,
+    exclude_sensors: list[str],
+) -> List[ColumnElement[bool]]:
+    # `cutoff` is hour aligned, so this only matches whole chunks
+    filters = [SeriesChunk.chunk_start < int(cutoff.timestamp())]
+    if sensor is not None:
+        filters.append(SeriesChunk.sensor == sensor)
+    if exclude_sensors:
+        filters.append(SeriesChunk.sensor.not_in(exclude_sensors))
+    return filters
+
+
+async def _expire_raw(
+    result: RetentionResult,
+    cutoff: datetime.datetime,
+    chunk_size: int,
+    shard: int | None,
+    sensor: str | None = None,
+    exclude_sensors: list[str] | None = None,
+) -> None:
+    exclude_sensors = exclude_sensors or []
+    chunk_filters = _chunk_filters(cutoff, sensor, exclude_sensors)
+
+    async with sessionmanager.session(shard=shard) as session:
+        tables = await partitions.tables(session, end=cutoff, text=True)
+        oldest = None
+        for table in tables:
+            filters = _raw_filters(table, cutoff, sensor, exclude_sensors)
+            first = (
+                await session.execute(
+                    select(func.min(table.c.timestamp)).where(*filters)
+                )
+            ).scalar_one_or_none()
+            if first is not None and (oldest is None or first < oldest):
+                oldest = first
+
+        first_chunk = (
+            await session.execute(
+                select(func.min(SeriesChunk.chunk_start)).where(*chunk_filters)
+            )
+        ).scalar_one_or_none()
+        if first_chunk is not None:
+            first = datetime.datetime.fromtimestamp(first_chunk, datetime.UTC)
+            if oldest is None or to_epoch_us(first) < to_epoch_us(oldest):
+                oldest = first
+
+    if oldest is None:
+        return
+
+    # Make sure every bucket in the expired range has a rollup before
+    # the readings it would be built from are gone.
+    await backfill_rollups(
+        start=oldest,
+        end=cutoff,
+        sensor=sensor,
+        exclude_sensors=exclude_sensors,
+        shard=shard,
+    )
+
+    for table in tables:
+        result.raw_deleted += await _delete_in_chunks(
+            table,
+            _raw_filters(table, cutoff, sensor, exclude_sensors),
+            chunk_size,
+            shard,
+        )
+
+    result.chunks_deleted += await _delete_in_chunks(
+        cast(Table, SeriesChunk.__table__), chunk_filters, chunk_size, shard
+    )
+
+
+def _partition_cutoff(
+    policy: RetentionPolicy, now: datetime.datetime
+) -> datetime.datetime | None:
+    """
+    Return the time before which every raw reading has expired,
+    whatever its sensor, or `None` if some readings are kept forever.
+    """
+    if policy.raw_days is None:
+        return None
+
+    days = [policy.raw_days]
+    for sensor_days in policy.sensor_raw_days.values():
+        if sensor_days is None:
+            return None
+        days.append(sensor_days)
+
+    return _cutoff(now, max(days))
+
+
+async def _drop_expired_partitions(
+    cutoff: datetime.datetime, shard: int | None
+) -> int:
+    async with sessionmanager.session(shard=shard) as session:
+        names = await partitions.partition_names(session)
+
+    dropped = 0
+    for name in names:
+        start, end = partition_bounds(name)
+        if end > cutoff:
+            continue
+
+        await backfill_rollups(start=start, end=end, shard=shard)
+        async with sessionmanager.session(shard=shard) as session:
+            await partitions.drop(session, name)
+            await session.commit()
+        dropped += 1
+
+    return dropped
+
+
+async def apply_retention(
+    policy: RetentionPolicy,
+    now: datetime.datetime | None = None,
+    chunk_size: int = 1000,
+) -> RetentionResult:
+    """
+    Delete raw readings and rollups that have outlived `policy`.
+
+    Partitions and archive files whose readings have all expired are
+    dropped whole. Remaining expired readings are deleted in chunks.
+    Each shard is processed concurrently.
+    """
+    now = now or datetime.datetime.now(datetime.UTC)
+
+    async def apply_shard(shard: int | None) -> RetentionResult:
+        return await _apply_shard(policy, now, chunk_size, shard)
+
+    results = await sessionmanager.fan_out(apply_shard)
+    result = RetentionResult(
+        **{
+            field: sum(getattr(r, field) for r in results)
+            for field in RetentionResult.model_fields
+        }
+    )
+
+    partition_cutoff = _partition_cutoff(policy, now)
+    if partition_cutoff is not None:
+        for name in archive.names():
+            if archive.bounds(name)[1] <= partition_cutoff:
+                archive.remove(name)
+                result.partitions_dropped += 1
+
+    return result
+
+
+async def _apply_shard(
+    policy: RetentionPolicy,
+    now: datetime.datetime,
+    chunk_size: int,
+    shard: int | None,
+) -> RetentionResult:
+    result = RetentionResult()
+
+    partition_cutoff = _partition_cutoff(policy, now)
+    if partition_cutoff is not None:
+        result.partitions_dropped += await _drop_expired_partitions(
+            partition_cutoff, shard
+        )
+
+    for sensor, days in policy.sensor_raw_days.items():
+        if days is None:
+            continue
+        await _expire_raw(
+            result,
+            _cutoff(now, days),
+            chunk_size,
+            shard,
+            sensor=sensor,
+        )
+
+    if policy.raw_days is not None:
+        await _expire_raw(
+            result,
+            _cutoff(now, policy.raw_days),
+            chunk_size,
+            shard,
+            exclude_sensors=list(policy.sensor_raw_days),
+        )
+
+    if policy.rollup_days is not None:
+        cutoff = int(_cutoff(now, policy.rollup_days).timestamp())
+        rollups: Table = DataPointRollup.__table__  # type: ignore[assignment]
+        result.rollups_deleted += await _delete_in_chunks(
+            rollups,
+            [rollups.c.bucket_start < cutoff],
+            chunk_size,
+            shard,
+        )
+
+    return result
+
+
+async def run_retention(policy: RetentionPolicy, interval: float) -> None:
+    """
+    Apply `policy` every `interval` seconds until cancelled.
+    """
+    while True:
+        try:
+            result = await apply_retention(policy)
+            log.info(
+                f"Retention deleted {result.raw_deleted} readings, "
+                f"{result.chunks_deleted} chunks, "
+                f"{result.rollups_deleted} rollups and "
+                f"{result.partitions_dropped} partitions"
+            )
+        except Exception:
+            log.exception("Retention run failed")
+
+        await asyncio.sleep(interval)
@@ -0,0 +1,584 @@
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import uuid
+from typing import Any, Collection, Dict, Iterable, List, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import delete, insert, select, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+
+from sense_web.db.dialect import upsert, least, greatest
+from sense_web.db.lookups import joined, sensor_is, sensor_name, sensor_not_in
+from sense_web.db.models import DataPointRollup, SeriesChunk
+from sense_web.db.partitions import partitions
+from sense_web.db.session import env_uris, sessionmanager
+from sense_web.dto.aggregate import AggregateDTO, FleetAggregateDTO
+from sense_web.dto.series import to_epoch_us
+from sense_web.services.chunks import chunk_arrays
+
+log = logging.getLogger("rollup")
+log.setLevel(logging.INFO)
+
+# Rollup bucket widths in seconds, finest first
+ROLLUP_RESOLUTIONS = (60, 3600)
+
+# (device_uuid, sensor, timestamp, value)
+Reading = Tuple[uuid.UUID | str, str, datetime.datetime, float]
+
+# (device_uuid, sensor, resolution, bucket_start) -> [count, sum, min, max]
+Buckets = Dict[Tuple[uuid.UUID | str, str, int, int], List[Any]]
+
+
+def numeric_value(
+    val_int: int | None, val_float: float | None
+) -> float | None:
+    if val_float is not None:
+        return float(val_float)
+    if val_int is not None:
+        return float(val_int)
+    return None
+
+
+def rollup_resolution_for(resolution: int) -> int:
+    """
+    Return the coarsest rollup resolution that evenly divides
+    `resolution`, so that each requested bucket is made up of whole
+    rollup buckets.
+    """
+    candidates = [r for r in ROLLUP_RESOLUTIONS if resolution % r == 0]
+    if resolution <= 0 or not candidates:
+        raise ValueError(
+            f"Resolution must be a positive multiple of "
+            f"{ROLLUP_RESOLUTIONS[0]} seconds"
+        )
+    return max(candidates)
+
+
+def _align(seconds: int, resolution: int, up: bool = False) -> int:
+    aligned = seconds - seconds % resolution
+    if up and aligned != seconds:
+        aligned += resolution
+    return aligned
+
+
+def _add_reading(
+    buckets: Buckets,
+    device_uuid: uuid.UUID | str,
+    sensor: str,
+    timestamp: datetime.datetime,
+    value: float,
+) -> None:
+    seconds = to_epoch_us(timestamp) // 1_000_000
+    for resolution in ROLLUP_RESOLUTIONS:
+        key = (device_uuid, sensor, resolution, _align(seconds, resolution))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [1, value, value, value]
+        else:
+            bucket[0] += 1
+            bucket[1] += value
+            bucket[2] = min(bucket[2], value)
+            bucket[3] = max(bucket[3], value)
+
+
+def _add_series(
+    buckets: Buckets,
+    device_uuid: uuid.UUID | str,
+    sensor: str,
+    timestamps: npt.NDArray[np.int64],
+    values: npt.NDArray[np.float64],
+) -> None:
+    # `timestamps` are sorted, so each bucket is a contiguous run
+    seconds = timestamps // 1_000_000
+    for resolution in ROLLUP_RESOLUTIONS:
+        keys = seconds - seconds % resolution
+        starts = np.flatnonzero(np.diff(keys, prepend=keys[:1] - 1))
+        counts = np.diff(starts, append=len(keys))
+        sums = np.add.reduceat(values, starts)
+        mins = np.minimum.reduceat(values, starts)
+        maxs = np.maximum.reduceat(values, starts)
+
+        for i, start in enumerate(starts.tolist()):
+            key = (device_uuid, sensor, resolution, int(keys[start]))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [
+                    int(counts[i]),
+                    float(sums[i]),
+                    float(mins[i]),
+                    float(maxs[i]),
+                ]
+            else:
+                bucket[0] += int(counts[i])
+                bucket[1] += float(sums[i])
+                bucket[2] = min(bucket[2], float(mins[i]))
+                bucket[3] = max(bucket[3], float(maxs[i]))
+
+
+def _bucket_rows(buckets: Buckets) -> List[Dict[str, Any]]:
+    return [
+        {
+            "device_uuid": device_uuid,
+            "sensor": sensor,
+            "resolution": resolution,
+            "bucket_start": bucket_start,
+            "count": count,
+            "sum": total,
+            "min": lo,
+            "max": hi,
+        }
+        for (device_uuid, sensor, resolution, bucket_start), (
+            count,
+            total,
+            lo,
+            hi,
+        ) in buckets.items()
+    ]
+
+
+def _bucket_key(table: Any) -> List[Any]:
+    return [
+        table.c.device_uuid,
+        table.c.sensor,
+        table.c.resolution,
+        table.c.bucket_start,
+    ]
+
+
+async def update_rollups(
+    session: AsyncSession, readings: Iterable[Reading]
+) -> None:
+    """
+    Merge numeric readings into their rollup buckets.
+
+    Readings that fall into the same bucket are combined before hitting
+    the database, and all buckets are written with a single batched
+    upsert. The caller owns the transaction, so rollups are committed
+    atomically with the readings themselves.
+    """
+    buckets: Buckets = {}
+    for reading in readings:
+        _add_reading(buckets, *reading)
+
+    if not buckets:
+        return
+
+    table = DataPointRollup.__table__
+    stmt = upsert(session, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=_bucket_key(table),
+        set_={
+            "count": table.c.count + stmt.excluded.count,
+            "sum": table.c.sum + stmt.excluded.sum,
+            "min": least(session, table.c.min, stmt.excluded.min),
+            "max": greatest(session, table.c.max, stmt.excluded.max),
+        },
+    )
+    await session.execute(stmt, _bucket_rows(buckets))
+
+
+async def _collect_buckets(
+    session: AsyncSession,
+    start: datetime.datetime | None,
+    end: datetime.datetime | None,
+    chunk_filters: List[ColumnElement[bool]],
+    device_uuid: uuid.UUID | None = None,
+    sensor: str | None = None,
+    exclude_sensors: Collection[str] = (),
+) -> Buckets:
+    # Builds buckets from the raw readings in `[start, end)` and the
+    # compacted chunks matching `chunk_filters`
+    buckets: Buckets = {}
+    for raw in await partitions.tables(session, start, end, text=True):
+        stmt = (
+            select(
+                raw.c.device_uuid,
+                sensor_name(),
+                raw.c.timestamp,
+                raw.c.val_int,
+                raw.c.val_float,
+            )
+            .select_from(joined(raw))
+            .where(
+                or_(
+                    raw.c.val_int.is_not(None),
+                    raw.c.val_float.is_not(None),
+                )
+            )
+        )
+        if start is not None:
+            stmt = stmt.where(raw.c.timestamp >= start)
+        if end is not None:
+            stmt = stmt.where(raw.c.timestamp < end)
+        if device_uuid is not None:
+            stmt = stmt.where(raw.c.device_uuid == device_uuid)
+        if sensor is not None:
+            stmt = stmt.where(sensor_is(raw, sensor))
+        if exclude_sensors:
+            stmt = stmt.where(sensor_not_in(raw, exclude_sensors))
+
+        result = await session.stream(stmt)
+        async for dev, sen, ts, val_int, val_float in result:
+            value = numeric_value(val_int, val_float)
+            if value is not None:
+                _add_reading(buckets, dev, sen, ts, value)
+
+    for dev, sen, _, _, timestamps, values in await chunk_arrays(
+        session, chunk_filters
+    ):
+        _add_series(buckets, dev, sen, timestamps, values)
+
+    return buckets
+
+
+async def rebuild_rollups(
+    session: AsyncSession,
+    device_uuid: uuid.UUID,
+    sensor: str,
+    timestamp: datetime.datetime,
+) -> None:
+    """
+    Recompute the rollup buckets of one device and sensor that hold
+    `timestamp` from the readings left in the database, after one of
+    them has been deleted. Buckets left without readings are removed.
+
+    Retention and archiving only ever drop whole buckets of the
+    coarsest resolution, so a bucket holding a reading that was still
+    in the database is never missing any of its readings. The caller
+    owns the transaction.
+    """
+    coarsest = ROLLUP_RESOLUTIONS[-1]
+    start_s = _align(to_epoch_us(timestamp) // 1_000_000, coarsest)
+    start = datetime.datetime.fromtimestamp(start_s, datetime.UTC)
+    end = start + datetime.timedelta(seconds=coarsest)
+
+    buckets = await _collect_buckets(
+        session,
+        start,
+        end,
+        [
+            SeriesChunk.device_uuid == device_uuid,
+            SeriesChunk.sensor == sensor,
+            SeriesChunk.chunk_start == start_s,
+        ],
+        device_uuid,
+        sensor,
+    )
+
+    await session.execute(
+        delete(DataPointRollup).where(
+            DataPointRollup.device_uuid == device_uuid,
+            DataPointRollup.sensor == sensor,
+            DataPointRollup.bucket_start >= start_s,
+            DataPointRollup.bucket_start < start_s + coarsest,
+        )
+    )
+    rows = _bucket_rows(buckets)
+    if rows:
+        await session.execute(insert(DataPointRollup), rows)
+
+
+async def backfill_rollups(
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    device_uuid: uuid.UUID | None = None,
+    sensor: str | None = None,
+    replace: bool = False,
+    exclude_sensors: Collection[str] = (),
+    shard: int | None = None,
+) -> int:
+    """
+    Rebuild rollups from the raw readings in `data_points`, its
+    partitions and compacted chunks.
+
+    The range is widened to whole buckets of the coarsest resolution so
+    that no bucket is rebuilt from a partial set of readings. By
+    default only missing buckets are inserted and existing ones are
+    left untouched. With `replace`, the buckets rebuilt from readings
+    are overwritten as well. Buckets whose readings are no longer in
+    the database, having been archived or expired, are always kept, so
+    rebuilding never loses rollups.
+
+    Each shard is rebuilt concurrently, or only `shard`, or the one
+    holding `device_uuid`, if given.
+
+    Returns the number of buckets computed from the raw readings.
+    """
+    coarsest = ROLLUP_RESOLUTIONS[-1]
+
+    raw_start = raw_end = None
+    chunk_filters = []
+
+    if start is not None:
+        start_s = _align(to_epoch_us(start) // 1_000_000, coarsest)
+        raw_start = datetime.datetime.fromtimestamp(start_s, datetime.UTC)
+        chunk_filters.append(SeriesChunk.chunk_start >= start_s)
+
+    if end is not None:
+        end_s = _align(-(-to_epoch_us(end) // 1_000_000), coarsest, up=True)
+        raw_end = datetime.datetime.fromtimestamp(end_s, datetime.UTC)
+        chunk_filters.append(SeriesChunk.chunk_start < end_s)
+
+    if device_uuid is not None:
+        chunk_filters.append(SeriesChunk.device_uuid == device_uuid)
+
+    if sensor is not None:
+        chunk_filters.append(SeriesChunk.sensor == sensor)
+
+    if exclude_sensors:
+        chunk_filters.append(SeriesChunk.sensor.not_in(exclude_sensors))
+
+    async def backfill_shard(shard: int | None) -> int:
+        async with sessionmanager.session(shard=shard) as session:
+            buckets = await _collect_buckets(
+                session,
+                raw_start,
+                raw_end,
+                chunk_filters,
+                device_uuid,
+                sensor,
+                exclude_sensors,
+            )
+
+            table = DataPointRollup.__table__
+            insert_stmt = upsert(session, table)
+            if replace:
+                insert_stmt = insert_stmt.on_conflict_do_update(
+                    index_elements=_bucket_key(table),
+                    set_={
+                        k: insert_stmt.excluded[k]
+                        for k in ("count", "sum", "min", "max")
+                    },
+                )
+            else:
+                insert_stmt = insert_stmt.on_conflict_do_nothing()
+
+            rows = _bucket_rows(buckets)
+            if rows:
+                await session.execute(insert_stmt, rows)
+            await session.commit()
+
+            return len(rows)
+
+    if device_uuid is not None:
+        shard = sessionmanager.shard_for(device_uuid)
+    if shard is not None or len(sessionmanager.shards) == 1:
+        return await backfill_shard(shard)
+    return sum(await sessionmanager.fan_out(backfill_shard))
+
+
+def _bucket_filters(
+    resolution: int,
+    start: datetime.datetime | None,
+    end: datetime.datetime | None,
+) -> List[ColumnElement[bool]]:
+    filters: List[ColumnElement[bool]] = []
+    if start is not None:
+        start_s = _align(to_epoch_us(start) // 1_000_000, resolution)
+        filters.append(DataPointRollup.bucket_start >= start_s)
+    if end is not None:
+        end_s = -(-to_epoch_us(end) // 1_000_000)
+        filters.append(DataPointRollup.bucket_start < end_s)
+    return filters
+
+
+def _aggregate(
+    bucket_start: int, count: int, total: float, lo: float, hi: float
+) -> Dict[str, Any]:
+    return {
+        "bucket_start": datetime.datetime.fromtimestamp(
+            bucket_start, datetime.UTC
+        ),
+        "count": count,
+        "sum": total,
+        "min": lo,
+        "max": hi,
+        "mean": total / count,
+    }
+
+
+async def get_aggregates(
+    device_uuid: uuid.UUID,
+    sensor: str,
+    resolution: int,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    session: AsyncSession | None = None,
+) -> List[AggregateDTO]:
+    """
+    Aggregate a sensor's readings into buckets of `resolution` seconds.
+
+    Reads come from the coarsest rollup that evenly divides the
+    requested resolution, never from `data_points`, so the cost depends
+    on the number of buckets in range rather than the number of
+    readings. Buckets are aligned to multiples of `resolution` since
+    the Unix epoch; `start` is rounded down to a bucket boundary.
+    """
+    source = rollup_resolution_for(resolution)
+
+    bucket = (
+        DataPointRollup.bucket_start
+        - DataPointRollup.bucket_start % resolution
+    ).label("bucket")
+
+    stmt = (
+        select(
+            bucket,
+            func.sum(DataPointRollup.count),
+            func.sum(DataPointRollup.sum),
+            func.min(DataPointRollup.min),
+            func.max(DataPointRollup.max),
+        )
+        .where(
+            DataPointRollup.device_uuid == device_uuid,
+            DataPointRollup.sensor == sensor,
+            DataPointRollup.resolution == source,
+        )
+        .where(*_bucket_filters(resolution, start, end))
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+
+    async with sessionmanager.reuse(
+        session, readonly=True, device=device_uuid
+    ) as db:
+        result = await db.execute(stmt)
+        return [AggregateDTO(**_aggregate(*row)) for row in result]
+
+
+async def get_fleet_aggregates(
+    sensor: str,
+    resolution: int,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    devices: Collection[uuid.UUID] | None = None,
+    by_device: bool = False,
+    session: AsyncSession | None = None,
+) -> List[FleetAggregateDTO]:
+    """
+    Aggregate one sensor's readings across every device, or only across
+    `devices`, into buckets of `resolution` seconds.
+
+    The devices' readings are combined into one set of buckets, or with
+    `by_device` each device gets its own, ordered by device. Buckets
+    are read from rollups as in `get_aggregates`, through the rollup
+    index led by the sensor, so the cost does not grow with the number
+    of devices that have no readings from `sensor`.
+    """
+    if devices is not None and not devices:
+        return []
+
+    source = rollup_resolution_for(resolution)
+
+    bucket = (
+        DataPointRollup.bucket_start
+        - DataPointRollup.bucket_start % resolution
+    ).label("bucket")
+    keys: List[Any] = [bucket]
+    if by_device:
+        keys.insert(0, DataPointRollup.device_uuid)
+
+    stmt = (
+        select(
+            *keys,
+            func.sum(DataPointRollup.count),
+            func.sum(DataPointRollup.sum),
+            func.min(DataPointRollup.min),
+            func.max(DataPointRollup.max),
+        )
+        .where(
+            DataPointRollup.sensor == sensor,
+            DataPointRollup.resolution == source,
+            *_bucket_filters(resolution, start, end),
+        )
+        .group_by(*keys)
+    )
+    if devices is not None:
+        stmt = stmt.where(DataPointRollup.device_uuid.in_(devices))
+
+    shards = None
+    if devices is not None:
+        shards = {sessionmanager.shard_for(d) for d in devices}
+
+    async def read_shard(shard: int | None) -> List[Any]:
+        if shards is not None and shard not in shards:
+            return []
+        async with sessionmanager.reuse(
+            session, readonly=True, shard=shard
+        ) as shard_session:
+            return list(await shard_session.execute(stmt))
+
+    # Each shard holds part of the fleet, so buckets of the same time
+    # are combined across shards
+    totals: Dict[Tuple[Any, ...], List[Any]] = {}
+    for rows in await sessionmanager.fan_out(read_shard):
+        for *key, count, total, lo, hi in rows:
+            current = totals.get(tuple(key))
+            if current is None:
+                totals[tuple(key)] = [count, total, lo, hi]
+                continue
+            current[0] += count
+            current[1] += total
+            current[2] = min(current[2], lo)
+            current[3] = max(current[3], hi)
+
+    return [
+        FleetAggregateDTO(
+            device_uuid=key[0] if by_device else None,
+            **_aggregate(key[-1], *values),
+        )
+        for key, values in sorted(totals.items())
+    ]
+
+
+async def main(
+    db_uri: str,
+    start: datetime.datetime | None,
+    end: datetime.datetime | None,
+    replace: bool,
+) -> None:
+    await sessionmanager.init(
+        db_uri, shard_uris=env_uris("DATABASE_SHARD_URIS")
+    )
+    written = await backfill_rollups(start=start, end=end, replace=replace)
+    log.info(f"Backfilled {written} rollup buckets")
+    await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild datapoint rollups from raw readings"
+    )
+    parser.add_argument(
+        "--start",
+        default=None,
+        type=datetime.datetime.fromisoformat,
+        help="Only rebuild buckets from this ISO 8601 timestamp onwards",
+    )
+    parser.add_argument(
+        "--end",
+        default=None,
+        type=datetime.datetime.fromisoformat,
+        help="Only rebuild buckets before this ISO 8601 timestamp",
+    )
+    parser.add_argument(
+        "--replace",
+        action="store_true",
+        help="Overwrite existing buckets rather than only filling gaps",
+    )
+
+    args = parser.parse_args()
+
+    asyncio.run(
+        main(
+            os.getenv("DATABASE_URI", "sqlite+aiosqlite:///./dev.db"),
+            start=args.start,
+            end=args.end,
+            replace=args.replace,
+        )
+    )
@@ -0,0 +1,35 @@
+import datetime
+
+from sense_web.api.conditional import not_modified, validators
+
+MODIFIED = datetime.datetime(
+    2025, 1, 1, 12, 0, 0, 250000, tzinfo=datetime.timezone.utc
+)
+
+
+def test_validators() -> None:
+    assert validators(3, MODIFIED) == {
+        "ETag": 'W/"3"',
+        "Last-Modified": "Wed, 01 Jan 2025 12:00:00 GMT",
+    }
+
+
+def test_not_modified_if_none_match() -> None:
+    assert not_modified('W/"3"', None, 'W/"3"', MODIFIED)
+    assert not_modified('"2", "3"', None, 'W/"3"', MODIFIED)
+    assert not_modified("*", None, 'W/"3"', MODIFIED)
+    assert not not_modified('W/"2"', None, 'W/"3"', MODIFIED)
+
+    # If-None-Match takes precedence over If-Modified-Since
+    since = "Wed, 01 Jan 2025 12:00:00 GMT"
+    assert not not_modified('W/"2"', since, 'W/"3"', MODIFIED)
+
+
+def test_not_modified_if_modified_since() -> None:
+    etag = 'W/"3"'
+    assert not_modified(None, "Wed, 01 Jan 2025 12:00:00 GMT", etag, MODIFIED)
+    assert not not_modified(
+        None, "Wed, 01 Jan 2025 11:59:59 GMT", etag, MODIFIED
+    )
+    assert not not_modified(None, "yesterday", etag, MODIFIED)
+    assert not not_modified(None, None, etag, MODIFIED)
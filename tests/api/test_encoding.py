@@ -0,0 +1,79 @@
+import datetime
+import math
+import struct
+import cbor2
+
+from sense_web.api.encoding import (
+    JSON_MEDIA_TYPE,
+    SERIES_JSON_MEDIA_TYPE,
+    CBOR_MEDIA_TYPE,
+    CBOR_TAG_SINT64_LE,
+    CBOR_TAG_FLOAT64_LE,
+    negotiate,
+    encode_series_cbor,
+    encode_series_json,
+)
+from sense_web.dto.series import series_from_rows, to_epoch_us
+
+OFFERS = [JSON_MEDIA_TYPE, SERIES_JSON_MEDIA_TYPE, CBOR_MEDIA_TYPE]
+
+T0 = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+ROWS = [
+    ("rs232", T0, None, None, "OK", None),
+    ("temp", T0, None, 21.5, None, "C"),
+    ("temp", T0 + datetime.timedelta(seconds=1), 22, None, None, "C"),
+]
+
+
+def test_negotiate_defaults_to_json() -> None:
+    assert negotiate(None, OFFERS) == JSON_MEDIA_TYPE
+    assert negotiate("*/*", OFFERS) == JSON_MEDIA_TYPE
+    assert negotiate("text/html", OFFERS) == JSON_MEDIA_TYPE
+
+
+def test_negotiate_respects_quality() -> None:
+    assert negotiate(CBOR_MEDIA_TYPE, OFFERS) == CBOR_MEDIA_TYPE
+    accept = f"{JSON_MEDIA_TYPE};q=0.5, {SERIES_JSON_MEDIA_TYPE}"
+    assert negotiate(accept, OFFERS) == SERIES_JSON_MEDIA_TYPE
+
+
+def test_to_epoch_us_treats_naive_as_utc() -> None:
+    naive = T0.replace(tzinfo=None)
+    assert to_epoch_us(naive) == to_epoch_us(T0) == 1735689600000000
+
+
+def test_series_from_rows_groups_by_sensor() -> None:
+    series = series_from_rows(ROWS)
+
+    assert [s.sensor for s in series] == ["rs232", "temp"]
+
+    rs232, temp = series
+    assert rs232.strings == ["OK"]
+    assert math.isnan(rs232.values[0])
+
+    assert temp.val_units == "C"
+    assert temp.strings is None
+    assert list(temp.values) == [21.5, 22.0]
+    assert temp.timestamps[1] - temp.timestamps[0] == 1_000_000
+
+
+def test_encode_series_cbor_typed_arrays() -> None:
+    payload = cbor2.loads(encode_series_cbor(series_from_rows(ROWS)))
+
+    temp = payload["series"][1]
+    assert temp["t"].tag == CBOR_TAG_SINT64_LE
+    assert temp["v"].tag == CBOR_TAG_FLOAT64_LE
+    assert struct.unpack("<2q", temp["t"].value) == (
+        1735689600000000,
+        1735689601000000,
+    )
+    assert struct.unpack("<2d", temp["v"].value) == (21.5, 22.0)
+    assert "s" not in temp
+
+
+def test_encode_series_json_nulls_missing_values() -> None:
+    payload = encode_series_json(series_from_rows(ROWS))
+
+    rs232 = payload["series"][0]
+    assert rs232["v"] == [None]
+    assert rs232["s"] == ["OK"]
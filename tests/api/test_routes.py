@@ -7,6 +7,7 @@ import time
 import uuid
 import asyncio
 import datetime
+import cbor2
 from testcontainers.redis import RedisContainer
 
 from sense_web.db.session import sessionmanager
@@ -311,3 +312,106 @@ async def test_api_data_delete(api_server: str, db_manager: None) -> None:
 
         response_dps = response.json()
         assert len(response_dps) == 0
+
+
+async def test_api_data_get_series_cbor(
+    api_server: str, db_manager: None
+) -> None:
+    with httpx.Client(base_url=api_server) as client:
+        data = {"imei": "200000000000002", "name": "d1"}
+        register_response = client.post("/api/devices", json=data, timeout=2)
+
+        assert register_response.status_code == 201
+        device_uuid = register_response.json()["uuid"]
+
+        for i in range(3):
+            await create_datapoint(
+                device_uuid=uuid.UUID(device_uuid),
+                timestamp=datetime.datetime.now(datetime.UTC),
+                sensor="humidity",
+                val_float=55.0 + i,
+                val_units="%",
+            )
+
+        response = client.get(
+            f"/api/devices/{device_uuid}/data",
+            headers={"Accept": "application/cbor"},
+            timeout=2,
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/cbor"
+
+        series = cbor2.loads(response.content)["series"]
+        assert len(series) == 1
+        assert series[0]["sensor"] == "humidity"
+        assert series[0]["units"] == "%"
+        assert len(series[0]["t"].value) == 3 * 8
+        assert len(series[0]["v"].value) == 3 * 8
+
+
+async def test_api_data_aggregate(api_server: str, db_manager: None) -> None:
+    with httpx.Client(base_url=api_server) as client:
+        data = {"imei": "200000000000002", "name": "d1"}
+        register_response = client.post("/api/devices", json=data, timeout=2)
+
+        assert register_response.status_code == 201
+        device_uuid = register_response.json()["uuid"]
+
+        t0 = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+        for minute in range(0, 120, 20):
+            await create_datapoint(
+                device_uuid=uuid.UUID(device_uuid),
+                timestamp=t0 + datetime.timedelta(minutes=minute),
+                sensor="humidity",
+                val_float=float(minute),
+            )
+
+        response = client.get(
+            f"/api/devices/{device_uuid}/data/aggregate",
+            params={"sensor": "humidity", "resolution": 3600},
+            timeout=2,
+        )
+
+        assert response.status_code == 200
+        buckets = response.json()
+        assert len(buckets) == 2
+        assert buckets[0]["count"] == 3
+        assert buckets[0]["max"] == 40.0
+
+        response = client.get(
+            f"/api/devices/{device_uuid}/data/aggregate",
+            params={"sensor": "humidity", "resolution": 90},
+            timeout=2,
+        )
+
+        assert response.status_code == 422
+
+
+async def test_api_device_latest(api_server: str, db_manager: None) -> None:
+    with httpx.Client(base_url=api_server) as client:
+        data = {"imei": "200000000000002", "name": "d1"}
+        register_response = client.post("/api/devices", json=data, timeout=2)
+
+        assert register_response.status_code == 201
+        device_uuid = register_response.json()["uuid"]
+
+        for value in (1.0, 2.0):
+            await create_datapoint(
+                device_uuid=uuid.UUID(device_uuid),
+                timestamp=datetime.datetime.now(datetime.UTC),
+                sensor="humidity",
+                val_float=value,
+            )
+
+        response = client.get(f"/api/devices/{device_uuid}/latest", timeout=2)
+
+        assert response.status_code == 200
+        latest = response.json()
+        assert len(latest) == 1
+        assert latest[0]["val_float"] == 2.0
+
+        response = client.get("/api/devices/latest", timeout=2)
+
+        assert response.status_code == 200
+        assert response.json() == latest
@@ -419,3 +419,66 @@ async def test_device_data_resource_post_list_payload_fails(
     response = await protocol.request(request).response
     assert response.code == Code.BAD_REQUEST
     assert b"Invalid CBOR" in response.payload
+
+
+@pytest.mark.asyncio
+async def test_device_data_resource_post_batch(
+    coap_server: None, db_manager: None, device: DeviceDTO
+) -> None:
+    uuid = str(device.uuid)
+    now = datetime.datetime.now(datetime.UTC)
+
+    payload = [
+        {
+            "i": device.imei[-6:],
+            "t": now.timestamp() + i,
+            "s": "voltage_sensor",
+            "f": 1.0 + i,
+            "u": "V",
+        }
+        for i in range(5)
+    ]
+
+    cbor_payload = cbor2.dumps(payload)
+    protocol = await Context.create_client_context()
+
+    request = Message(
+        code=Code.POST,
+        uri=f"coap://127.0.0.1/{uuid}/data",
+        payload=cbor_payload,
+    )
+
+    response = await protocol.request(request).response
+    assert response.code.is_successful()
+    assert response.payload == b"5 DataPoints accepted"
+
+    dps = await get_datapoints_by_device_uuid(device.uuid)
+    assert [dp.val_float for dp in dps] == [5.0, 4.0, 3.0, 2.0, 1.0]
+
+
+@pytest.mark.asyncio
+async def test_device_data_resource_post_batch_invalid_reading(
+    coap_server: None, db_manager: None, device: DeviceDTO
+) -> None:
+    uuid = str(device.uuid)
+    now = datetime.datetime.now(datetime.UTC)
+
+    payload = [
+        {"i": device.imei[-6:], "t": now.timestamp(), "s": "v", "f": 1.0},
+        {"i": device.imei[-6:], "t": now.timestamp(), "s": "v"},
+    ]
+
+    cbor_payload = cbor2.dumps(payload)
+    protocol = await Context.create_client_context()
+
+    request = Message(
+        code=Code.POST,
+        uri=f"coap://127.0.0.1/{uuid}/data",
+        payload=cbor_payload,
+    )
+
+    response = await protocol.request(request).response
+    assert response.code == Code.BAD_REQUEST
+    assert response.payload == b"Missing value"
+
+    assert await get_datapoints_by_device_uuid(device.uuid) == []
@@ -0,0 +1,111 @@
+import datetime
+import uuid
+from typing import AsyncGenerator
+import pytest
+from sqlalchemy import insert, select
+
+from sense_web.db.ids import uuid7, uuid7_timestamp
+from sense_web.db.lookups import lookups
+from sense_web.db.migrations import migrate_datapoint_uuids
+from sense_web.db.models import DataPoint
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.datapoint import (
+    create_datapoint,
+    delete_datapoint,
+    get_datapoints_by_device_uuid,
+)
+from sense_web.services.device import register_device
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+def test_uuid7() -> None:
+    timestamp = datetime.datetime(2025, 1, 1, 12, 0, 0, 123456, datetime.UTC)
+    value = uuid7(timestamp)
+
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert uuid7_timestamp(value) == timestamp.replace(microsecond=123000)
+    assert uuid7_timestamp(uuid.uuid4()) is None
+
+
+def test_uuid7_sorts_by_time() -> None:
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    values = [uuid7(start + datetime.timedelta(seconds=i)) for i in range(50)]
+
+    assert sorted(values) == values
+    assert uuid7() > values[-1]
+
+
+@pytest.mark.asyncio
+async def test_datapoint_uuid_is_uuid7(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    timestamp = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    dp = await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=timestamp,
+        sensor="temp",
+        val_float=1.0,
+    )
+
+    assert device.uuid.version == 7
+    assert uuid7_timestamp(dp.uuid) == timestamp
+    assert await delete_datapoint(device.uuid, dp.uuid) is True
+
+
+@pytest.mark.asyncio
+async def test_migrate_datapoint_uuids(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    async with sessionmanager.session() as session:
+        sensor_id = await lookups.sensor_id(session, "temp")
+        await session.execute(
+            insert(DataPoint),
+            [
+                {
+                    "uuid": uuid.uuid4(),
+                    "device_uuid": device.uuid,
+                    "timestamp": start + datetime.timedelta(minutes=i),
+                    "sensor_id": sensor_id,
+                    "val_int": i,
+                }
+                for i in range(5)
+            ],
+        )
+        await session.commit()
+    await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=start,
+        sensor="temp",
+        val_int=99,
+    )
+
+    assert await migrate_datapoint_uuids(batch_size=2) == 5
+    assert await migrate_datapoint_uuids(batch_size=2) == 0
+
+    async with sessionmanager.session() as session:
+        result = await session.execute(
+            select(DataPoint.uuid, DataPoint.val_int).order_by(DataPoint.uuid)
+        )
+        rows = result.all()
+
+    assert all(value.version == 7 for value, _ in rows)
+    assert [val_int for _, val_int in rows][-4:] == [1, 2, 3, 4]
+
+    points = await get_datapoints_by_device_uuid(device.uuid)
+    assert await delete_datapoint(device.uuid, points[0].uuid) is True
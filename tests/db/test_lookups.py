@@ -0,0 +1,86 @@
+import datetime
+from typing import AsyncGenerator
+import pytest
+from sqlalchemy import func, select
+
+from sense_web.db.lookups import SENSORS, UNITS, lookups
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.datapoint import (
+    create_datapoints_bulk,
+    get_datapoints_by_device_uuid,
+)
+from sense_web.services.device import register_device
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+@pytest.mark.asyncio
+async def test_intern_is_cached_after_commit(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    async with sessionmanager.session() as session:
+        temp = await lookups.sensor_id(session, "temp")
+        assert await lookups.sensor_id(session, "temp") == temp
+        assert await lookups.units_id(session, None) is None
+        await session.commit()
+
+    async with sessionmanager.session() as session:
+        # Served from the cache, so the lookup table is not touched
+        await session.execute(SENSORS.delete())
+        assert await lookups.sensor_id(session, "temp") == temp
+
+
+@pytest.mark.asyncio
+async def test_intern_discarded_on_rollback(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    async with sessionmanager.session() as session:
+        await lookups.units_id(session, "C")
+        await session.rollback()
+
+    async with sessionmanager.session() as session:
+        units_id = await lookups.units_id(session, "C")
+        await session.commit()
+
+        count = await session.execute(select(func.count()).select_from(UNITS))
+        assert count.scalar_one() == 1
+        assert units_id is not None
+
+
+@pytest.mark.asyncio
+async def test_datapoints_share_lookup_rows(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    readings = [
+        (
+            datetime.datetime(2025, 1, 1, i, tzinfo=datetime.UTC),
+            "temp",
+            None,
+            float(i),
+            None,
+            "C",
+        )
+        for i in range(5)
+    ]
+    await create_datapoints_bulk(device.uuid, readings)
+
+    async with sessionmanager.session() as session:
+        sensors = await session.execute(
+            select(func.count()).select_from(SENSORS)
+        )
+        assert sensors.scalar_one() == 1
+
+    points = await get_datapoints_by_device_uuid(device.uuid, sensor="temp")
+    assert len(points) == 5
+    assert {(p.sensor, p.val_units) for p in points} == {("temp", "C")}
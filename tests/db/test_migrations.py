@@ -0,0 +1,317 @@
+import datetime
+import uuid
+import sqlite3
+from pathlib import Path
+from typing import AsyncGenerator
+import pytest
+from sqlalchemy import text
+
+from sense_web.db.migrations import (
+    MIGRATIONS,
+    migrate_device_listing,
+    migrate_rollup_sensor_index,
+    migrate_datapoint_lookups,
+    migrate_datapoint_text,
+    migrate_datapoint_timestamps,
+    migrate_latest_timestamps,
+)
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.device import get_devices_version, register_device
+from sense_web.services.datapoint import (
+    create_datapoint,
+    get_datapoints_by_device_uuid,
+)
+from sense_web.services.latest import get_latest_by_device_uuid
+from sense_web.services.rollup import get_aggregates
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+@pytest.mark.asyncio
+async def test_migrate_datapoint_timestamps(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    # Rows as written by the DateTime column on SQLite
+    async with sessionmanager.session() as session:
+        await session.execute(
+            text("INSERT INTO sensors (id, name) VALUES (1, 'temp')")
+        )
+        for i, value in enumerate(
+            ["2025-01-01 00:00:00.000000", "2025-01-01 00:00:01.250000"]
+        ):
+            await session.execute(
+                text(
+                    "INSERT INTO data_points "
+                    "(uuid, device_uuid, timestamp, sensor_id, val_int) "
+                    "VALUES (:uuid, :device_uuid, :timestamp, 1, :i)"
+                ),
+                {
+                    "uuid": f"{i:032x}",
+                    "device_uuid": device.uuid.hex,
+                    "timestamp": value,
+                    "i": i,
+                },
+            )
+        await session.commit()
+
+    assert await migrate_datapoint_timestamps(batch_size=1) == 2
+    assert await migrate_datapoint_timestamps() == 0
+
+    start = datetime.datetime(2025, 1, 1, 0, 0, 1, tzinfo=datetime.UTC)
+    points = await get_datapoints_by_device_uuid(device.uuid, start=start)
+    assert [p.val_int for p in points] == [1]
+    assert points[0].timestamp == start.replace(microsecond=250000)
+
+
+@pytest.mark.asyncio
+async def test_migrate_latest_timestamps(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    # A row as written by the DateTime column on SQLite
+    async with sessionmanager.session() as session:
+        await session.execute(
+            text(
+                "INSERT INTO latest_values "
+                "(device_uuid, sensor, timestamp, val_int) "
+                "VALUES (:device_uuid, 'temp', :timestamp, 1)"
+            ),
+            {
+                "device_uuid": device.uuid.hex,
+                "timestamp": "2025-01-01 00:00:01.250000",
+            },
+        )
+        await session.commit()
+
+    assert await migrate_latest_timestamps() == 1
+    assert await migrate_latest_timestamps() == 0
+
+    latest = await get_latest_by_device_uuid(device.uuid)
+    assert [(v.sensor, v.timestamp) for v in latest] == [
+        (
+            "temp",
+            datetime.datetime(
+                2025, 1, 1, 0, 0, 1, 250000, tzinfo=datetime.UTC
+            ),
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_migrate_datapoint_lookups(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    # The table as created before sensors and units were normalised
+    async with sessionmanager.session() as session:
+        for statement in (
+            "DROP TABLE data_points",
+            (
+                "CREATE TABLE data_points ("
+                "id INTEGER PRIMARY KEY, uuid CHAR(32) NOT NULL UNIQUE, "
+                "device_uuid CHAR(32) NOT NULL, sensor VARCHAR(30) NOT NULL, "
+                "timestamp BIGINT NOT NULL, val_int INTEGER, val_float FLOAT, "
+                "val_str VARCHAR, val_units VARCHAR)"
+            ),
+            "CREATE INDEX idx_sensor_time ON data_points (sensor, timestamp)",
+            (
+                "CREATE INDEX idx_device_sensor "
+                "ON data_points (device_uuid, sensor)"
+            ),
+        ):
+            await session.execute(text(statement))
+        for i, (sensor, units) in enumerate(
+            [("temp", "C"), ("temp", "C"), ("msg", None)]
+        ):
+            await session.execute(
+                text(
+                    "INSERT INTO data_points (uuid, device_uuid, timestamp, "
+                    "sensor, val_int, val_units) VALUES "
+                    "(:uuid, :device_uuid, :timestamp, :sensor, :i, :units)"
+                ),
+                {
+                    "uuid": f"{i:032x}",
+                    "device_uuid": device.uuid.hex,
+                    "timestamp": 1735689600000000 + i,
+                    "sensor": sensor,
+                    "i": i,
+                    "units": units,
+                },
+            )
+        await session.commit()
+
+    assert await migrate_datapoint_lookups() == 1
+    assert await migrate_datapoint_lookups() == 0
+
+    async with sessionmanager.session() as session:
+        sensors = await session.execute(text("SELECT name FROM sensors"))
+        indexes = await session.execute(
+            text(
+                "SELECT sql FROM sqlite_master WHERE name = 'idx_sensor_time'"
+            )
+        )
+        assert sorted(sensors.scalars()) == ["msg", "temp"]
+        assert "sensor_id" in indexes.scalar_one()
+
+    points = await get_datapoints_by_device_uuid(device.uuid, sensor="temp")
+    assert [(p.val_int, p.val_units) for p in points] == [(1, "C"), (0, "C")]
+
+
+@pytest.mark.asyncio
+async def test_migrate_datapoint_text(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    # The table as created before text readings were split out
+    async with sessionmanager.session() as session:
+        for statement in (
+            "DROP TABLE data_points",
+            (
+                "CREATE TABLE data_points ("
+                "id INTEGER PRIMARY KEY, uuid CHAR(32) NOT NULL UNIQUE, "
+                "device_uuid CHAR(32) NOT NULL, sensor_id INTEGER NOT NULL, "
+                "timestamp BIGINT NOT NULL, val_int INTEGER, val_float FLOAT, "
+                "val_str VARCHAR, units_id INTEGER)"
+            ),
+            "INSERT INTO sensors (id, name) VALUES (1, 'temp'), (2, 'msg')",
+        ):
+            await session.execute(text(statement))
+        for i, (sensor_id, val_int, val_str) in enumerate(
+            [(1, 20, None), (2, None, "hello"), (2, 3, "3"), (1, 21, None)]
+        ):
+            await session.execute(
+                text(
+                    "INSERT INTO data_points (uuid, device_uuid, timestamp, "
+                    "sensor_id, val_int, val_str) VALUES "
+                    "(:uuid, :device_uuid, :timestamp, :sensor_id, :val_int, "
+                    ":val_str)"
+                ),
+                {
+                    "uuid": f"{i:032x}",
+                    "device_uuid": device.uuid.hex,
+                    "timestamp": 1735689600000000 + i,
+                    "sensor_id": sensor_id,
+                    "val_int": val_int,
+                    "val_str": val_str,
+                },
+            )
+        await session.commit()
+
+    assert await migrate_datapoint_text(batch_size=1) == 2
+    assert await migrate_datapoint_text() == 0
+
+    async with sessionmanager.session() as session:
+        result = await session.execute(
+            text("SELECT count(*) FROM data_points")
+        )
+        assert result.scalar_one() == 2
+
+    points = await get_datapoints_by_device_uuid(device.uuid)
+    assert [(p.sensor, p.val_int, p.val_str) for p in points] == [
+        ("temp", 21, None),
+        ("msg", 3, "3"),
+        ("msg", None, "hello"),
+        ("temp", 20, None),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_migrate_device_listing(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    # The device table as created before it was indexed by name
+    async with sessionmanager.session() as session:
+        await session.execute(text("DROP INDEX ix_devices_name"))
+        await session.execute(text("DROP TABLE table_versions"))
+        await session.execute(text("DROP TABLE device_status"))
+        await session.commit()
+
+    assert await migrate_device_listing() == 3
+    assert await migrate_device_listing() == 0
+
+    await register_device("12345", "device1")
+    assert (await get_devices_version())[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_migrate_rollup_sensor_index(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    async with sessionmanager.session() as session:
+        await session.execute(text("DROP INDEX idx_rollup_sensor_bucket"))
+        await session.commit()
+
+    assert await migrate_rollup_sensor_index() == 1
+    assert await migrate_rollup_sensor_index() == 0
+
+
+@pytest.mark.asyncio
+async def test_upgrade_database_from_first_schema(tmp_path: Path) -> None:
+    # The schema and rows written before any of the migrations existed
+    path = tmp_path / "legacy.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(
+            "CREATE TABLE devices (id INTEGER PRIMARY KEY, "
+            "imei VARCHAR NOT NULL UNIQUE, uuid CHAR(32) NOT NULL UNIQUE, "
+            "name VARCHAR NOT NULL);"
+            "CREATE TABLE data_points (id INTEGER PRIMARY KEY, "
+            "uuid CHAR(32) NOT NULL UNIQUE, device_uuid CHAR(32) NOT NULL, "
+            "sensor VARCHAR(30) NOT NULL, timestamp DATETIME NOT NULL, "
+            "val_int INTEGER, val_float FLOAT, val_str VARCHAR, "
+            "val_units VARCHAR, CONSTRAINT check_value_present CHECK "
+            "((val_float IS NOT NULL) OR (val_str IS NOT NULL) "
+            "OR (val_int IS NOT NULL)));"
+            "CREATE INDEX idx_sensor_time ON data_points (sensor, timestamp);"
+            "INSERT INTO devices VALUES "
+            "(1, '12345', '000000000000000000000000000000aa', 'device1');"
+            "INSERT INTO data_points VALUES "
+            "(1, '00000000000000000000000000000001', "
+            "'000000000000000000000000000000aa', 'temp', "
+            "'2025-01-01 00:00:00.000000', NULL, 1.5, NULL, 'C'), "
+            "(2, '00000000000000000000000000000002', "
+            "'000000000000000000000000000000aa', 'msg', "
+            "'2025-01-01 00:00:01.000000', NULL, NULL, 'hi', NULL);"
+        )
+
+    await sessionmanager.init(f"sqlite+aiosqlite:///{path}")
+    try:
+        for name in (
+            "epoch_us",
+            "latest_epoch_us",
+            "uuid7",
+            "lookups",
+            "text",
+            "devices",
+            "rollup_index",
+            "epoch_seconds",
+        ):
+            await MIGRATIONS[name]()
+
+        device_uuid = uuid.UUID(int=0xAA)
+        points = await get_datapoints_by_device_uuid(device_uuid)
+        assert [(p.sensor, p.val_float, p.val_str) for p in points] == [
+            ("msg", None, "hi"),
+            ("temp", 1.5, None),
+        ]
+
+        # Tables added since are created, so new readings can be stored
+        later = datetime.datetime(2025, 1, 2, tzinfo=datetime.UTC)
+        await create_datapoint(device_uuid, later, "temp", val_float=2.0)
+        aggregates = await get_aggregates(device_uuid, "temp", 3600)
+        assert [a.count for a in aggregates] == [1]
+    finally:
+        await sessionmanager.close()
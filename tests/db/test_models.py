@@ -2,10 +2,10 @@ import datetime
 import pytest
 import uuid
 from typing import Generator
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import Session
 from sense_web.db.base import Base
-from sense_web.db.models import Device, DataPoint
+from sense_web.db.models import Device, DataPoint, Sensor, TextPoint, Unit
 from sqlalchemy.exc import IntegrityError
 
 
@@ -122,15 +122,30 @@ def make_device(
     return device
 
 
+def make_sensor(db_session: Session, name: str = "temp") -> Sensor:
+    sensor = Sensor(name=name)
+    db_session.add(sensor)
+    db_session.commit()
+    return sensor
+
+
+def make_unit(db_session: Session, name: str = "C") -> Unit:
+    unit = Unit(name=name)
+    db_session.add(unit)
+    db_session.commit()
+    return unit
+
+
 def test_datapoint_create(db_session: Session) -> None:
     device = make_device(db_session)
+    unit = make_unit(db_session, "degrees")
     dp = DataPoint(
         uuid=uuid.uuid4(),
         device_uuid=device.uuid,
         timestamp=datetime.datetime.now(datetime.UTC),
-        sensor="gps_lat",
+        sensor_id=make_sensor(db_session, "gps_lat").id,
         val_float=37.7749,
-        val_units="degrees",
+        units_id=unit.id,
     )
 
     db_session.add(dp)
@@ -138,19 +153,19 @@ def test_datapoint_create(db_session: Session) -> None:
 
     assert dp.id is not None
     assert dp.val_float == 37.7749
-    assert dp.val_units == "degrees"
-    assert dp.val_str is None
+    assert dp.units_id == unit.id
+    assert dp.val_int is None
 
 
-def test_datapoint_with_val_str(db_session: Session) -> None:
+def test_textpoint_create(db_session: Session) -> None:
     device = make_device(db_session)
-    dp = DataPoint(
+    dp = TextPoint(
         uuid=uuid.uuid4(),
         device_uuid=device.uuid,
         timestamp=datetime.datetime.now(datetime.UTC),
-        sensor="raw_rs232",
+        sensor_id=make_sensor(db_session, "raw_rs232").id,
         val_str="OK",
-        val_units=None,
+        units_id=None,
     )
 
     db_session.add(dp)
@@ -161,13 +176,26 @@ def test_datapoint_with_val_str(db_session: Session) -> None:
     assert dp.val_float is None
 
 
+def test_datapoint_requires_numeric_value(db_session: Session) -> None:
+    device = make_device(db_session)
+    dp = DataPoint(
+        uuid=uuid.uuid4(),
+        device_uuid=device.uuid,
+        timestamp=datetime.datetime.now(datetime.UTC),
+        sensor_id=make_sensor(db_session, "temp").id,
+    )
+    db_session.add(dp)
+    with pytest.raises(IntegrityError):
+        db_session.commit()
+
+
 def test_datapoint_missing_required_fields(db_session: Session) -> None:
     device = make_device(db_session)
     dp = DataPoint(
         uuid=uuid.uuid4(),
         device_uuid=device.uuid,
         timestamp=datetime.datetime.now(datetime.UTC),
-        sensor=None,
+        sensor_id=None,
     )
     db_session.add(dp)
     with pytest.raises(IntegrityError):
@@ -181,14 +209,14 @@ def test_datapoint_uuid_uniqueness(db_session: Session) -> None:
         uuid=fixed_uuid,
         device_uuid=device.uuid,
         timestamp=datetime.datetime.now(datetime.UTC),
-        sensor="s1",
+        sensor_id=make_sensor(db_session, "s1").id,
         val_float=1.0,
     )
     dp2 = DataPoint(
         uuid=fixed_uuid,
         device_uuid=device.uuid,
         timestamp=datetime.datetime.now(datetime.UTC),
-        sensor="s2",
+        sensor_id=make_sensor(db_session, "s2").id,
         val_float=2.0,
     )
 
@@ -202,32 +230,32 @@ def test_datapoint_uuid_uniqueness(db_session: Session) -> None:
 
 def test_datapoint_query_by_sensor(db_session: Session) -> None:
     device = make_device(db_session)
+    sensor = make_sensor(db_session, "temp_sensor")
+    make_sensor(db_session, "other_sensor")
     for i in range(3):
         dp = DataPoint(
             uuid=uuid.uuid4(),
             device_uuid=device.uuid,
             timestamp=datetime.datetime.now(datetime.UTC),
-            sensor="temp_sensor",
+            sensor_id=sensor.id,
             val_float=20 + i,
-            val_units="C",
         )
         db_session.add(dp)
     db_session.commit()
 
-    results = db_session.query(DataPoint).filter_by(sensor="temp_sensor").all()
+    results = db_session.query(DataPoint).filter_by(sensor_id=sensor.id).all()
     assert len(results) == 3
 
 
-def test_datapoint_val_float_and_str_can_coexist(db_session: Session) -> None:
+def test_textpoint_val_float_and_str_can_coexist(db_session: Session) -> None:
     device = make_device(db_session)
-    dp = DataPoint(
+    dp = TextPoint(
         uuid=uuid.uuid4(),
         device_uuid=device.uuid,
         timestamp=datetime.datetime.now(datetime.UTC),
-        sensor="weird_sensor",
+        sensor_id=make_sensor(db_session, "weird_sensor").id,
         val_float=3.14,
         val_str="3.14",
-        val_units="units",
     )
     db_session.add(dp)
     db_session.commit()
@@ -239,19 +267,20 @@ def test_datapoint_val_float_and_str_can_coexist(db_session: Session) -> None:
 def test_datapoint_filter_by_time_range(db_session: Session) -> None:
     device = make_device(db_session)
     now = datetime.datetime.now(datetime.UTC)
+    sensor = make_sensor(db_session, "humidity")
 
     old_dp = DataPoint(
         uuid=uuid.uuid4(),
         device_uuid=device.uuid,
         timestamp=now.replace(year=2024),
-        sensor="humidity",
+        sensor_id=sensor.id,
         val_float=50.0,
     )
     new_dp = DataPoint(
         uuid=uuid.uuid4(),
         device_uuid=device.uuid,
         timestamp=now,
-        sensor="humidity",
+        sensor_id=sensor.id,
         val_float=55.0,
     )
     db_session.add_all([old_dp, new_dp])
@@ -271,7 +300,7 @@ def test_datapoint_missing_device_uuid_raises(db_session: Session) -> None:
         uuid=uuid.uuid4(),
         device_uuid=None,
         timestamp=datetime.datetime.now(datetime.UTC),
-        sensor="temp",
+        sensor_id=make_sensor(db_session, "temp").id,
         val_float=25.0,
     )
     db_session.add(dp)
@@ -279,15 +308,46 @@ def test_datapoint_missing_device_uuid_raises(db_session: Session) -> None:
         db_session.commit()
 
 
-def test_val_units_can_be_null(db_session: Session) -> None:
+def test_sensor_name_uniqueness(db_session: Session) -> None:
+    make_sensor(db_session, "temp")
+
+    db_session.add(Sensor(name="temp"))
+    with pytest.raises(IntegrityError):
+        db_session.commit()
+
+
+def test_units_id_can_be_null(db_session: Session) -> None:
     device = make_device(db_session)
     dp = DataPoint(
         uuid=uuid.uuid4(),
         device_uuid=device.uuid,
         timestamp=datetime.datetime.now(datetime.UTC),
-        sensor="custom_sensor",
+        sensor_id=make_sensor(db_session, "custom_sensor").id,
         val_float=42.0,
     )
     db_session.add(dp)
     db_session.commit()
-    assert dp.val_units is None
+    assert dp.units_id is None
+
+
+def test_datapoint_timestamp_stored_as_epoch_us(db_session: Session) -> None:
+    device = make_device(db_session)
+    timestamp = datetime.datetime(2025, 1, 1, 12, 0, 0, 123456)
+    dp = DataPoint(
+        uuid=uuid.uuid4(),
+        device_uuid=device.uuid,
+        timestamp=timestamp,
+        sensor_id=make_sensor(db_session, "temp").id,
+        val_float=25.0,
+    )
+    db_session.add(dp)
+    db_session.commit()
+
+    raw = db_session.execute(
+        text("SELECT timestamp FROM data_points")
+    ).scalar_one()
+    assert raw == 1735732800123456
+
+    db_session.expire_all()
+    stored = db_session.query(DataPoint).one()
+    assert stored.timestamp == timestamp.replace(tzinfo=datetime.UTC)
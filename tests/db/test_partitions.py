@@ -0,0 +1,198 @@
+import datetime
+from typing import AsyncGenerator
+import pytest
+from sqlalchemy import text
+
+from sense_web.db.partitions import (
+    partition_bounds,
+    partition_name,
+    partitions,
+)
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.device import register_device
+from sense_web.services.datapoint import (
+    create_datapoint,
+    delete_datapoint,
+    get_datapoints_by_device_uuid,
+)
+from sense_web.services.retention import RetentionPolicy, apply_retention
+from sense_web.services.rollup import get_aggregates
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+NOW = datetime.datetime(2025, 3, 15, 12, 0, tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    partitions.init(enabled=True)
+    yield sessionmanager
+    partitions.init(enabled=False)
+    await sessionmanager.close()
+
+
+async def partition_names() -> list[str]:
+    async with sessionmanager.session() as session:
+        return await partitions.partition_names(session)
+
+
+def test_partition_name_and_bounds() -> None:
+    ts = datetime.datetime(2024, 12, 31, 23, 59, tzinfo=datetime.UTC)
+    name = partition_name(ts)
+
+    assert name == "data_points_202412"
+    assert partition_bounds(name) == (
+        datetime.datetime(2024, 12, 1, tzinfo=datetime.UTC),
+        datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC),
+    )
+
+
+@pytest.mark.asyncio
+async def test_datapoints_routed_to_partitions(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    # Written before partitioning was enabled
+    partitions.init(enabled=False)
+    legacy = await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=datetime.datetime(2025, 1, 10, tzinfo=datetime.UTC),
+        sensor="temp",
+        val_int=1,
+    )
+    partitions.init(enabled=True)
+
+    for month in (2, 3):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=datetime.datetime(2025, month, 10, tzinfo=datetime.UTC),
+            sensor="temp",
+            val_int=month,
+        )
+
+    assert await partition_names() == [
+        "data_points_202502",
+        "data_points_202503",
+    ]
+
+    datapoints = await get_datapoints_by_device_uuid(device.uuid)
+    assert [dp.val_int for dp in datapoints] == [3, 2, 1]
+
+    datapoints = await get_datapoints_by_device_uuid(
+        device.uuid,
+        start=datetime.datetime(2025, 2, 1, tzinfo=datetime.UTC),
+        end=datetime.datetime(2025, 3, 1, tzinfo=datetime.UTC),
+    )
+    assert [dp.val_int for dp in datapoints] == [2]
+
+    assert await delete_datapoint(device.uuid, legacy.uuid)
+    datapoints = await get_datapoints_by_device_uuid(device.uuid)
+    assert [dp.val_int for dp in datapoints] == [3, 2]
+
+
+@pytest.mark.asyncio
+async def test_apply_retention_drops_partitions(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    for days_ago in (60, 40, 5):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=NOW - datetime.timedelta(days=days_ago),
+            sensor="temp",
+            val_float=float(days_ago),
+        )
+
+    assert len(await partition_names()) == 3
+
+    result = await apply_retention(RetentionPolicy(raw_days=30), now=NOW)
+
+    # January is dropped whole; February still overlaps the cutoff
+    assert result.partitions_dropped == 1
+    assert result.raw_deleted == 1
+    assert await partition_names() == [
+        "data_points_202502",
+        "data_points_202503",
+    ]
+
+    datapoints = await get_datapoints_by_device_uuid(device.uuid)
+    assert [dp.val_float for dp in datapoints] == [5.0]
+
+    # Rollups survive the dropped partition
+    aggregates = await get_aggregates(device.uuid, "temp", 3600)
+    assert sorted(a.sum for a in aggregates) == [5.0, 40.0, 60.0]
+
+
+@pytest.mark.asyncio
+async def test_apply_retention_keeps_partitions_with_kept_sensors(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    for sensor in ("temp", "gps"):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=NOW - datetime.timedelta(days=60),
+            sensor=sensor,
+            val_float=1.0,
+        )
+
+    result = await apply_retention(
+        RetentionPolicy(raw_days=30, sensor_raw_days={"gps": None}), now=NOW
+    )
+
+    assert result.partitions_dropped == 0
+    assert result.raw_deleted == 1
+
+    datapoints = await get_datapoints_by_device_uuid(device.uuid)
+    assert [dp.sensor for dp in datapoints] == ["gps"]
+
+
+@pytest.mark.asyncio
+async def test_partition_list_cached(
+    db_manager: DatabaseSessionManager, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    device = await register_device("12345", "device1")
+    await create_datapoint(device.uuid, NOW, "temp", val_int=1)
+
+    # Partitions created by this process are seen straight away
+    async with sessionmanager.session() as session:
+        names = [t.name for t in await partitions.tables(session)]
+        assert names == ["data_points", "data_points_202503"]
+
+        # The list is not read again on every call
+        async def unexpected(*args: object) -> None:
+            raise AssertionError("partitions listed again")
+
+        monkeypatch.setattr(partitions, "partition_names", unexpected)
+        assert len(await partitions.tables(session)) == 2
+
+        # Nor at all while partitioning is disabled
+        partitions.enabled = False
+        assert [t.name for t in await partitions.tables(session)] == [
+            "data_points"
+        ]
+
+
+@pytest.mark.asyncio
+async def test_late_reading_recreates_dropped_partition(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+    late = datetime.datetime(2025, 1, 10, tzinfo=datetime.UTC)
+    await create_datapoint(device.uuid, late, "temp", val_int=1)
+
+    # Another process archives the closed month
+    async with sessionmanager.session() as session:
+        await session.execute(text("DROP TABLE data_points_202501"))
+        await session.commit()
+
+    await create_datapoint(device.uuid, late, "temp", val_int=2)
+
+    points = await get_datapoints_by_device_uuid(device.uuid)
+    assert [p.val_int for p in points] == [2]
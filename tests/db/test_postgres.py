@@ -0,0 +1,122 @@
+import datetime
+import os
+from typing import AsyncGenerator, Generator
+import pytest
+from sqlalchemy import func, select, text
+
+from testcontainers.postgres import PostgresContainer
+
+from sense_web.db.models import DataPoint
+from sense_web.db.partitions import partitions
+from sense_web.db.session import (
+    DatabaseSessionManager,
+    sessionmanager,
+)
+from sense_web.services.datapoint import (
+    create_datapoints_bulk,
+    get_datapoints_by_device_uuid,
+    get_series_by_device_uuid,
+    stream_datapoints_by_device_uuid,
+)
+from sense_web.services.device import register_device
+
+pytest.importorskip("asyncpg")
+
+START = datetime.datetime(2025, 1, 31, 23, 0, tzinfo=datetime.UTC)
+
+
+@pytest.fixture(scope="module")
+def postgres_uri() -> Generator[str, None, None]:
+    # An existing, empty database can be used instead of a container
+    uri = os.getenv("POSTGRES_TEST_URI")
+    if uri:
+        yield uri
+        return
+    with PostgresContainer("postgres:16-alpine", driver="asyncpg") as pg:
+        yield pg.get_connection_url()
+
+
+@pytest.fixture
+async def db_manager(
+    postgres_uri: str,
+) -> AsyncGenerator[DatabaseSessionManager, None]:
+    # Tables are created by init() on PostgreSQL
+    await sessionmanager.init(postgres_uri)
+    yield sessionmanager
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.drop_all(conn)
+    await sessionmanager.close()
+    partitions.init(enabled=False)
+
+
+async def index_definitions(table: str) -> list[str]:
+    async with sessionmanager.session() as session:
+        result = await session.execute(
+            text("SELECT indexdef FROM pg_indexes WHERE tablename = :t"),
+            {"t": table},
+        )
+        return list(result.scalars())
+
+
+@pytest.mark.asyncio
+async def test_postgres_schema(db_manager: DatabaseSessionManager) -> None:
+    indexes = await index_definitions("data_points")
+
+    assert any('USING brin ("timestamp")' in i for i in indexes)
+
+
+@pytest.mark.asyncio
+async def test_postgres_bulk_ingest(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    partitions.init(enabled=True)
+    device = await register_device("12345", "device1")
+
+    readings = [
+        (
+            START + datetime.timedelta(seconds=i),
+            "temp",
+            None,
+            float(i),
+            None,
+            "C",
+        )
+        for i in range(7200)
+    ]
+    readings.append((START, "status", None, None, "OK", None))
+
+    assert await create_datapoints_bulk(device.uuid, readings) == 7201
+
+    # The readings span two monthly partitions, each with its own BRIN
+    # index
+    for name in ("data_points_202501", "data_points_202502"):
+        indexes = await index_definitions(name)
+        assert any("USING brin" in i for i in indexes)
+
+    async with sessionmanager.session() as session:
+        result = await session.execute(select(func.count(DataPoint.id)))
+        assert result.scalar_one() == 0
+
+    end = START + datetime.timedelta(hours=2)
+    points = await get_datapoints_by_device_uuid(
+        device.uuid, sensor="temp", start=end - datetime.timedelta(minutes=1)
+    )
+    assert [p.val_float for p in points] == [
+        float(i) for i in range(7199, 7139, -1)
+    ]
+
+    # Streamed newest first across both partitions
+    streamed = [
+        p
+        async for batch in stream_datapoints_by_device_uuid(device.uuid)
+        for p in batch
+    ]
+    assert len(streamed) == 7201
+    assert streamed[0].val_float == 7199.0
+    assert streamed[0].device_uuid == device.uuid
+
+    series = await get_series_by_device_uuid(device.uuid)
+    assert [(s.sensor, len(s.timestamps)) for s in series] == [
+        ("status", 1),
+        ("temp", 7200),
+    ]
@@ -1,7 +1,9 @@
 import pytest
 import uuid
+from pathlib import Path
 from typing import AsyncGenerator
 from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import text
 
@@ -87,3 +89,82 @@ async def test_session_manager_rollback_on_error(
     with pytest.raises(DummyError):
         async with db_manager.session() as _:
             raise DummyError("force rollback")
+
+
+@pytest.mark.asyncio
+async def test_sqlite_profile(tmp_path: Path) -> None:
+    manager = DatabaseSessionManager()
+    await manager.init(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+
+    async with manager.session() as session:
+        mode = await session.execute(text("PRAGMA journal_mode"))
+        assert mode.scalar_one() == "wal"
+
+        session.add(
+            Device(imei="123456789012345", uuid=uuid.uuid4(), name="d0")
+        )
+        await session.commit()
+
+    async with manager.session(readonly=True) as session:
+        result = await session.execute(select(Device))
+        assert result.scalars().one().name == "d0"
+
+        with pytest.raises(OperationalError, match="readonly"):
+            await session.execute(text("DELETE FROM devices"))
+
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_readonly_session_without_profile(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    async with db_manager.session(readonly=True) as session:
+        result = await session.execute(text("SELECT 1"))
+        assert result.scalar_one() == 1
+
+
+@pytest.mark.asyncio
+async def test_readonly_sessions_use_replicas(tmp_path: Path) -> None:
+    primary = f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}"
+    replica = f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"
+
+    # Stand-in for a replica that has not caught up yet
+    manager = DatabaseSessionManager()
+    await manager.init(replica)
+    await manager.close()
+
+    await manager.init(primary, replica_uris=[replica], read_your_writes=60)
+    async with manager.session() as session:
+        session.add(
+            Device(imei="123456789012345", uuid=uuid.uuid4(), name="d0")
+        )
+        await session.commit()
+
+    # Reads straight after a write see it on the primary
+    async with manager.session(readonly=True) as session:
+        result = await session.execute(select(Device))
+        assert result.scalars().one_or_none() is not None
+
+    manager._read_your_writes = 0
+    async with manager.session(readonly=True) as session:
+        result = await session.execute(select(Device))
+        assert result.scalars().one_or_none() is None
+
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_reuse_yields_given_session(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    async with db_manager.session() as session:
+        async with db_manager.reuse(session, readonly=True) as reused:
+            assert reused is session
+
+        # A reused session is left open for its owner
+        result = await session.execute(text("SELECT 1"))
+        assert result.scalar_one() == 1
+
+        async with db_manager.reuse(None) as opened:
+            assert opened is not session
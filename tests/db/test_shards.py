@@ -0,0 +1,216 @@
+import datetime
+from pathlib import Path
+from typing import AsyncGenerator, List
+import pytest
+from sqlalchemy import func, select
+
+from sense_web.db.models import DataPoint, Device
+from sense_web.db.partitions import partitions
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.dto.device import DeviceDTO
+from sense_web.services.archive import archive, archive_partitions
+from sense_web.services.datapoint import (
+    create_datapoint,
+    delete_datapoint,
+    get_datapoints_by_device_uuid,
+    get_datapoints_by_sensor,
+)
+from sense_web.services.device import (
+    delete_device,
+    register_device,
+    register_devices as register_batch,
+)
+from sense_web.services.latest import list_latest
+from sense_web.services.retention import RetentionPolicy, apply_retention
+from sense_web.services.rollup import get_fleet_aggregates
+
+SHARDS = 3
+NOW = datetime.datetime(2025, 6, 1, tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+async def db_manager(
+    tmp_path: Path,
+) -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(
+        f"sqlite+aiosqlite:///{tmp_path / 'main.db'}",
+        shard_uris=[
+            f"sqlite+aiosqlite:///{tmp_path / f'shard{i}.db'}"
+            for i in range(SHARDS)
+        ],
+    )
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+async def register_devices(count: int) -> List[DeviceDTO]:
+    return [
+        await register_device(f"{i:015d}", f"device{i}") for i in range(count)
+    ]
+
+
+async def count_datapoints(shard: int | None) -> int:
+    async with sessionmanager.session(shard=shard) as session:
+        result = await session.execute(select(func.count(DataPoint.id)))
+        return result.scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_shard_for_is_stable(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = await register_devices(12)
+
+    shards = [sessionmanager.shard_for(d.uuid) for d in devices]
+    assert shards == [sessionmanager.shard_for(d.uuid) for d in devices]
+    assert set(shards) <= set(range(SHARDS))
+    assert sessionmanager.shards == list(range(SHARDS))
+
+
+@pytest.mark.asyncio
+async def test_readings_stored_on_device_shard(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = await register_devices(6)
+    for device in devices:
+        await create_datapoint(device.uuid, NOW, "temp", val_float=1.0)
+
+    expected = [0] * SHARDS
+    for device in devices:
+        shard = sessionmanager.shard_for(device.uuid)
+        assert shard is not None
+        expected[shard] += 1
+
+        # The device row is copied to its shard
+        async with sessionmanager.session(device=device.uuid) as session:
+            result = await session.execute(
+                select(Device).where(Device.uuid == device.uuid)
+            )
+            assert result.scalar_one().imei == device.imei
+
+        points = await get_datapoints_by_device_uuid(device.uuid)
+        assert [p.val_float for p in points] == [1.0]
+
+    assert [await count_datapoints(s) for s in range(SHARDS)] == expected
+    assert await count_datapoints(None) == 0
+
+
+@pytest.mark.asyncio
+async def test_fan_out_reads_and_deletes(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = await register_devices(6)
+    points = [
+        await create_datapoint(device.uuid, NOW, "temp", val_float=1.0)
+        for device in devices
+    ]
+
+    latest = await list_latest()
+    assert [v.device_uuid for v in latest] == sorted(d.uuid for d in devices)
+
+    last = points[-1]
+    assert await delete_datapoint(last.device_uuid, last.uuid)
+    assert not await delete_datapoint(last.device_uuid, last.uuid)
+    assert await get_datapoints_by_device_uuid(devices[-1].uuid) == []
+
+
+@pytest.mark.asyncio
+async def test_retention_applied_to_every_shard(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = await register_devices(6)
+    for device in devices:
+        await create_datapoint(
+            device.uuid, NOW - datetime.timedelta(days=10), "temp", val_int=1
+        )
+        await create_datapoint(device.uuid, NOW, "temp", val_int=2)
+
+    result = await apply_retention(RetentionPolicy(raw_days=5), now=NOW)
+
+    assert result.raw_deleted == len(devices)
+    for device in devices:
+        points = await get_datapoints_by_device_uuid(device.uuid)
+        assert [p.val_int for p in points] == [2]
+
+
+@pytest.mark.asyncio
+async def test_archive_every_shard(
+    db_manager: DatabaseSessionManager, tmp_path: Path
+) -> None:
+    partitions.init(enabled=True)
+    archive.init(str(tmp_path / "archive"))
+    try:
+        devices = await register_devices(6)
+        for device in devices:
+            await create_datapoint(
+                device.uuid,
+                NOW - datetime.timedelta(days=40),
+                "temp",
+                val_int=1,
+            )
+        shards = {sessionmanager.shard_for(d.uuid) for d in devices}
+
+        # Each shard writes the month to a file of its own
+        assert await archive_partitions(NOW) == len(shards)
+        assert len(archive.names()) == len(shards)
+        for shard in range(SHARDS):
+            async with sessionmanager.session(shard=shard) as session:
+                assert await partitions.partition_names(session) == []
+
+        for device in devices:
+            points = await get_datapoints_by_device_uuid(device.uuid)
+            assert [p.val_int for p in points] == [1]
+    finally:
+        archive.init(None)
+        partitions.init(enabled=False)
+
+
+@pytest.mark.asyncio
+async def test_delete_device_from_shard(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = (await register_devices(1))[0]
+    await create_datapoint(device.uuid, NOW, "temp", val_float=1.0)
+
+    assert await delete_device(device.uuid)
+
+    async with sessionmanager.session(device=device.uuid) as session:
+        result = await session.execute(select(func.count(Device.id)))
+        assert result.scalar_one() == 0
+    assert sum([await count_datapoints(s) for s in range(SHARDS)]) == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_registered_devices_copied_to_shards(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = await register_batch(
+        [(f"{i:015d}", f"device{i}") for i in range(6)]
+    )
+
+    for device in devices:
+        assert device is not None
+        async with sessionmanager.session(device=device.uuid) as session:
+            result = await session.execute(
+                select(Device).where(Device.uuid == device.uuid)
+            )
+            assert result.scalar_one().imei == device.imei
+
+
+@pytest.mark.asyncio
+async def test_sensor_reads_across_shards(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = await register_devices(6)
+    for i, device in enumerate(devices):
+        await create_datapoint(device.uuid, NOW, "temp", val_float=float(i))
+
+    points = await get_datapoints_by_sensor("temp")
+    assert [p.device_uuid for p in points] == sorted(d.uuid for d in devices)
+
+    chosen = [devices[0].uuid, devices[5].uuid]
+    points = await get_datapoints_by_sensor("temp", devices=chosen)
+    assert sorted(p.val_float for p in points) == [0.0, 5.0]
+
+    fleet = await get_fleet_aggregates("temp", 3600)
+    assert [(a.count, a.min, a.max) for a in fleet] == [(6, 0.0, 5.0)]
@@ -0,0 +1,89 @@
+import datetime
+from typing import AsyncGenerator
+import pytest
+
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.activity import activity, get_device_status
+from sense_web.services.device import (
+    delete_device,
+    get_devices_version,
+    register_device,
+)
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+NOW = datetime.datetime(2025, 1, 1, 23, 59, tzinfo=datetime.UTC)
+RSSI = (NOW, "rssi", -70, None, None, "dBm")
+TEMP = (NOW, "temp", None, 21.5, None, "C")
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    activity.init("rssi")
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+@pytest.mark.asyncio
+async def test_activity_flushed(db_manager: DatabaseSessionManager) -> None:
+    device = await register_device("12345", "device1")
+    polling = await register_device("54321", "device2")
+
+    activity.record(device.uuid, [RSSI, TEMP], now=NOW)
+    activity.record(device.uuid, [TEMP], now=NOW)
+    activity.record(polling.uuid, now=NOW)
+
+    # Nothing is written until the activity is flushed
+    assert await get_device_status([device.uuid]) == {}
+    version = await get_devices_version()
+    assert await activity.flush() == 2
+    assert await activity.flush() == 0
+    assert await get_devices_version() > version
+
+    statuses = await get_device_status([device.uuid, polling.uuid])
+    assert statuses[device.uuid].last_seen == NOW
+    assert statuses[device.uuid].readings_on(NOW.date()) == 3
+    assert statuses[device.uuid].last_signal == -70.0
+    assert statuses[polling.uuid].readings_on(NOW.date()) == 0
+    assert statuses[polling.uuid].last_signal is None
+
+
+@pytest.mark.asyncio
+async def test_activity_counts_reset_daily(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+    activity.record(device.uuid, [RSSI, TEMP], now=NOW)
+    await activity.flush()
+
+    tomorrow = NOW + datetime.timedelta(minutes=2)
+    activity.record(device.uuid, [TEMP], now=tomorrow)
+    await activity.flush()
+
+    status = (await get_device_status([device.uuid]))[device.uuid]
+    assert status.last_seen == tomorrow
+    assert status.readings_on(tomorrow.date()) == 1
+    assert status.readings_on(NOW.date()) == 0
+    assert status.last_signal == -70.0
+
+
+@pytest.mark.asyncio
+async def test_activity_of_deleted_devices_skipped(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+    deleted = await register_device("54321", "device2")
+    activity.record(deleted.uuid, [TEMP], now=NOW)
+    await activity.flush()
+
+    assert await delete_device(deleted.uuid)
+    activity.record(device.uuid, [TEMP], now=NOW)
+    activity.record(deleted.uuid, [TEMP], now=NOW)
+
+    assert await activity.flush() == 1
+    assert list(await get_device_status([device.uuid, deleted.uuid])) == [
+        device.uuid
+    ]
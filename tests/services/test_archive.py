@@ -0,0 +1,167 @@
+import datetime
+import uuid
+from pathlib import Path
+from typing import AsyncGenerator, List
+import pytest
+from sqlalchemy import func, select
+
+from sense_web.db.models import TextPoint
+from sense_web.db.partitions import partitions
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.archive import archive, archive_partitions
+from sense_web.services.device import register_device
+from sense_web.services.datapoint import (
+    create_datapoint,
+    get_datapoint_rows_by_device_uuid,
+    get_datapoints_by_device_uuid,
+)
+from sense_web.services.retention import RetentionPolicy, apply_retention
+from sense_web.services.rollup import get_aggregates
+
+pytest.importorskip("pyarrow")
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+NOW = datetime.datetime(2025, 3, 15, 12, 0, tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+async def db_manager(
+    tmp_path: Path,
+) -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    partitions.init(enabled=True)
+    archive.init(str(tmp_path))
+    yield sessionmanager
+    archive.init(None)
+    partitions.init(enabled=False)
+    await sessionmanager.close()
+
+
+async def create_readings(device_uuid: uuid.UUID) -> None:
+    for month in (1, 2, 3):
+        for sensor in ("temp", "msg"):
+            await create_datapoint(
+                device_uuid=device_uuid,
+                timestamp=datetime.datetime(
+                    2025, month, 10, tzinfo=datetime.UTC
+                ),
+                sensor=sensor,
+                val_float=float(month) if sensor == "temp" else None,
+                val_str=f"hello {month}" if sensor == "msg" else None,
+            )
+
+
+def archived_months() -> List[str]:
+    return [name.split(".")[0] for name in archive.names()]
+
+
+async def count_text_points() -> int:
+    async with sessionmanager.session() as session:
+        result = await session.execute(select(func.count(TextPoint.id)))
+        return result.scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_archive_partitions(db_manager: DatabaseSessionManager) -> None:
+    device = await register_device("12345", "device1")
+    await create_readings(device.uuid)
+
+    assert await archive_partitions(NOW) == 2
+    assert archived_months() == ["data_points_202501", "data_points_202502"]
+
+    async with sessionmanager.session() as session:
+        assert await partitions.partition_names(session) == [
+            "data_points_202503"
+        ]
+
+    # Text readings of the archived months leave the database too
+    assert await count_text_points() == 1
+
+    # Hot and cold readings are merged transparently
+    datapoints = await get_datapoints_by_device_uuid(
+        device.uuid, sensor="temp"
+    )
+    assert [dp.val_float for dp in datapoints] == [3.0, 2.0, 1.0]
+    assert all(dp.device_uuid == device.uuid for dp in datapoints)
+
+    rows = await get_datapoint_rows_by_device_uuid(
+        device.uuid,
+        start=datetime.datetime(2025, 2, 1, tzinfo=datetime.UTC),
+    )
+    assert [(r[0], r[2] or r[3] or r[4]) for r in rows] == [
+        ("msg", "hello 2"),
+        ("msg", "hello 3"),
+        ("temp", 2.0),
+        ("temp", 3.0),
+    ]
+
+    # Rollups survive the archived partitions
+    aggregates = await get_aggregates(device.uuid, "temp", 3600)
+    assert [a.sum for a in aggregates] == [1.0, 2.0, 3.0]
+
+
+@pytest.mark.asyncio
+async def test_archive_merges_late_readings(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+    await create_readings(device.uuid)
+    await archive_partitions(NOW)
+
+    # A late reading recreates the January partition
+    await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=datetime.datetime(2025, 1, 20, tzinfo=datetime.UTC),
+        sensor="temp",
+        val_float=1.5,
+    )
+    assert await archive_partitions(NOW) == 1
+
+    datapoints = await get_datapoints_by_device_uuid(
+        device.uuid,
+        sensor="temp",
+        end=datetime.datetime(2025, 2, 1, tzinfo=datetime.UTC),
+    )
+    assert [dp.val_float for dp in datapoints] == [1.5, 1.0]
+
+
+@pytest.mark.asyncio
+async def test_archive_repeated_after_interruption(
+    db_manager: DatabaseSessionManager, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    device = await register_device("12345", "device1")
+    await create_readings(device.uuid)
+
+    async def interrupted(*args: object) -> None:
+        raise RuntimeError("interrupted")
+
+    # The file is written but the readings stay in the database
+    with monkeypatch.context() as patch:
+        patch.setattr(partitions, "drop", interrupted)
+        with pytest.raises(RuntimeError):
+            await archive_partitions(NOW)
+    assert archived_months() == ["data_points_202501"]
+    assert await count_text_points() == 3
+
+    # Archiving again replaces the file rather than adding to it
+    assert await archive_partitions(NOW) == 2
+    assert archived_months() == ["data_points_202501", "data_points_202502"]
+    datapoints = await get_datapoints_by_device_uuid(device.uuid)
+    assert len(datapoints) == 6
+
+
+@pytest.mark.asyncio
+async def test_apply_retention_removes_archive_files(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+    await create_readings(device.uuid)
+    await archive_partitions(NOW)
+
+    result = await apply_retention(RetentionPolicy(raw_days=30), now=NOW)
+
+    assert result.partitions_dropped == 1
+    assert archived_months() == ["data_points_202502"]
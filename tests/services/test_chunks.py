@@ -0,0 +1,305 @@
+import datetime
+from typing import AsyncGenerator
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+
+from sense_web.db.models import DataPoint, SeriesChunk, TextPoint
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.dto.series import to_epoch_us
+from sense_web.exceptions import DataPointCompacted
+from sense_web.services.chunks import (
+    compact_chunks,
+    decode_chunk,
+    encode_chunk,
+)
+from sense_web.services.device import register_device
+from sense_web.services.datapoint import (
+    create_datapoint,
+    delete_datapoint,
+    get_datapoints_by_device_uuid,
+    get_datapoints_by_sensor,
+    get_series_by_device_uuid,
+    stream_datapoints_by_device_uuid,
+)
+from sense_web.services.retention import RetentionPolicy, apply_retention
+from sense_web.services.rollup import backfill_rollups, get_aggregates
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+START = datetime.datetime(2025, 1, 1, 10, 0, tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+async def count(model: type) -> int:
+    async with sessionmanager.session() as session:
+        return (
+            await session.execute(select(func.count()).select_from(model))
+        ).scalar_one()
+
+
+def test_chunk_round_trip() -> None:
+    rng = np.random.default_rng(0)
+    timestamps = to_epoch_us(START) + np.cumsum(
+        rng.integers(9_990, 10_010, 3600)
+    )
+    values = np.round(rng.normal(9.81, 0.05, 3600), 3)
+    values[10] = np.nan
+    values[11] = -0.0
+
+    data = encode_chunk(timestamps, values)
+    ts, vals = decode_chunk(data)
+
+    np.testing.assert_array_equal(ts, timestamps)
+    assert vals.tobytes() == values.tobytes()
+    assert len(data) < timestamps.nbytes + values.nbytes
+
+
+def test_chunk_compresses_regular_series() -> None:
+    timestamps = to_epoch_us(START) + np.arange(3600) * 1_000_000
+    values = np.full(3600, 21.5)
+
+    data = encode_chunk(timestamps, values)
+
+    assert len(data) * 100 < timestamps.nbytes + values.nbytes
+
+
+@pytest.mark.asyncio
+async def test_compact_chunks(db_manager: DatabaseSessionManager) -> None:
+    device = await register_device("12345", "device1")
+
+    for i in range(120):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=START + datetime.timedelta(minutes=i),
+            sensor="imu",
+            val_float=float(i),
+            val_units="g",
+        )
+    await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=START,
+        sensor="msg",
+        val_str="hello",
+    )
+
+    compacted = await compact_chunks(
+        ["imu"], before=START + datetime.timedelta(hours=3)
+    )
+
+    assert compacted == 120
+    assert await count(SeriesChunk) == 2
+    assert await count(DataPoint) == 0
+    assert await count(TextPoint) == 1
+
+    series = await get_series_by_device_uuid(
+        device.uuid,
+        start=START + datetime.timedelta(minutes=30),
+        end=START + datetime.timedelta(minutes=90),
+    )
+    assert [s.sensor for s in series] == ["imu"]
+    assert list(series[0].values) == [float(i) for i in range(30, 90)]
+    assert series[0].val_units == "g"
+
+    datapoints = await get_datapoints_by_device_uuid(
+        device.uuid, sensor="imu", start=START + datetime.timedelta(hours=1)
+    )
+    assert [dp.val_float for dp in datapoints] == [
+        float(i) for i in range(119, 59, -1)
+    ]
+
+    # Rollups can still be rebuilt once the raw readings are gone
+    await backfill_rollups()
+    aggregates = await get_aggregates(device.uuid, "imu", 3600)
+    assert [a.count for a in aggregates] == [60, 60]
+    assert [a.sum for a in aggregates] == [
+        sum(range(60)),
+        sum(range(60, 120)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_compact_chunks_merges_late_readings(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    for minute in (0, 20, 40):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=START + datetime.timedelta(minutes=minute),
+            sensor="imu",
+            val_int=minute,
+        )
+    before = START + datetime.timedelta(hours=1)
+    assert await compact_chunks(["imu"], before=before) == 3
+
+    await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=START + datetime.timedelta(minutes=10),
+        sensor="imu",
+        val_int=10,
+    )
+    assert await compact_chunks(["imu"], before=before) == 1
+    assert await count(SeriesChunk) == 1
+
+    datapoints = await get_datapoints_by_device_uuid(device.uuid)
+    assert [dp.val_int for dp in datapoints] == [40, 20, 10, 0]
+    assert all(dp.val_float is None for dp in datapoints)
+
+    # Late readings of another kind or unit are not merged in
+    await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=START + datetime.timedelta(minutes=30),
+        sensor="imu",
+        val_float=0.5,
+        val_units="g",
+    )
+    assert await compact_chunks(["imu"], before=before) == 0
+    datapoints = await get_datapoints_by_device_uuid(device.uuid)
+    assert [(dp.val_int, dp.val_float, dp.val_units) for dp in datapoints] == [
+        (40, None, None),
+        (None, 0.5, "g"),
+        (20, None, None),
+        (10, None, None),
+        (0, None, None),
+    ]
+
+    with pytest.raises(DataPointCompacted):
+        await delete_datapoint(device.uuid, datapoints[0].uuid)
+    assert await delete_datapoint(device.uuid, datapoints[1].uuid)
+
+
+async def test_stream_merges_chunks(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    for minute in range(0, 90, 10):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=START + datetime.timedelta(minutes=minute),
+            sensor="imu",
+            val_int=minute,
+        )
+    before = START + datetime.timedelta(hours=1)
+    assert await compact_chunks(["imu"], before=before) == 6
+
+    # Late readings left uncompacted among the compacted ones
+    for minute in (15, 45):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=START + datetime.timedelta(minutes=minute),
+            sensor="imu",
+            val_int=minute,
+        )
+
+    batches = [
+        batch
+        async for batch in stream_datapoints_by_device_uuid(
+            device.uuid, batch_size=2
+        )
+    ]
+    streamed = [dp for batch in batches for dp in batch]
+    assert [dp.val_int for dp in streamed] == [
+        80,
+        70,
+        60,
+        50,
+        45,
+        40,
+        30,
+        20,
+        15,
+        10,
+        0,
+    ]
+    assert streamed == await get_datapoints_by_device_uuid(device.uuid)
+    assert len(batches) > 1
+
+
+@pytest.mark.asyncio
+async def test_sensor_reads_include_chunks(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = [
+        await register_device("12345", "device1"),
+        await register_device("54321", "device2"),
+    ]
+    for value, device in enumerate(devices):
+        for minute in (0, 70):
+            await create_datapoint(
+                device_uuid=device.uuid,
+                timestamp=START + datetime.timedelta(minutes=minute),
+                sensor="imu",
+                val_int=value,
+            )
+    before = START + datetime.timedelta(hours=1)
+    assert await compact_chunks(["imu"], before=before) == 2
+
+    datapoints = await get_datapoints_by_sensor("imu")
+    assert [(dp.device_uuid, dp.val_int) for dp in datapoints] == sorted(
+        (d.uuid, value) for value, d in enumerate(devices) for _ in range(2)
+    )
+
+
+@pytest.mark.asyncio
+async def test_sensor_pages_include_chunks(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = [
+        await register_device("12345", "device1"),
+        await register_device("54321", "device2"),
+    ]
+    for device in devices:
+        for minute in range(0, 90, 15):
+            await create_datapoint(
+                device_uuid=device.uuid,
+                timestamp=START + datetime.timedelta(minutes=minute),
+                sensor="imu",
+                val_int=minute,
+            )
+    before = START + datetime.timedelta(hours=1)
+    assert await compact_chunks(["imu"], before=before) == 8
+
+    everything = await get_datapoints_by_sensor("imu")
+    assert len(everything) == 12
+
+    pages = []
+    after = None
+    while page := await get_datapoints_by_sensor("imu", after=after, limit=5):
+        pages.append(page)
+        after = (page[-1].device_uuid, page[-1].timestamp, page[-1].uuid)
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert [dp for page in pages for dp in page] == everything
+
+
+@pytest.mark.asyncio
+async def test_apply_retention_deletes_chunks(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    now = START + datetime.timedelta(days=10)
+    for days_ago in (9, 1):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=now - datetime.timedelta(days=days_ago),
+            sensor="imu",
+            val_float=1.0,
+        )
+    await compact_chunks(["imu"], before=now)
+
+    result = await apply_retention(RetentionPolicy(raw_days=5), now=now)
+
+    assert result.chunks_deleted == 1
+    assert await count(SeriesChunk) == 1
@@ -1,13 +1,26 @@
 import datetime
+from pathlib import Path
 from typing import AsyncGenerator
 import pytest
+from sqlalchemy import func, select
 
-from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.db.models import DataPoint, TextPoint
+from sense_web.dto.datapoint import DataPointDTO
+from sense_web.db.session import (
+    SQLITE_READERS,
+    DatabaseSessionManager,
+    sessionmanager,
+)
 from sense_web.services.device import register_device
+from sense_web.services.latest import get_latest_by_device_uuid
+from sense_web.services.rollup import get_aggregates
 from sense_web.services.datapoint import (
+    _datapoints_stmt,
     create_datapoint,
+    create_datapoints_bulk,
     delete_datapoint,
     get_datapoints_by_device_uuid,
+    get_datapoints_by_sensor,
 )
 
 DB_URI = "sqlite+aiosqlite:///:memory:"
@@ -58,7 +71,38 @@ async def test_delete_datapoint(db_manager: DatabaseSessionManager) -> None:
 
     assert dp is not None
 
-    assert await delete_datapoint(dp.uuid) is True
+    assert await delete_datapoint(device.uuid, dp.uuid) is True
+
+
+@pytest.mark.asyncio
+async def test_delete_datapoint_updates_latest_and_rollups(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+    other = await register_device("67890", "device2")
+
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    first = await create_datapoint(device.uuid, start, "temp", val_float=1.0)
+    second = await create_datapoint(
+        device.uuid,
+        start + datetime.timedelta(seconds=30),
+        "temp",
+        val_float=5.0,
+    )
+
+    # Readings are only deleted through the device they belong to
+    assert await delete_datapoint(other.uuid, second.uuid) is False
+
+    assert await delete_datapoint(device.uuid, second.uuid) is True
+    latest = await get_latest_by_device_uuid(device.uuid)
+    assert [(v.timestamp, v.val_float) for v in latest] == [(start, 1.0)]
+    for resolution in (60, 3600):
+        aggregates = await get_aggregates(device.uuid, "temp", resolution)
+        assert [(a.count, a.min, a.max) for a in aggregates] == [(1, 1.0, 1.0)]
+
+    assert await delete_datapoint(device.uuid, first.uuid) is True
+    assert await get_latest_by_device_uuid(device.uuid) == []
+    assert await get_aggregates(device.uuid, "temp", 60) == []
 
 
 @pytest.mark.asyncio
@@ -67,7 +111,7 @@ async def test_delete_datapoint_not_exists(
 ) -> None:
     device = await register_device("12345", "device1")
 
-    assert await delete_datapoint(device.uuid) is False
+    assert await delete_datapoint(device.uuid, device.uuid) is False
 
 
 @pytest.mark.asyncio
@@ -108,3 +152,253 @@ async def test_get_datapoints_by_device_uuid_none_exist(
 
     assert points is not None
     assert len(points) == 0
+
+
+@pytest.mark.asyncio
+async def test_create_datapoints_bulk(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    readings = [
+        (
+            start + datetime.timedelta(seconds=i),
+            "temp",
+            None,
+            20.0 + i,
+            None,
+            "C",
+        )
+        for i in range(100)
+    ]
+    readings.append((start, "status", None, None, "OK", None))
+
+    count = await create_datapoints_bulk(device.uuid, readings)
+    assert count == 101
+
+    points = await get_datapoints_by_device_uuid(device.uuid, sensor="temp")
+    assert len(points) == 100
+    assert points[0].val_float == 119.0
+
+    latest = await get_latest_by_device_uuid(device.uuid)
+    assert [(v.sensor, v.val_float, v.val_str) for v in latest] == [
+        ("status", None, "OK"),
+        ("temp", 119.0, None),
+    ]
+
+    aggregates = await get_aggregates(device.uuid, "temp", 3600)
+    assert [a.count for a in aggregates] == [100]
+
+
+@pytest.mark.asyncio
+async def test_create_datapoints_bulk_return_ids(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    timestamp = datetime.datetime.now(datetime.UTC)
+    ids = await create_datapoints_bulk(
+        device.uuid,
+        [
+            (timestamp, "temp", 1, None, None, None),
+            (timestamp, "temp", 2, None, None, None),
+        ],
+        return_ids=True,
+    )
+
+    assert len(ids) == 2
+    points = await get_datapoints_by_device_uuid(device.uuid)
+    assert {p.uuid for p in points} == set(ids)
+
+    assert await create_datapoints_bulk(device.uuid, []) == 0
+
+
+@pytest.mark.asyncio
+async def test_text_datapoints_stored_apart(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=start,
+        sensor="temp",
+        val_float=21.5,
+        val_units="C",
+    )
+    text = await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=start + datetime.timedelta(seconds=1),
+        sensor="rs232",
+        val_str="OK",
+    )
+    await create_datapoints_bulk(
+        device.uuid,
+        [
+            (
+                start + datetime.timedelta(seconds=2),
+                "rs232",
+                7,
+                None,
+                "7",
+                None,
+            ),
+            (
+                start + datetime.timedelta(seconds=2),
+                "temp",
+                22,
+                None,
+                None,
+                "C",
+            ),
+        ],
+    )
+
+    async with sessionmanager.session() as session:
+        numeric = await session.execute(select(func.count(DataPoint.id)))
+        strings = await session.execute(select(func.count(TextPoint.id)))
+        assert (numeric.scalar_one(), strings.scalar_one()) == (2, 2)
+
+    points = await get_datapoints_by_device_uuid(device.uuid)
+    assert sorted(
+        (p.timestamp, p.sensor, p.val_int, p.val_float, p.val_str)
+        for p in points
+    ) == [
+        (start, "temp", None, 21.5, None),
+        (start + datetime.timedelta(seconds=1), "rs232", None, None, "OK"),
+        (start + datetime.timedelta(seconds=2), "rs232", 7, None, "7"),
+        (start + datetime.timedelta(seconds=2), "temp", 22, None, None),
+    ]
+
+    assert await delete_datapoint(device.uuid, text.uuid) is True
+    points = await get_datapoints_by_device_uuid(device.uuid, sensor="rs232")
+    assert [p.val_str for p in points] == ["7"]
+
+
+@pytest.mark.asyncio
+async def test_read_statements_reused_across_devices(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    timestamp = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    devices = [
+        await register_device(imei, name)
+        for imei, name in (("12345", "device1"), ("67890", "device2"))
+    ]
+    for i, device in enumerate(devices):
+        await create_datapoint(device.uuid, timestamp, "temp", val_int=i)
+
+    _datapoints_stmt.cache_clear()
+    for i, device in enumerate(devices):
+        points = await get_datapoints_by_device_uuid(
+            device.uuid, sensor="temp", start=timestamp
+        )
+        assert [p.val_int for p in points] == [i]
+
+    info = _datapoints_stmt.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_get_datapoints_by_sensor(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = [
+        await register_device(f"{i:015d}", f"device{i}") for i in range(3)
+    ]
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    for i, device in enumerate(devices):
+        await create_datapoints_bulk(
+            device.uuid,
+            [
+                (
+                    start + datetime.timedelta(minutes=m),
+                    "temp",
+                    None,
+                    float(10 * i + m),
+                    None,
+                    "C",
+                )
+                for m in range(3)
+            ]
+            + [(start, "status", None, None, "OK", None)],
+        )
+
+    datapoints = await get_datapoints_by_sensor(
+        "temp", start=start + datetime.timedelta(minutes=1)
+    )
+    ordered = sorted(devices, key=lambda d: d.uuid)
+    assert [(dp.device_uuid, dp.val_float) for dp in datapoints] == [
+        (d.uuid, float(10 * devices.index(d) + m))
+        for d in ordered
+        for m in (1, 2)
+    ]
+
+    chosen = [devices[0].uuid, devices[2].uuid]
+    datapoints = await get_datapoints_by_sensor("temp", devices=chosen)
+    assert {dp.device_uuid for dp in datapoints} == set(chosen)
+    assert len(datapoints) == 6
+
+    assert await get_datapoints_by_sensor("temp", devices=[]) == []
+    status = await get_datapoints_by_sensor("status")
+    assert [dp.val_str for dp in status] == ["OK"] * 3
+
+
+@pytest.mark.asyncio
+async def test_get_datapoints_by_sensor_pages(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = [
+        await register_device(f"{i:015d}", f"device{i}") for i in range(3)
+    ]
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    for device in devices:
+        # Two readings share a timestamp, so the cursor needs the UUID
+        await create_datapoints_bulk(
+            device.uuid,
+            [
+                (
+                    start + datetime.timedelta(minutes=m),
+                    "temp",
+                    m,
+                    None,
+                    None,
+                    None,
+                )
+                for m in (0, 1, 1, 2)
+            ],
+        )
+
+    everything = await get_datapoints_by_sensor("temp")
+    pages: list[list[DataPointDTO]] = []
+    after = None
+    while True:
+        page = await get_datapoints_by_sensor("temp", after=after, limit=5)
+        if not page:
+            break
+        pages.append(page)
+        after = (page[-1].device_uuid, page[-1].timestamp, page[-1].uuid)
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert [dp.uuid for page in pages for dp in page] == [
+        dp.uuid for dp in everything
+    ]
+
+
+@pytest.mark.asyncio
+async def test_reads_return_reader_connections(tmp_path: Path) -> None:
+    await sessionmanager.init(f"sqlite+aiosqlite:///{tmp_path / 'file.db'}")
+    try:
+        device = await register_device("12345", "device1")
+        timestamp = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+        await create_datapoint(device.uuid, timestamp, "temp", val_float=1.0)
+
+        for _ in range(SQLITE_READERS + 1):
+            points = await get_datapoints_by_device_uuid(device.uuid)
+            assert [p.val_float for p in points] == [1.0]
+
+        for reader in sessionmanager._readers:
+            assert reader.pool.checkedout() == 0
+    finally:
+        await sessionmanager.close()
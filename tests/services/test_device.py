@@ -1,15 +1,27 @@
+import datetime
 import pytest
 import uuid
 from typing import AsyncGenerator
+from sqlalchemy import event
 
 from sense_web.exceptions import DeviceAlreadyExists
 from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.datapoint import (
+    create_datapoint,
+    get_datapoints_by_device_uuid,
+)
 from sense_web.services.device import (
+    delete_device,
     register_device,
     get_device_by_imei,
     get_device_by_uuid,
+    get_devices_version,
+    is_valid_imei,
     list_devices,
+    register_devices,
+    rename_device,
 )
+from sense_web.services.latest import get_latest_by_device_uuid
 
 DB_URI = "sqlite+aiosqlite:///:memory:"
 
@@ -71,6 +83,41 @@ async def test_list_devices(db_manager: DatabaseSessionManager) -> None:
         assert imei in fetched_imeis
 
 
+@pytest.mark.asyncio
+async def test_list_devices_paged(db_manager: DatabaseSessionManager) -> None:
+    names = ["alpha", "Alps", "al_x", "alx", "beta"]
+    for i, name in enumerate(names):
+        await register_device(f"{i:015d}", name)
+
+    first = await list_devices(limit=3)
+    rest = await list_devices(limit=3, after=first[-1].uuid)
+    assert len(first) == 3
+    assert first + rest == sorted(await list_devices(), key=lambda d: d.uuid)
+
+    async def named(**filters: str) -> set[str]:
+        return {d.name for d in await list_devices(**filters)}
+
+    assert await named(name_prefix="al") == {"alpha", "al_x", "alx"}
+    assert await named(name_prefix="al_") == {"al_x"}
+    assert await named(imei_prefix="00000000000000") == set(names)
+    assert await named(imei_prefix="000000000000004") == {"beta"}
+
+
+@pytest.mark.asyncio
+async def test_devices_version(db_manager: DatabaseSessionManager) -> None:
+    assert (await get_devices_version())[0] == 0
+
+    device = await register_device("12345", "device1")
+    await rename_device(device.uuid, "device2")
+    await rename_device(uuid.uuid4(), "device3")
+    version, modified = await get_devices_version()
+    assert version == 2
+
+    await delete_device(device.uuid)
+    await delete_device(device.uuid)
+    assert await get_devices_version() > (version, modified)
+
+
 @pytest.mark.asyncio
 async def test_get_device_by_imei_not_found(
     db_manager: DatabaseSessionManager,
@@ -86,3 +133,89 @@ async def test_get_device_by_uuid_not_found(
     random_uuid = uuid.uuid4()
     device = await get_device_by_uuid(random_uuid)
     assert device is None
+
+
+@pytest.mark.asyncio
+async def test_device_services_share_session(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("123456789012345", "device1")
+
+    engine = sessionmanager._engine
+    assert engine is not None
+    checkouts = []
+    event.listen(
+        engine.sync_engine, "checkout", lambda *args: checkouts.append(args)
+    )
+
+    async with sessionmanager.session(readonly=True) as session:
+        assert await get_device_by_uuid(device.uuid, session) == device
+        assert await get_device_by_imei(device.imei, session) == device
+        assert await list_devices(session) == [device]
+
+    assert len(checkouts) == 1
+
+
+@pytest.mark.asyncio
+async def test_rename_device(db_manager: DatabaseSessionManager) -> None:
+    device = await register_device("123456789012345", "device1")
+
+    renamed = await rename_device(device.uuid, "device2")
+
+    assert renamed is not None and renamed.name == "device2"
+    assert await get_device_by_uuid(device.uuid) == renamed
+    assert await rename_device(uuid.uuid4(), "device3") is None
+
+
+@pytest.mark.asyncio
+async def test_delete_device_removes_readings(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("123456789012345", "device1")
+    other = await register_device("543210987654321", "device2")
+    timestamp = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    for d in (device, other):
+        await create_datapoint(d.uuid, timestamp, "temp", val_int=1)
+        await create_datapoint(d.uuid, timestamp, "status", val_str="OK")
+
+    assert await delete_device(device.uuid)
+    assert not await delete_device(device.uuid)
+
+    assert await get_device_by_uuid(device.uuid) is None
+    assert await get_datapoints_by_device_uuid(device.uuid) == []
+    assert await get_latest_by_device_uuid(device.uuid) == []
+    assert len(await get_datapoints_by_device_uuid(other.uuid)) == 2
+
+
+def test_is_valid_imei() -> None:
+    assert is_valid_imei("490154203237518")
+    assert not is_valid_imei("490154203237517")
+    assert not is_valid_imei("49015420323751")
+    assert not is_valid_imei("49015420323751a")
+
+
+@pytest.mark.asyncio
+async def test_register_devices(db_manager: DatabaseSessionManager) -> None:
+    existing = await register_device("490154203237518", "existing")
+
+    registered = await register_devices(
+        [
+            ("356938035643809", "device1"),
+            ("490154203237518", "device2"),
+            ("356938035643809", "device3"),
+            ("012345678901237", "device4"),
+        ]
+    )
+
+    assert [d.name if d else None for d in registered] == [
+        "device1",
+        None,
+        None,
+        "device4",
+    ]
+    assert await get_device_by_imei("490154203237518") == existing
+    for device in registered:
+        if device is not None:
+            assert await get_device_by_uuid(device.uuid) == device
+    assert len(await list_devices()) == 3
+    assert await register_devices([]) == []
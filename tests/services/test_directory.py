@@ -0,0 +1,87 @@
+import uuid
+from typing import AsyncGenerator
+import pytest
+from sqlalchemy import delete
+
+from sense_web.db.models import Device
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.device import register_device
+from sense_web.services.directory import directory
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    directory.init(max_size=2, ttl=60)
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+async def forget_devices() -> None:
+    async with sessionmanager.session() as session:
+        await session.execute(delete(Device))
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_devices_served_from_cache(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+    assert await directory.get(device.uuid) == device
+
+    # The database is no longer consulted once a device is cached
+    await forget_devices()
+    assert await directory.get(device.uuid) == device
+
+    await directory.invalidate(str(device.uuid))
+    assert await directory.get(device.uuid) is None
+
+
+@pytest.mark.asyncio
+async def test_missing_devices_not_cached(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device_uuid = uuid.uuid4()
+    assert await directory.get(device_uuid) is None
+
+    async with sessionmanager.session() as session:
+        session.add(Device(imei="12345", uuid=device_uuid, name="device1"))
+        await session.commit()
+
+    found = await directory.get(device_uuid)
+    assert found is not None and found.name == "device1"
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_evicted(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = [
+        await register_device(f"{i:015d}", f"device{i}") for i in range(3)
+    ]
+    await directory.get(devices[0].uuid)
+    await directory.get(devices[1].uuid)
+    await directory.get(devices[0].uuid)
+    await directory.get(devices[2].uuid)
+
+    await forget_devices()
+    assert await directory.get(devices[0].uuid) == devices[0]
+    assert await directory.get(devices[2].uuid) == devices[2]
+    assert await directory.get(devices[1].uuid) is None
+
+
+@pytest.mark.asyncio
+async def test_expired_devices_reloaded(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    directory.init(max_size=2, ttl=0)
+    device = await register_device("12345", "device1")
+    assert await directory.get(device.uuid) == device
+
+    await forget_devices()
+    assert await directory.get(device.uuid) is None
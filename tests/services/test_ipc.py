@@ -166,6 +166,31 @@ async def test_publish_subscribe_unsubscribe(ipc_backend: redis.Redis) -> None:
     await ipc_instance.close()
 
 
+async def test_publish_many(ipc_backend: redis.Redis) -> None:
+    ipc_instance = IPC()
+    await ipc_instance.init(_backend=ipc_backend)
+
+    received: asyncio.Queue[str] = asyncio.Queue()
+
+    async def callback(message: str) -> None:
+        await received.put(message)
+
+    channel = "test-channel"
+    await ipc_instance.subscribe(channel, callback)
+    await asyncio.sleep(0.1)
+
+    await ipc_instance.publish_many(channel, ["one", "two", "three"])
+
+    results = [
+        await asyncio.wait_for(received.get(), timeout=2.0) for _ in range(3)
+    ]
+    assert results == ["one", "two", "three"]
+
+    await ipc_instance.unsubscribe(channel)
+
+    await ipc_instance.close()
+
+
 async def test_unsubscribe_not_subscribed_passes(
     ipc_backend: redis.Redis,
 ) -> None:
@@ -196,3 +221,35 @@ async def test_subscribe_uninitialised_raises(
 
     with pytest.raises(RuntimeError, match="IPC not initialised"):
         await ipc_instance.publish("test", "msg")
+
+
+async def test_messages_dispatched_by_channel(
+    ipc_backend: redis.Redis,
+) -> None:
+    ipc_instance = IPC()
+    await ipc_instance.init(_backend=ipc_backend)
+
+    received: asyncio.Queue[tuple[str, str]] = asyncio.Queue()
+
+    async def on_first(message: str) -> None:
+        await received.put(("first", message))
+
+    async def on_second(message: str) -> None:
+        await received.put(("second", message))
+
+    await ipc_instance.subscribe("first", on_first)
+    await ipc_instance.subscribe("second", on_second)
+    await asyncio.sleep(0.1)
+
+    await ipc_instance.publish("second", "b")
+    await ipc_instance.publish("first", "a")
+
+    results = [
+        await asyncio.wait_for(received.get(), timeout=2.0) for _ in range(2)
+    ]
+    assert sorted(results) == [("first", "a"), ("second", "b")]
+    assert received.empty()
+
+    await ipc_instance.unsubscribe("first")
+    await ipc_instance.unsubscribe("second")
+    await ipc_instance.close()
@@ -0,0 +1,73 @@
+import datetime
+from typing import AsyncGenerator
+import pytest
+
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.device import register_device
+from sense_web.services.datapoint import create_datapoint
+from sense_web.services.latest import get_latest_by_device_uuid, list_latest
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+T0 = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+@pytest.mark.asyncio
+async def test_latest_updated_on_ingest(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    for minute in (1, 3, 2):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=T0 + datetime.timedelta(minutes=minute),
+            sensor="temp",
+            val_float=float(minute),
+            val_units="C",
+        )
+    await create_datapoint(
+        device_uuid=device.uuid, timestamp=T0, sensor="status", val_str="OK"
+    )
+
+    latest = await get_latest_by_device_uuid(device.uuid)
+
+    assert [v.sensor for v in latest] == ["status", "temp"]
+    status, temp = latest
+    assert status.val_str == "OK"
+    # The out-of-order reading at minute 2 must not replace minute 3
+    assert temp.val_float == 3.0
+    assert temp.val_units == "C"
+    assert temp.timestamp == T0 + datetime.timedelta(minutes=3)
+
+
+@pytest.mark.asyncio
+async def test_list_latest(db_manager: DatabaseSessionManager) -> None:
+    device1 = await register_device("12345", "device1")
+    device2 = await register_device("67890", "device2")
+
+    for device in (device1, device2):
+        await create_datapoint(
+            device_uuid=device.uuid, timestamp=T0, sensor="temp", val_int=1
+        )
+
+    latest = await list_latest()
+
+    assert len(latest) == 2
+    assert {v.device_uuid for v in latest} == {device1.uuid, device2.uuid}
+
+
+@pytest.mark.asyncio
+async def test_latest_none_exist(db_manager: DatabaseSessionManager) -> None:
+    device = await register_device("12345", "device1")
+
+    assert await get_latest_by_device_uuid(device.uuid) == []
@@ -0,0 +1,237 @@
+import datetime
+import uuid
+
+from sense_web.dto.datapoint import DataPointDTO
+from sense_web.dto.series import to_epoch_us
+from sense_web.services.recent import RecentWindow, RingBuffer
+
+DEVICE = uuid.uuid4()
+
+
+def now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC)
+
+
+def make_dp(
+    timestamp: datetime.datetime,
+    sensor: str = "temp",
+    val_int: int | None = None,
+    val_float: float | None = None,
+    val_str: str | None = None,
+    val_units: str | None = "C",
+) -> DataPointDTO:
+    return DataPointDTO(
+        uuid=uuid.uuid4(),
+        device_uuid=DEVICE,
+        timestamp=timestamp,
+        sensor=sensor,
+        val_int=val_int,
+        val_float=val_float,
+        val_str=val_str,
+        val_units=val_units,
+    )
+
+
+def make_window(capacity: int = 8) -> RecentWindow:
+    window = RecentWindow()
+    window.init(window_seconds=300, capacity=capacity)
+    window.start()
+    return window
+
+
+def test_ring_buffer_wraps_and_tracks_evictions() -> None:
+    buffer = RingBuffer(capacity=3)
+    t0 = now()
+
+    for i in range(5):
+        buffer.append(
+            make_dp(t0 + datetime.timedelta(seconds=i), val_float=float(i))
+        )
+
+    assert buffer.size == 3
+    indices = buffer.indices(0, None)
+    assert [buffer.values[i] for i in indices] == [2.0, 3.0, 4.0]
+    assert buffer.evicted_until == int(
+        (t0 + datetime.timedelta(seconds=1)).timestamp() * 1_000_000
+    )
+
+
+def test_ring_buffer_rejects_strings() -> None:
+    buffer = RingBuffer(capacity=3)
+    timestamp = now()
+    buffer.append(make_dp(timestamp, val_str="OK"))
+
+    assert buffer.size == 0
+    assert buffer.evicted_until == to_epoch_us(timestamp)
+
+
+def test_ring_buffer_units_change_evicts() -> None:
+    buffer = RingBuffer(capacity=3)
+    t0 = now()
+    buffer.append(make_dp(t0, val_float=1.0, val_units="C"))
+    buffer.append(make_dp(t0 + datetime.timedelta(seconds=1), val_float=2.0))
+    buffer.append(
+        make_dp(
+            t0 + datetime.timedelta(seconds=2), val_float=3.0, val_units="F"
+        )
+    )
+
+    assert [buffer.values[i] for i in buffer.indices(0, None)] == [3.0]
+    assert buffer.val_units == "F"
+    assert buffer.evicted_until == to_epoch_us(
+        t0 + datetime.timedelta(seconds=1)
+    )
+
+
+def test_recent_window_not_started_covers_nothing() -> None:
+    window = RecentWindow()
+    window.init(window_seconds=300, capacity=8)
+
+    assert not window.covers(DEVICE, "temp", now())
+
+
+def test_recent_window_covers() -> None:
+    window = make_window(capacity=2)
+    start = now()
+
+    assert window.covers(DEVICE, "temp", start)
+    assert not window.covers(
+        DEVICE, "temp", start - datetime.timedelta(minutes=10)
+    )
+
+    for i in range(3):
+        window.add(
+            make_dp(start + datetime.timedelta(seconds=i), val_float=1.0)
+        )
+
+    # The first reading was evicted, so ranges including it are not
+    # covered any more
+    assert not window.covers(DEVICE, "temp", start)
+    assert window.covers(
+        DEVICE, "temp", start + datetime.timedelta(milliseconds=1)
+    )
+
+    window.add(make_dp(start, sensor="rs232", val_str="OK"))
+    assert not window.covers(DEVICE, "rs232", start)
+
+
+def test_recent_window_covers_again_after_invalid_reading() -> None:
+    window = make_window()
+    start = now()
+    later = start + datetime.timedelta(milliseconds=1)
+
+    window.add(make_dp(start, val_str="fault"))
+    window.add(make_dp(later, val_float=1.0))
+
+    # Ranges including the text reading go to the database, while those
+    # after it are answered from the buffer again
+    assert not window.covers(DEVICE, "temp", start)
+    assert window.covers(DEVICE, "temp", later)
+    assert [
+        dp.val_float for dp in window.datapoints(DEVICE, "temp", later)
+    ] == [1.0]
+
+    window.add(
+        make_dp(
+            later + datetime.timedelta(milliseconds=1),
+            val_float=2.0,
+            val_units="F",
+        )
+    )
+    assert not window.covers(DEVICE, "temp", later)
+    assert window.covers(
+        DEVICE, "temp", later + datetime.timedelta(milliseconds=1)
+    )
+
+
+def test_recent_window_datapoints() -> None:
+    window = make_window()
+    start = now()
+
+    window.add(make_dp(start, val_int=1))
+    window.add(make_dp(start + datetime.timedelta(seconds=2), val_float=2.5))
+    window.add(make_dp(start + datetime.timedelta(seconds=1), val_int=3))
+
+    datapoints = window.datapoints(DEVICE, "temp", start)
+    assert [dp.val_int for dp in datapoints] == [None, 3, 1]
+    assert datapoints[0].val_float == 2.5
+    assert datapoints[0].val_units == "C"
+    assert datapoints[2].timestamp == start
+
+    ascending = window.datapoints(
+        DEVICE,
+        "temp",
+        start,
+        end=start + datetime.timedelta(seconds=2),
+        sort_descending=False,
+    )
+    assert [dp.val_int for dp in ascending] == [1, 3]
+
+    series = window.series(DEVICE, "temp", start)
+    assert len(series) == 1
+    assert list(series[0].values) == [1.0, 3.0, 2.5]
+
+
+def test_ring_buffer_remove() -> None:
+    buffer = RingBuffer(capacity=3)
+    t0 = now()
+    dps = [
+        make_dp(t0 + datetime.timedelta(seconds=i), val_float=float(i))
+        for i in range(4)
+    ]
+    for dp in dps:
+        buffer.append(dp)
+
+    assert buffer.remove(dps[2].uuid)
+    assert not buffer.remove(dps[0].uuid)
+    assert [buffer.values[i] for i in buffer.indices(0, None)] == [1.0, 3.0]
+
+    buffer.append(make_dp(t0, val_float=4.0))
+    assert buffer.size == 3
+
+
+def test_recent_window_remove() -> None:
+    window = make_window()
+    start = now()
+    kept = make_dp(start, val_int=1)
+    deleted = make_dp(start, val_int=2)
+    window.add(kept)
+    window.add(deleted)
+
+    window.remove(DEVICE, deleted.uuid)
+    assert [dp.uuid for dp in window.datapoints(DEVICE, "temp", start)] == [
+        kept.uuid
+    ]
+
+
+def test_recent_window_skewed_clock_not_covered() -> None:
+    window = make_window()
+    start = now()
+
+    skewed = start + datetime.timedelta(minutes=5)
+    window.add(make_dp(skewed, val_int=1))
+    assert not window.covers(DEVICE, "temp", start)
+
+    # Covered again once ranges start after the skewed reading
+    window.add(make_dp(start, val_int=2))
+    assert window.covers(
+        DEVICE, "temp", skewed + datetime.timedelta(milliseconds=1)
+    )
+
+    window.add(make_dp(start, sensor="humidity", val_int=1))
+    assert window.covers(DEVICE, "humidity", start)
+
+
+def test_recent_window_sequence_gap_restarts() -> None:
+    window = make_window()
+    start = now()
+
+    window.add(make_dp(start, val_int=1), publisher="coap", seq=1)
+    window.add(make_dp(start, val_int=2), publisher="coap", seq=2)
+    assert window.covers(DEVICE, "temp", start)
+
+    window.add(
+        make_dp(start, sensor="humidity", val_int=3), publisher="coap", seq=4
+    )
+    assert not window.covers(DEVICE, "temp", start)
+    assert window.datapoints(DEVICE, "temp", start) == []
@@ -0,0 +1,130 @@
+import datetime
+from typing import AsyncGenerator
+import pytest
+from sqlalchemy import delete, func, select
+
+from sense_web.db.lookups import sensor_is
+from sense_web.db.models import DataPointRollup
+from sense_web.db.partitions import DATA_POINTS
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.device import register_device
+from sense_web.services.datapoint import create_datapoint
+from sense_web.services.retention import RetentionPolicy, apply_retention
+from sense_web.services.rollup import get_aggregates
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+NOW = datetime.datetime(2025, 3, 1, 12, 30, tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+async def count_datapoints(sensor: str) -> int:
+    async with sessionmanager.session() as session:
+        stmt = select(func.count()).where(sensor_is(DATA_POINTS, sensor))
+        return (await session.execute(stmt)).scalar_one()
+
+
+def test_retention_policy_from_env() -> None:
+    policy = RetentionPolicy.from_env(
+        {
+            "RETENTION_RAW_DAYS": "30",
+            "RETENTION_SENSOR_RAW_DAYS": "imu=7, gps=none",
+        }
+    )
+
+    assert policy.enabled
+    assert policy.raw_days == 30
+    assert policy.rollup_days is None
+    assert policy.sensor_raw_days == {"imu": 7, "gps": None}
+
+    assert not RetentionPolicy.from_env({}).enabled
+
+
+@pytest.mark.asyncio
+async def test_apply_retention_per_sensor(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    for days_ago in range(10):
+        for sensor in ("temp", "imu", "gps"):
+            await create_datapoint(
+                device_uuid=device.uuid,
+                timestamp=NOW - datetime.timedelta(days=days_ago),
+                sensor=sensor,
+                val_float=float(days_ago),
+            )
+
+    policy = RetentionPolicy(
+        raw_days=5, sensor_raw_days={"imu": 2, "gps": None}
+    )
+    result = await apply_retention(policy, now=NOW, chunk_size=2)
+
+    # Cutoffs are aligned down to the hour, so the reading from exactly
+    # N days ago is kept.
+    assert await count_datapoints("temp") == 6
+    assert await count_datapoints("imu") == 3
+    assert await count_datapoints("gps") == 10
+    assert result.raw_deleted == 4 + 7
+    assert result.rollups_deleted == 0
+
+    # Rollups still cover the expired range
+    hourly = await get_aggregates(device.uuid, "imu", 3600)
+    assert len(hourly) == 10
+
+
+@pytest.mark.asyncio
+async def test_apply_retention_backfills_before_delete(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=NOW - datetime.timedelta(days=3),
+        sensor="temp",
+        val_float=1.0,
+    )
+
+    async with sessionmanager.session() as session:
+        await session.execute(delete(DataPointRollup))
+        await session.commit()
+
+    await apply_retention(RetentionPolicy(raw_days=1), now=NOW)
+
+    assert await count_datapoints("temp") == 0
+    hourly = await get_aggregates(device.uuid, "temp", 3600)
+    assert len(hourly) == 1
+    assert hourly[0].count == 1
+
+
+@pytest.mark.asyncio
+async def test_apply_retention_rollups(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    for days_ago in (1, 40):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=NOW - datetime.timedelta(days=days_ago),
+            sensor="temp",
+            val_float=1.0,
+        )
+
+    result = await apply_retention(
+        RetentionPolicy(rollup_days=30), now=NOW, chunk_size=1
+    )
+
+    # One minute and one hour bucket for the old reading
+    assert result.rollups_deleted == 2
+    assert result.raw_deleted == 0
+    assert len(await get_aggregates(device.uuid, "temp", 3600)) == 1
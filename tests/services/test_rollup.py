@@ -0,0 +1,233 @@
+import datetime
+from typing import AsyncGenerator
+import pytest
+from sqlalchemy import delete, select, update
+
+from sense_web.db.models import DataPoint, DataPointRollup
+from sense_web.db.session import DatabaseSessionManager, sessionmanager
+from sense_web.services.device import register_device
+from sense_web.services.datapoint import create_datapoint
+from sense_web.services.rollup import (
+    backfill_rollups,
+    get_aggregates,
+    get_fleet_aggregates,
+    rollup_resolution_for,
+)
+
+DB_URI = "sqlite+aiosqlite:///:memory:"
+
+T0 = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+async def db_manager() -> AsyncGenerator[DatabaseSessionManager, None]:
+    await sessionmanager.init(DB_URI)
+    async with sessionmanager.connect() as conn:
+        await sessionmanager.create_all(conn)
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+def test_rollup_resolution_for() -> None:
+    assert rollup_resolution_for(60) == 60
+    assert rollup_resolution_for(300) == 60
+    assert rollup_resolution_for(3600) == 3600
+    assert rollup_resolution_for(86400) == 3600
+
+    with pytest.raises(ValueError):
+        rollup_resolution_for(90)
+
+
+@pytest.mark.asyncio
+async def test_rollups_updated_on_ingest(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    for i, value in enumerate([1.0, 5.0, 3.0]):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=T0 + datetime.timedelta(seconds=i * 20),
+            sensor="temp",
+            val_float=value,
+        )
+    await create_datapoint(
+        device_uuid=device.uuid,
+        timestamp=T0,
+        sensor="status",
+        val_str="OK",
+    )
+
+    async with sessionmanager.session() as session:
+        rollups = (
+            (await session.execute(select(DataPointRollup))).scalars().all()
+        )
+
+    assert {r.resolution for r in rollups} == {60, 3600}
+    assert all(r.sensor == "temp" for r in rollups)
+
+    minute = next(r for r in rollups if r.resolution == 60)
+    assert minute.bucket_start == int(T0.timestamp())
+    assert (minute.count, minute.sum, minute.min, minute.max) == (
+        3,
+        9.0,
+        1.0,
+        5.0,
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_aggregates(db_manager: DatabaseSessionManager) -> None:
+    device = await register_device("12345", "device1")
+
+    for minute in range(120):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=T0 + datetime.timedelta(minutes=minute),
+            sensor="temp",
+            val_int=minute,
+        )
+
+    hourly = await get_aggregates(device.uuid, "temp", 3600)
+    assert [a.bucket_start for a in hourly] == [
+        T0,
+        T0 + datetime.timedelta(hours=1),
+    ]
+    assert hourly[0].count == 60
+    assert hourly[0].min == 0
+    assert hourly[0].max == 59
+    assert hourly[0].mean == pytest.approx(29.5)
+
+    ten_minutes = await get_aggregates(
+        device.uuid,
+        "temp",
+        600,
+        start=T0 + datetime.timedelta(minutes=15),
+        end=T0 + datetime.timedelta(minutes=30),
+    )
+    assert [a.count for a in ten_minutes] == [10, 10]
+    assert ten_minutes[0].bucket_start == T0 + datetime.timedelta(minutes=10)
+
+
+@pytest.mark.asyncio
+async def test_get_fleet_aggregates(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    devices = [
+        await register_device("12345", "device1"),
+        await register_device("54321", "device2"),
+    ]
+    for offset, device in enumerate(devices):
+        for minute in (0, 30, 60):
+            await create_datapoint(
+                device_uuid=device.uuid,
+                timestamp=T0 + datetime.timedelta(minutes=minute),
+                sensor="temp",
+                val_float=float(minute + offset),
+            )
+
+    fleet = await get_fleet_aggregates("temp", 3600)
+    assert [(a.device_uuid, a.count, a.min, a.max) for a in fleet] == [
+        (None, 4, 0.0, 31.0),
+        (None, 2, 60.0, 61.0),
+    ]
+
+    grouped = await get_fleet_aggregates(
+        "temp",
+        3600,
+        start=T0,
+        end=T0 + datetime.timedelta(hours=1),
+        by_device=True,
+    )
+    assert sorted((a.device_uuid, a.sum) for a in grouped) == sorted(
+        [(devices[0].uuid, 30.0), (devices[1].uuid, 32.0)]
+    )
+
+    chosen = await get_fleet_aggregates(
+        "temp", 7200, devices=[devices[1].uuid]
+    )
+    assert [(a.count, a.mean) for a in chosen] == [(3, 31.0)]
+    assert await get_fleet_aggregates("temp", 3600, devices=[]) == []
+
+
+@pytest.mark.asyncio
+async def test_backfill_rollups(db_manager: DatabaseSessionManager) -> None:
+    device = await register_device("12345", "device1")
+
+    for minute in range(90):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=T0 + datetime.timedelta(minutes=minute),
+            sensor="temp",
+            val_float=1.0,
+        )
+
+    expected = await get_aggregates(device.uuid, "temp", 60)
+
+    async with sessionmanager.session() as session:
+        await session.execute(delete(DataPointRollup))
+        await session.commit()
+
+    assert await get_aggregates(device.uuid, "temp", 60) == []
+
+    written = await backfill_rollups()
+    assert written == 90 + 2
+    assert await get_aggregates(device.uuid, "temp", 60) == expected
+
+    # Rebuilding replaces buckets rather than adding to them
+    await backfill_rollups(
+        start=T0, end=T0 + datetime.timedelta(hours=2), replace=True
+    )
+    assert await get_aggregates(device.uuid, "temp", 60) == expected
+
+
+@pytest.mark.asyncio
+async def test_backfill_rollups_only_missing(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+
+    await create_datapoint(
+        device_uuid=device.uuid, timestamp=T0, sensor="temp", val_float=1.0
+    )
+
+    assert await backfill_rollups() == 2
+
+    hourly = await get_aggregates(device.uuid, "temp", 3600)
+    assert len(hourly) == 1
+    assert hourly[0].count == 1
+
+
+@pytest.mark.asyncio
+async def test_backfill_rollups_keeps_buckets_without_readings(
+    db_manager: DatabaseSessionManager,
+) -> None:
+    device = await register_device("12345", "device1")
+    later = T0 + datetime.timedelta(hours=2)
+    for timestamp in (T0, later):
+        await create_datapoint(
+            device_uuid=device.uuid,
+            timestamp=timestamp,
+            sensor="temp",
+            val_float=1.0,
+        )
+
+    # The first reading has expired and the later bucket has drifted
+    async with sessionmanager.session() as session:
+        await session.execute(
+            delete(DataPoint).where(DataPoint.timestamp < later)
+        )
+        await session.execute(
+            update(DataPointRollup)
+            .where(DataPointRollup.bucket_start >= int(later.timestamp()))
+            .values(count=5)
+        )
+        await session.commit()
+
+    assert await backfill_rollups() == 2
+    hourly = await get_aggregates(device.uuid, "temp", 3600)
+    assert [a.count for a in hourly] == [1, 5]
+
+    assert await backfill_rollups(replace=True) == 2
+    hourly = await get_aggregates(device.uuid, "temp", 3600)
+    assert [a.count for a in hourly] == [1, 1]